@@ -0,0 +1,30 @@
+"""Explanation generation for flagged customers"""
+
+from .red_flag_mapper import (
+    RULE_RED_FLAGS,
+    load_red_flags,
+    check_red_flags,
+    red_flag_for,
+    rule_phrases
+)
+
+from .explanation_generator import (
+    MAX_RED_FLAGS,
+    format_scores,
+    red_flag_text,
+    category_text,
+    generate_explanations
+)
+
+__all__ = [
+    'RULE_RED_FLAGS',
+    'load_red_flags',
+    'check_red_flags',
+    'red_flag_for',
+    'rule_phrases',
+    'MAX_RED_FLAGS',
+    'format_scores',
+    'red_flag_text',
+    'category_text',
+    'generate_explanations'
+]
@@ -0,0 +1,219 @@
+"""
+Explanation Generator
+
+Builds model_output_explanations.csv (customer_id, explanation) for the
+flagged customers from:
+
+    - the packed per-customer bitmask of triggered rules
+      (RuleEngine.pack_rules, kept by the rule_score stage)
+    - the category contributions of the rule-based scorer
+    - the red-flag text of Red_Flag_to_Feature_Mapping.md (red_flag_mapper)
+
+No Python work is done per customer: the rule part of the text is rendered
+once per distinct bitmask (np.unique over the flagged rows) and gathered
+back, scores are formatted by lookup into precomputed string tables, and the
+fragments are joined column-wise. Text arrays are object arrays of Python
+strings, so a gather copies pointers and np.add concatenates each row's
+strings in C without padding every row to the longest one.
+"""
+
+from functools import lru_cache
+from pathlib import Path
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from preprocessing.customer_index import align_codes, shared_codes
+from explainability.red_flag_mapper import rule_phrases
+
+# Red flags listed per customer (highest-weighted rules first)
+MAX_RED_FLAGS = 5
+
+# Decimals of the scores as written by score_features / fuse_risk_scores
+CATEGORY_DECIMALS = 2
+SCORE_DECIMALS = 4
+
+
+@lru_cache(maxsize=None)
+def _score_strings(decimals):
+    """'0.00..', ..., '1.00..': the text of every rounded score in [0, 1]"""
+    scale = 10 ** decimals
+    return np.array([f'{i / scale:.{decimals}f}' for i in range(scale + 1)], dtype=object)
+
+
+def _score_positions(values, decimals):
+    """Row of each score in _score_strings(decimals) (NaN as 0)"""
+    scale = 10 ** decimals
+    values = np.nan_to_num(np.asarray(values, dtype=np.float64))
+    return np.clip(np.rint(values * scale), 0, scale).astype(np.intp)
+
+
+def format_scores(values, decimals=SCORE_DECIMALS):
+    """Scores in [0, 1] as fixed-decimal strings, by table lookup (NaN as 0)"""
+    return _score_strings(decimals)[_score_positions(values, decimals)]
+
+
+def _text_table(strings):
+    """String table whose last entry is '' (the empty slot)"""
+    return np.array(list(strings) + [''], dtype=object)
+
+
+def rule_priority(engine):
+    """Rule positions by contribution to the rule-based score, highest first"""
+    contribution = engine.weights @ engine.category_weights
+    return np.argsort(-contribution, kind='stable')
+
+
+def unique_masks(rule_bits):
+    """
+    Distinct rows of a pack_rules() bitmask.
+
+    Returns:
+        first: Row of the first occurrence of each distinct mask
+        inverse: Distinct mask (position in first) of each row
+    """
+    n_rows, n_bytes = rule_bits.shape
+    if n_bytes > 8:
+        _, first, inverse = np.unique(rule_bits, axis=0, return_index=True, return_inverse=True)
+        return first, inverse.reshape(-1)
+    # Up to 64 rules: one uint64 key per row, so the dedup is a 1-D sort
+    padded = np.zeros((n_rows, 8), dtype=np.uint8)
+    padded[:, :n_bytes] = rule_bits
+    _, first, inverse = np.unique(padded.view('<u8').ravel(), return_index=True, return_inverse=True)
+    return first, inverse
+
+
+def red_flag_text(engine, rule_bits, phrases=None, max_red_flags=MAX_RED_FLAGS):
+    """
+    Red-flag text per row of a pack_rules() bitmask ('' where no rule fired).
+
+    Slot k of a row is the phrase of its k-th triggered rule in
+    rule_priority() order (an argmax over the running count of triggered
+    rules), gathered from a phrase table; empty slots gather ''.
+
+    Args:
+        engine: RuleEngine that produced rule_bits
+        rule_bits: uint8 (n x ceil(n_rules / 8)) bitmask
+        phrases: Text per rule (default: red_flag_mapper.rule_phrases(engine))
+        max_red_flags: Phrases listed per row; further rules are counted
+
+    Returns:
+        Array of n strings
+    """
+    phrases = rule_phrases(engine) if phrases is None else phrases
+    rule_bits = np.asarray(rule_bits, dtype=np.uint8)
+    text = np.full(len(rule_bits), '', dtype=object)
+    if len(rule_bits) == 0 or engine.n_rules == 0:
+        return text
+    priority = rule_priority(engine)
+    ordered = [phrases[rule] for rule in priority]
+    first_table = _text_table(ordered)
+    next_table = _text_table('; ' + phrase for phrase in ordered)
+    separator = '; ' if max_red_flags > 0 else ''
+    more_table = np.array([''] + [f'{separator}and {count} more' for count in range(1, engine.n_rules + 1)],
+                          dtype=object)
+
+    fired = np.cumsum(engine.unpack_rules(rule_bits)[:, priority], axis=1)
+    n_fired = fired[:, -1]
+    for slot in range(max_red_flags):
+        position = np.where(n_fired > slot, np.argmax(fired > slot, axis=1), engine.n_rules)
+        phrase = (first_table if slot == 0 else next_table)[position]
+        text = phrase if slot == 0 else np.add(text, phrase)
+    return np.add(text, more_table[np.maximum(n_fired - max_red_flags, 0)])
+
+
+@lru_cache(maxsize=None)
+def _category_tables(categories):
+    """'<label> <score>' per (category, 2-decimal score), plain and ', '-prefixed"""
+    labels = [name.removesuffix('_risk') for name in categories]
+    fragments = [f'{label} {value}' for label in labels for value in _score_strings(CATEGORY_DECIMALS)]
+    return _text_table(fragments), _text_table(', ' + fragment for fragment in fragments)
+
+
+def category_text(category_scores, categories):
+    """
+    'channel 0.21, structuring 0.12' per row: the categories with a
+    non-zero contribution, largest first ('' where none).
+    """
+    first_table, next_table = _category_tables(tuple(categories))
+    n_values = 10 ** CATEGORY_DECIMALS + 1
+    order = np.argsort(-category_scores, axis=1, kind='stable')
+    scores = np.take_along_axis(category_scores, order, axis=1)
+    positions = order * n_values + _score_positions(scores, CATEGORY_DECIMALS)
+    positions[scores <= 0] = len(first_table) - 1
+
+    text = first_table[positions[:, 0]]
+    for column in range(1, positions.shape[1]):
+        text = np.add(text, next_table[positions[:, column]])
+    return text
+
+
+def _inner_rows(left_ids, right_df):
+    """Row positions of an inner join on customer_id, in left order"""
+    index, left_codes, right_codes = shared_codes(left_ids, right_df['customer_id'])
+    return align_codes(left_codes, right_codes, len(index))
+
+
+def generate_explanations(predictions_df, fused_df, rule_scores_df, rule_bits, engine=None, phrases=None,
+                          max_red_flags=MAX_RED_FLAGS):
+    """
+    Explanations for the flagged customers.
+
+    The category scores and red flags of a customer follow from its
+    triggered rules, so that part of the text is rendered once per
+    distinct bitmask; only the score summary is built per customer.
+
+    Args:
+        predictions_df: customer_id, predicted_label, risk_score (generate_predictions)
+        fused_df: customer_id, rule_based_score, anomaly_score (fuse_risk_scores)
+        rule_scores_df: customer_id and the category columns (score_features)
+        rule_bits: pack_rules() bitmask aligned to rule_scores_df rows
+        engine: RuleEngine that produced rule_bits (default: rule_based_scorer.RULE_ENGINE)
+        phrases: Red-flag text per rule (default: red_flag_mapper.rule_phrases(engine))
+        max_red_flags: Red flags listed per customer
+
+    Returns:
+        DataFrame with customer_id and explanation, one row per flagged
+        customer, in predictions_df order
+    """
+    if engine is None:
+        from scripts.rule_based_scorer import RULE_ENGINE
+        engine = RULE_ENGINE
+
+    flagged = np.flatnonzero(predictions_df['predicted_label'].to_numpy() == 1)
+    customer_ids = predictions_df['customer_id'].iloc[flagged]
+    flagged_rows, fused_rows = _inner_rows(customer_ids, fused_df)
+    customer_ids = customer_ids.iloc[flagged_rows]
+    flagged = flagged[flagged_rows]
+    explained_rows, rule_rows = _inner_rows(customer_ids, rule_scores_df)
+    customer_ids = customer_ids.iloc[explained_rows]
+    flagged, fused_rows = flagged[explained_rows], fused_rows[explained_rows]
+
+    add = np.add
+    # Per distinct bitmask: category contributions and red flags
+    rule_bits = np.asarray(rule_bits, dtype=np.uint8)[rule_rows]
+    first, inverse = unique_masks(rule_bits)
+    mask_rows = rule_rows[first]
+    category_scores = np.column_stack([rule_scores_df[name].to_numpy(dtype=np.float64)[mask_rows]
+                                       for name in engine.categories])
+    categories = category_text(category_scores, engine.categories)
+    red_flags = red_flag_text(engine, rule_bits[first], phrases, max_red_flags)
+    rules_text = add(add(add(add(' Category contributions: ', categories), '. Red flags: '), red_flags), '.')
+    mask_text = np.where(red_flags != '', rules_text, ' No red-flag rules triggered; flagged on the anomaly score.')
+
+    # Per customer: the scores
+    risk = format_scores(predictions_df['risk_score'].to_numpy()[flagged])
+    rule = format_scores(fused_df['rule_based_score'].to_numpy()[fused_rows])
+    anomaly = format_scores(fused_df['anomaly_score'].to_numpy()[fused_rows])
+    summary = add(add(add(add(add(add('Flagged with risk score ', risk), ' (rule-based '), rule), ', anomaly '),
+                      anomaly), ').')
+    explanation = add(summary, mask_text[inverse])
+
+    return pd.DataFrame({
+        'customer_id': customer_ids.values,
+        'explanation': explanation,
+    })
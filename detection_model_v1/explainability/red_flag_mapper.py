@@ -0,0 +1,178 @@
+"""
+Red Flag Mapper
+
+Names the red flag behind each rule of rule_based_scorer.py. RULE_RED_FLAGS
+assigns every rule feature one of the red flags of the AML library's
+Red_Flag_to_Feature_Mapping.md explicitly; the document lists some features
+under several red flags (just_below_threshold_count under both Round Figure
+Payments and Structuring) and most rule features under none, so it cannot
+be the lookup itself. Its entries look like:
+
+    ### Red Flag: Wire Transfer Usage
+    - **Data Signal**: ...
+    - **Features**:
+      - `wire_large_count` (COUNT: wire transfers > $10K)
+
+rule_phrases() checks every RULE_RED_FLAGS name against the document's
+headings and raises if a rule's feature has no red flag.
+"""
+
+import logging
+import re
+from pathlib import Path
+import sys
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+PROJECT_ROOT = BASE_DIR.parent
+RED_FLAG_MAPPING_PATH = (
+    PROJECT_ROOT / 'AML_Library_Web' / 'public' / 'AML_Library' / 'Red_Flag_to_Feature_Mapping.md'
+)
+
+# Rule feature -> '### Red Flag:' heading of the mapping document, for every rule
+# in rule_based_scorer.RULE_CATEGORIES
+RULE_RED_FLAGS = {
+    # Structuring & amount patterns
+    'just_below_threshold_count': 'Structuring (Just Below Threshold)',
+    'structuring_pattern_flag': 'Structuring (Just Below Threshold)',
+    'round_amount_pct': 'Round Number Transactions',
+    'round_amount_flag': 'Round Number Transactions',
+    'large_txn_count_10k': 'Large Transaction Outliers',
+    'large_txn_count_50k': 'Large Transaction Outliers',
+    'amount_near_50k_increment_count': 'Round Number Transactions',
+    # High-risk channels
+    'has_wire_transfers': 'Wire Transfer Usage',
+    'wire_large_count': 'Wire Transfer Usage',
+    'wire_volume_total': 'Wire Transfer Usage',
+    'has_western_union': 'Wire Transfer Usage',
+    'abm_cash_txn_count': 'Cash Transactions',
+    'abm_cash_large_count': 'Cash Transactions',
+    'structured_cash_deposits_same_day': 'Cash Transactions',
+    'multi_channel_flag': 'Channel Diversification',
+    # Geographic risk
+    'cross_border_flag': 'Cross-Border Patterns',
+    'cross_border_txn_pct': 'Cross-Border Patterns',
+    'is_country_offshore_structure_jurisdiction': 'High-Risk Country Transactions',
+    'is_country_tbml_high_risk': 'High-Risk Country Transactions',
+    'is_country_shell_company_jurisdiction': 'High-Risk Country Transactions',
+    'high_geographic_dispersion': 'Cross-Border Patterns',
+    'customer_country_offshore_structure_jurisdiction': 'General Geographic Risk',
+    # Behavioral anomalies
+    'lifestyle_mismatch': 'Living Beyond Means',
+    'severe_lifestyle_mismatch': 'Living Beyond Means',
+    'flow_through_velocity_hours': 'Flow-Through Activity',
+    'account_turnover_rate': 'Flow-Through Activity',
+    'sudden_inflow_outflow_pattern': 'Sudden Inflow/Outflow Patterns',
+    'volume_eft_sudden_increase': 'Sudden Inflow/Outflow Patterns',
+    'rapid_fire_flag': 'Rapid Transaction Velocity',
+    'single_txn_exceeds_revenue': 'Living Beyond Means',
+    # Profile risk
+    'is_msb_business': 'MSB-Like Activity',
+    'is_shell_company': 'Unusual Business Activity',
+    'is_cash_intensive': 'High-Risk Industry',
+    'new_account_flag': 'General Transaction Anomalies',
+    'very_new_business_flag': 'Unusual Business Activity',
+    'high_profile_risk': 'General Transaction Anomalies',
+    'has_missing_income': 'Unusual Business Activity',
+    'has_missing_sales': 'Unusual Business Activity',
+}
+
+_RED_FLAG_LINE = re.compile(r'^###\s+Red Flag:\s*(?P<title>.+?)\s*$')
+_DATA_SIGNAL_LINE = re.compile(r'^-\s+\*\*Data Signal\*\*:\s*(?P<signal>.+?)\s*$')
+_FEATURE_LINE = re.compile(r'^\s+-\s+`(?P<feature>[^`]+)`\s*(?:\((?P<description>.*)\))?\s*$')
+
+
+def load_red_flags(path=None):
+    """
+    Parse the red-flag mapping document.
+
+    Args:
+        path: Red_Flag_to_Feature_Mapping.md (default: RED_FLAG_MAPPING_PATH)
+
+    Returns:
+        Dict red flag -> {'data_signal', 'features': [(feature, description)]}
+        in document order. Empty (with a warning) if the document does not
+        exist.
+    """
+    path = Path(path) if path else RED_FLAG_MAPPING_PATH
+    if not path.exists():
+        logger.warning(f"Red flag mapping not found: {path}; RULE_RED_FLAGS cannot be checked against it")
+        return {}
+
+    red_flags = {}
+    entry = None
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            match = _RED_FLAG_LINE.match(line)
+            if match:
+                entry = red_flags.setdefault(match['title'], {'data_signal': '', 'features': []})
+                continue
+            if line.startswith('#'):
+                entry = None
+                continue
+            if entry is None:
+                continue
+            match = _DATA_SIGNAL_LINE.match(line)
+            if match:
+                entry['data_signal'] = match['signal']
+                continue
+            match = _FEATURE_LINE.match(line)
+            if match:
+                entry['features'].append((match['feature'], match['description'] or ''))
+    return red_flags
+
+
+def check_red_flags(red_flags=None):
+    """
+    Check that every RULE_RED_FLAGS name is a red flag of the mapping
+    document (red_flags: load_red_flags() result; skipped if it is empty,
+    i.e. the document is missing).
+
+    Raises:
+        ValueError: If a name is not a heading of the document
+    """
+    red_flags = load_red_flags() if red_flags is None else red_flags
+    if not red_flags:
+        return
+    unknown = sorted(set(RULE_RED_FLAGS.values()) - set(red_flags))
+    if unknown:
+        raise ValueError(f"RULE_RED_FLAGS names not in {RED_FLAG_MAPPING_PATH.name}: {unknown}")
+
+
+def red_flag_for(feature):
+    """Red flag of a rule feature (None if RULE_RED_FLAGS has none)"""
+    return RULE_RED_FLAGS.get(feature)
+
+
+def rule_condition(feature, threshold, less_than=False):
+    """Condition text of a rule, e.g. 'wire_volume_total >= 5,000,000'"""
+    return f"{feature} {'<' if less_than else '>='} {format(float(threshold), ',.10g')}"
+
+
+def rule_phrases(engine, red_flags=None):
+    """
+    Red-flag phrase per rule of a RuleEngine, in rule order:
+    '<red flag>: <condition>'.
+
+    Args:
+        engine: RuleEngine
+        red_flags: load_red_flags() result to check RULE_RED_FLAGS against
+            (default: read the document)
+
+    Raises:
+        ValueError: If a rule's feature has no red flag, or a red flag is
+            not in the mapping document
+    """
+    check_red_flags(red_flags)
+    unmapped = [feature for feature in engine.features if feature not in RULE_RED_FLAGS]
+    if unmapped:
+        raise ValueError(f"Rule features without a red flag: {unmapped}. Add them to RULE_RED_FLAGS")
+    return [
+        f"{RULE_RED_FLAGS[feature]}: {rule_condition(feature, threshold, less_than)}"
+        for feature, threshold, less_than in zip(engine.features, engine.thresholds, engine.less_than)
+    ]
@@ -0,0 +1,45 @@
+"""Feature engineering from the channel transaction tables"""
+
+from .transactions import (
+    TransactionTable,
+    CHANNEL_FILES,
+    register_channel,
+    read_channel_table,
+    load_transactions
+)
+
+from .transaction_features import (
+    TRANSACTION_FEATURES,
+    customer_aggregates,
+    aggregate_features,
+    build_transaction_features,
+    merge_transaction_features
+)
+
+from .aggregate_store import AggregateStore
+
+from .transaction_store import TransactionStore
+
+from .windows import (
+    VELOCITY_FEATURES,
+    CustomerTimeline,
+    build_velocity_features
+)
+
+__all__ = [
+    'TransactionTable',
+    'CHANNEL_FILES',
+    'register_channel',
+    'read_channel_table',
+    'load_transactions',
+    'TRANSACTION_FEATURES',
+    'customer_aggregates',
+    'aggregate_features',
+    'build_transaction_features',
+    'merge_transaction_features',
+    'AggregateStore',
+    'TransactionStore',
+    'VELOCITY_FEATURES',
+    'CustomerTimeline',
+    'build_velocity_features'
+]
@@ -0,0 +1,363 @@
+"""
+Per-Customer Aggregate Store
+
+Persistent transaction aggregate state (transaction_features.customer_aggregates)
+for every customer seen so far, so a daily refresh only folds in the new
+transactions instead of recomputing features over the whole history:
+
+    store/
+        CURRENT                live version (utils.versioned_dir)
+        vNNNNNN/
+            manifest.json      format version, customer count, state columns,
+                               transactions applied, latest timestamp,
+                               applied source tables (by sha256)
+            customer_ids.npy   customer ID per row (unicode, no pickle)
+            state_<name>.npy   one array per state column
+
+apply_transactions(batch) aggregates the batch over the customers it
+touches (a compact code space, so the cost follows the batch size),
+merges that into their state rows and returns their updated feature rows.
+Every transaction feature is exact after the merge except amount_median,
+which needs the full history and is left to the periodic full build.
+
+State merges are not idempotent, so main() records the sha256 of every
+channel table it applies and skips tables already in the store, and
+save() publishes a complete new version instead of rewriting the live one.
+"""
+
+import json
+import numpy as np
+import pandas as pd
+from pathlib import Path
+import sys
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from preprocessing.customer_index import CustomerIndex, align_codes, shared_codes
+from feature_engineering.transactions import TransactionTable
+from utils.versioned_dir import current_version, publish_version
+from feature_engineering.transaction_features import (
+    TIMESTAMP_NONE, TRANSACTION_FEATURES, aggregate_features, customer_aggregates, replace_columns
+)
+
+STORE_FORMAT = 'aml-customer-aggregate-store'
+STORE_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+CUSTOMER_IDS_FILE = 'customer_ids.npy'
+
+# State column -> how two batches' values combine ('sum' unless listed)
+AGGREGATE_MERGE = {
+    'amount_m2': 'm2',
+    'amount_min': 'min',
+    'amount_max': 'max',
+    'wire_max': 'max',
+    'channel_bits': 'or',
+    'first_seen': 'first',
+    'last_seen': 'last',
+}
+
+# Features a store keeps exact (all but the median)
+INCREMENTAL_FEATURES = [name for name in TRANSACTION_FEATURES if name != 'amount_median']
+
+
+def _merge(kind, old, new, old_counts=None, old_sums=None, new_counts=None, new_sums=None):
+    """Combine the state of two disjoint transaction sets"""
+    if kind == 'sum':
+        return old + new
+    if kind == 'min':
+        return np.fmin(old, new)
+    if kind == 'max':
+        return np.fmax(old, new)
+    if kind == 'or':
+        return old | new
+    if kind == 'first':
+        return np.where(old == TIMESTAMP_NONE, new, np.minimum(old, np.where(new == TIMESTAMP_NONE, old, new)))
+    if kind == 'last':
+        return np.maximum(old, new)
+    if kind == 'm2':
+        # Chan et al.: M2 = M2_a + M2_b + delta^2 * n_a * n_b / n
+        total = old_counts + new_counts
+        old_mean = np.divide(old_sums, old_counts, out=np.zeros(len(old)), where=old_counts > 0)
+        new_mean = np.divide(new_sums, new_counts, out=np.zeros(len(new)), where=new_counts > 0)
+        delta = new_mean - old_mean
+        correction = np.divide(delta * delta * old_counts * new_counts, total,
+                               out=np.zeros(len(old)), where=total > 0)
+        return old + new + correction
+    raise ValueError(f"Unknown aggregate merge '{kind}'")
+
+
+class AggregateStore:
+    """
+    Growable per-customer aggregate state.
+
+    Args:
+        customer_index: CustomerIndex of the stored customers
+        state: Dict of state arrays (as customer_aggregates), one row per customer
+        n_transactions: Transactions folded in so far
+        latest_timestamp: Latest transaction timestamp folded in (epoch seconds)
+        sources: Dict of sha256 -> {'name', 'channel', 'bytes'} of the channel
+            tables folded in
+    """
+
+    def __init__(self, customer_index=None, state=None, n_transactions=0, latest_timestamp=TIMESTAMP_NONE,
+                 sources=None):
+        self.customer_index = customer_index if customer_index is not None else CustomerIndex()
+        self.n_transactions = int(n_transactions)
+        self.latest_timestamp = int(latest_timestamp)
+        self.sources = dict(sources) if sources is not None else {}
+        self._state = dict(state) if state is not None else None
+        self._size = len(self.customer_index)
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def state(self):
+        """State arrays trimmed to the stored customers"""
+        if self._state is None:
+            return {}
+        return {name: values[:self._size] for name, values in self._state.items()}
+
+    @classmethod
+    def from_transactions(cls, table):
+        """Store holding the aggregates of a full transaction history"""
+        store = cls()
+        store.apply_transactions(table)
+        return store
+
+    def _reserve(self, size):
+        """Grow the state arrays (doubling) to hold size customers"""
+        capacity = len(next(iter(self._state.values())))
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity)
+        for name, values in self._state.items():
+            grown = np.empty(capacity, dtype=values.dtype)
+            grown[:self._size] = values[:self._size]
+            self._state[name] = grown
+
+    def _init_rows(self, rows, template):
+        """Set rows to a template state (dict of scalars)"""
+        for name, values in self._state.items():
+            values[rows] = template[name]
+
+    def apply_transactions(self, batch, master_df=None, sources=None):
+        """
+        Fold a batch of new transactions into the store.
+
+        Args:
+            batch: TransactionTable of transactions not applied before
+            master_df: master_features frame; when given, its rows for the
+                touched customers are returned with the updated features
+            sources: Dict of sha256 -> source info of the tables the batch
+                was read from, recorded in the store
+
+        Raises:
+            ValueError: If a source was already applied
+
+        Returns:
+            DataFrame of the touched customers: customer_id and
+            INCREMENTAL_FEATURES (or their master_features rows)
+        """
+        sources = sources or {}
+        applied = [info.get('name', digest) for digest, info in sources.items() if digest in self.sources]
+        if applied:
+            raise ValueError(f"Transactions already applied to the store: {applied}")
+
+        index, batch_codes = self.customer_index.extend(batch.customer_index.ids)
+        codes = batch_codes[batch.customer]
+        touched, local = np.unique(codes, return_inverse=True)
+        batch_state, _ = customer_aggregates(batch, local.astype(np.int32), len(touched))
+
+        if self._state is None:
+            self._state = {name: np.empty(len(index), dtype=values.dtype) for name, values in batch_state.items()}
+        new_size = len(index)
+        if new_size > self._size:
+            self._reserve(new_size)
+            self._init_rows(slice(self._size, new_size), _empty_state())
+        self.customer_index = index
+        self._size = new_size
+
+        old = {name: values[touched] for name, values in self._state.items()}
+        for name, new in batch_state.items():
+            kind = AGGREGATE_MERGE.get(name, 'sum')
+            self._state[name][touched] = _merge(
+                kind, old[name], new,
+                old['txn_count'], old['amount_sum'], batch_state['txn_count'], batch_state['amount_sum']
+            )
+
+        self.n_transactions += len(batch)
+        if len(batch):
+            self.latest_timestamp = max(self.latest_timestamp, int(batch.timestamp.max()))
+        self.sources.update(sources)
+
+        changed = self.features(touched)
+        if master_df is None:
+            return changed
+        return _master_rows(master_df, changed)
+
+    def features(self, rows=None):
+        """
+        Feature rows from the stored state.
+
+        Args:
+            rows: Customer codes to return (default: every customer)
+
+        Returns:
+            DataFrame with customer_id (interned) and INCREMENTAL_FEATURES
+        """
+        rows = np.arange(self._size) if rows is None else np.asarray(rows)
+        state = {name: values[rows] for name, values in self._state.items()} if self._state else None
+        if state is None:
+            return pd.DataFrame(columns=['customer_id'] + INCREMENTAL_FEATURES)
+        features = aggregate_features(state)
+        features_df = pd.DataFrame({name: features[name] for name in INCREMENTAL_FEATURES})
+        features_df.insert(0, 'customer_id', self.customer_index.categorical(rows))
+        return features_df
+
+    def save(self, store_dir):
+        """Write the store as a new version of store_dir (see module docstring)"""
+        manifest = {
+            'format': STORE_FORMAT,
+            'version': STORE_VERSION,
+            'n_customers': len(self),
+            'state': sorted(self.state),
+            'n_transactions': self.n_transactions,
+            'latest_timestamp': self.latest_timestamp,
+            'sources': self.sources,
+        }
+        with publish_version(store_dir) as version_dir:
+            ids = self.customer_index.ids.astype(str)
+            np.save(version_dir / CUSTOMER_IDS_FILE, ids, allow_pickle=False)
+            for name, values in self.state.items():
+                np.save(version_dir / f'state_{name}.npy', values, allow_pickle=False)
+            with open(version_dir / MANIFEST_FILE, 'w') as f:
+                json.dump(manifest, f, indent=2)
+        return manifest
+
+    @classmethod
+    def exists(cls, store_dir):
+        """Whether store_dir holds a saved store"""
+        return (current_version(store_dir) / MANIFEST_FILE).exists()
+
+    @classmethod
+    def load(cls, store_dir):
+        """Read the live version of a store written by save()"""
+        store_dir = current_version(store_dir)
+        with open(store_dir / MANIFEST_FILE) as f:
+            manifest = json.load(f)
+        if manifest.get('format') != STORE_FORMAT:
+            raise ValueError(f"{store_dir} is not an aggregate store (format {manifest.get('format')!r})")
+        if manifest.get('version') != STORE_VERSION:
+            raise ValueError(f"Unsupported aggregate store version {manifest.get('version')}")
+
+        ids = np.load(store_dir / CUSTOMER_IDS_FILE, allow_pickle=False).astype(object)
+        state = {name: np.load(store_dir / f'state_{name}.npy', allow_pickle=False) for name in manifest['state']}
+        return cls(CustomerIndex(ids), state or None, manifest['n_transactions'], manifest['latest_timestamp'],
+                   manifest.get('sources'))
+
+
+def _empty_state():
+    """State of a customer without transactions, as a dict of scalars"""
+    state, _ = customer_aggregates(TransactionTable.empty(), n_customers=1)
+    return {name: values[0] for name, values in state.items()}
+
+
+def _master_rows(master_df, changed):
+    """master_df rows of the changed customers, with the changed columns replaced"""
+    index, master_codes, changed_codes = shared_codes(master_df['customer_id'], changed['customer_id'])
+    master_rows, changed_rows = align_codes(master_codes, changed_codes, len(index))
+    rows = master_df.iloc[master_rows]
+    columns = {}
+    for name in changed.columns.drop('customer_id'):
+        values = changed[name].to_numpy()[changed_rows]
+        columns[name] = values.astype(master_df[name].dtype, copy=False) if name in master_df else values
+    return replace_columns(rows, columns)
+
+
+def main(batch_dir, store_dir=None, output_path=None, master_path=None):
+    """
+    Fold a day's channel tables into the aggregate store (created from
+    them if it does not exist yet) and write the changed feature rows.
+    Tables the store has already applied (same sha256) are skipped, so
+    re-running a batch leaves the store unchanged.
+
+    Args:
+        batch_dir: Directory with only the new clean_txn_<channel>.csv
+            tables (not the full transaction history)
+        store_dir: Aggregate store directory
+        output_path: Where to write the changed rows (CSV)
+        master_path: master_features; when given, the changed master rows
+            are written instead of the bare features
+
+    Returns:
+        The changed rows, or None if every table was already applied
+    """
+    from feature_engineering.transactions import CHANNEL_FILES, file_fingerprint, load_transactions
+
+    BASE_DIR = Path(__file__).resolve().parent.parent
+
+    if not batch_dir:
+        raise ValueError("A batch directory with the new channel tables is required")
+    batch_dir = Path(batch_dir)
+    store_dir = Path(store_dir) if store_dir else (BASE_DIR / 'data' / 'aggregate_store')
+    output_path = Path(output_path) if output_path else (
+        BASE_DIR / 'data' / 'intermediate' / 'changed_features.csv'
+    )
+
+    if AggregateStore.exists(store_dir):
+        store = AggregateStore.load(store_dir)
+        print(f"Loaded store: {len(store):,} customers, {store.n_transactions:,} transactions")
+    else:
+        store = AggregateStore()
+        print(f"Creating store at {store_dir}")
+
+    found = [(channel, batch_dir / filename) for channel, filename in CHANNEL_FILES.items()
+             if (batch_dir / filename).exists()]
+    if not found:
+        raise FileNotFoundError(f"No channel transaction tables in {batch_dir}")
+    sources = {}
+    for channel, path in found:
+        digest = file_fingerprint(path)
+        if digest in store.sources or digest in sources:
+            print(f"  {channel}: {path.name} already applied, skipping")
+            continue
+        sources[digest] = {'name': path.name, 'channel': channel, 'bytes': path.stat().st_size}
+    if not sources:
+        print("No new transaction tables; store unchanged")
+        return None
+
+    channels = [info['channel'] for info in sources.values()]
+    print(f"Loading {', '.join(channels)} transactions from {batch_dir}...")
+    batch = load_transactions(batch_dir, channels=channels)
+    print(f"  Loaded {len(batch):,} transactions for {batch.n_customers:,} customers")
+
+    master_df = None
+    if master_path:
+        from preprocessing.feature_loader import load_master_features
+        master_df = load_master_features(master_path)
+
+    changed = store.apply_transactions(batch, master_df=master_df, sources=sources)
+    print(f"  Updated {len(changed):,} customers")
+
+    store.save(store_dir)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    changed.to_csv(output_path, index=False)
+    print(f"Saved changed rows to: {output_path}")
+
+    return changed
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Apply new transactions to the per-customer aggregate store')
+    parser.add_argument('--batch-dir', type=str, required=True,
+                        help='Directory with only the new clean_txn_<channel>.csv tables')
+    parser.add_argument('--store', type=str, default=None, help='Aggregate store directory')
+    parser.add_argument('--output', type=str, default=None, help='Path to write the changed rows')
+    parser.add_argument('--master', type=str, default=None, help='master_features to emit changed rows of')
+    args = parser.parse_args()
+
+    main(args.batch_dir, args.store, args.output, args.master)
@@ -0,0 +1,104 @@
+"""
+Group-Reduce Kernels
+
+Per-customer reductions over transaction arrays keyed by int32 customer
+codes. Counts, sums and moments are np.bincount passes (linear in the
+number of transactions); order statistics (min, max, median) come from
+one sort by (customer, value) shared through SortedGroups, after which
+every statistic is a gather at the group offsets.
+"""
+
+import numpy as np
+
+
+def group_count(codes, n_groups, mask=None):
+    """Rows per group (optionally only rows where mask is True), int64"""
+    if mask is not None:
+        codes = codes[mask]
+    return np.bincount(codes, minlength=n_groups).astype(np.int64)
+
+
+def group_sum(codes, values, n_groups, mask=None):
+    """Sum of values per group (0 for empty groups)"""
+    if mask is not None:
+        codes, values = codes[mask], values[mask]
+    return np.bincount(codes, weights=values, minlength=n_groups)
+
+
+def group_extreme(codes, values, n_groups, reduce, empty):
+    """
+    Per-group min (reduce=np.minimum) or max (np.maximum) of integer
+    values without sorting; empty groups get the value empty.
+    """
+    info = np.iinfo(values.dtype)
+    out = np.full(n_groups, info.max if reduce is np.minimum else info.min, dtype=values.dtype)
+    reduce.at(out, codes, values)
+    out[np.bincount(codes, minlength=n_groups) == 0] = empty
+    return out
+
+
+def safe_divide(numerator, denominator, fill=np.nan):
+    """numerator / denominator, fill where the denominator is 0"""
+    numerator = np.asarray(numerator, dtype=np.float64)
+    return np.divide(numerator, denominator, out=np.full(len(numerator), fill, dtype=np.float64),
+                     where=np.asarray(denominator) != 0)
+
+
+def group_m2(codes, values, mean):
+    """
+    Sum of squared deviations from the group mean per group (the M2 of
+    Welford/Chan), so variances of disjoint batches can be merged exactly.
+    Computed around the mean rather than as sum(x^2) - n*mean^2 for
+    numerical stability.
+    """
+    deviations = values - mean[codes]
+    return np.bincount(codes, weights=deviations * deviations, minlength=len(mean))
+
+
+class SortedGroups:
+    """
+    Values sorted by (group, value), with group offsets.
+
+    Args:
+        codes: Group code per row
+        values: Value per row
+        n_groups: Number of groups (codes are 0..n_groups-1)
+    """
+
+    def __init__(self, codes, values, n_groups):
+        self.order = np.lexsort((values, codes))
+        self.values = values[self.order]
+        self.codes = codes[self.order]
+        self.counts = np.bincount(codes, minlength=n_groups).astype(np.int64)
+        self.offsets = np.zeros(n_groups + 1, dtype=np.int64)
+        np.cumsum(self.counts, out=self.offsets[1:])
+        self.nonempty = self.counts > 0
+
+    def _gather(self, positions):
+        out = np.full(len(self.counts), np.nan)
+        out[self.nonempty] = self.values[positions[self.nonempty]]
+        return out
+
+    def min(self):
+        return self._gather(self.offsets[:-1])
+
+    def max(self):
+        return self._gather(self.offsets[1:] - 1)
+
+    def masked_max(self, mask):
+        """Max per group over the rows where mask is True (NaN if none)"""
+        selected = np.flatnonzero(mask[self.order])
+        groups = self.codes[selected]
+        # Rows are sorted by value within a group: the last selected one is the max
+        last = np.ones(len(selected), dtype=bool)
+        last[:-1] = groups[1:] != groups[:-1]
+        out = np.full(len(self.counts), np.nan)
+        out[groups[last]] = self.values[selected[last]]
+        return out
+
+    def median(self):
+        """Median per group (mean of the two middle values for even counts)"""
+        starts = self.offsets[:-1]
+        low = self._gather(starts + (self.counts - 1) // 2)
+        high = self._gather(starts + self.counts // 2)
+        return (low + high) / 2.0
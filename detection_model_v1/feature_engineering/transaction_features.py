@@ -0,0 +1,377 @@
+"""
+Transaction Features
+
+Computes the per-customer transaction features of master_features (the
+ones rule_based_scorer.py and the anomaly models read) from the channel
+transaction tables, with vectorized group-reduce kernels instead of
+per-customer pandas groupbys:
+
+1. Aggregate state (customer_aggregates): counts, sums, M2, threshold
+   bucket counts and first/last-seen timestamps, one np.bincount pass
+   each over int32 customer codes; min/max/median from one lexsort by
+   (customer, amount), then gathers at the group offsets
+2. Features (aggregate_features): elementwise arithmetic on the
+   per-customer state arrays
+
+so the cost grows linearly with the number of transactions (plus the one
+sort). The state of disjoint batches merges exactly (see
+aggregate_store.py), so features can be refreshed from new transactions
+only. Amounts are CAD dollars except wire_volume_total, which is in
+cents as the rule thresholds expect; percentages are fractions (0-1).
+"""
+
+import numpy as np
+import pandas as pd
+from pathlib import Path
+import sys
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from preprocessing.customer_index import CustomerIndex, align_codes, shared_codes
+from feature_engineering.kernels import (
+    SortedGroups, group_count, group_extreme, group_m2, group_sum, safe_divide
+)
+from feature_engineering.transactions import load_transactions
+from feature_engineering.windows import build_velocity_features
+
+# Structuring: just below the $10K reporting threshold
+JUST_BELOW_THRESHOLD = (9_000.0, 10_000.0)
+STRUCTURING_MIN_COUNT = 2
+
+LARGE_TXN_THRESHOLDS = {'10k': 10_000.0, '50k': 50_000.0, '100k': 100_000.0}
+WIRE_LARGE_THRESHOLD = 10_000.0
+ABM_CASH_LARGE_THRESHOLD = 5_000.0
+
+# Round amounts are whole multiples of ROUND_AMOUNT_UNIT dollars
+ROUND_AMOUNT_UNIT = 1_000
+
+# Amounts of at least $50K within NEAR_50K_TOLERANCE of a $50K multiple
+NEAR_50K_UNIT = 50_000.0
+NEAR_50K_TOLERANCE = 500.0
+
+MULTI_CHANNEL_MIN = 3
+HIGH_FREQUENCY_MIN = 500
+
+# first_seen/last_seen of customers without transactions
+TIMESTAMP_NONE = np.iinfo(np.int64).min
+
+# Feature -> fill for customers without transactions (counts, sums and
+# flags are 0; statistics and ratios are undefined)
+TRANSACTION_FEATURES = {
+    'txn_count_total': 0,
+    'volume_debit_total': 0.0,
+    'volume_credit_total': 0.0,
+    'account_turnover_rate': np.nan,
+    'amount_mean': np.nan,
+    'amount_stddev': np.nan,
+    'amount_min': np.nan,
+    'amount_max': np.nan,
+    'amount_median': np.nan,
+    'amount_max_ratio_mean': np.nan,
+    'amount_stddev_ratio_mean': np.nan,
+    'just_below_threshold_count': 0,
+    'structuring_pattern_flag': 0,
+    'round_amount_count': 0,
+    'round_amount_pct': 0.0,
+    'round_amount_flag': 0,
+    'large_txn_count_10k': 0,
+    'large_txn_count_50k': 0,
+    'large_txn_count_100k': 0,
+    'amount_near_50k_increment_count': 0,
+    'high_frequency_customer_flag': 0,
+    'channels_used_count': 0,
+    'multi_channel_flag': 0,
+    'wire_txn_count': 0,
+    'wire_volume_total': 0,
+    'wire_volume_avg': np.nan,
+    'wire_volume_max': np.nan,
+    'wire_large_count': 0,
+    'has_wire_transfers': 0,
+    'abm_cash_txn_count': 0,
+    'abm_cash_volume': 0.0,
+    'abm_cash_volume_avg': np.nan,
+    'abm_cash_pct': 0.0,
+    'abm_cash_large_count': 0,
+    'western_union_txn_count': 0,
+    'western_union_volume_total': 0.0,
+    'has_western_union': 0,
+    'eft_txn_count': 0,
+    'eft_volume_total': 0.0,
+    'cross_border_txn_count': 0,
+    'cross_border_txn_pct': 0.0,
+    'cross_border_flag': 0,
+}
+
+
+def _flag(mask):
+    return mask.astype(np.uint8)
+
+
+def customer_aggregates(table, codes=None, n_customers=None):
+    """
+    Per-customer aggregate state of a table's transactions (AGGREGATES).
+
+    Args:
+        table: TransactionTable
+        codes: Group code per transaction (default: table.customer)
+        n_customers: Number of groups (default: table.n_customers)
+
+    Returns:
+        state: Dict of AGGREGATES arrays, one entry per group
+        groups: SortedGroups of the amounts (for order statistics)
+    """
+    codes = table.customer if codes is None else codes
+    n = table.n_customers if n_customers is None else n_customers
+    amount = np.abs(table.amount).astype(np.float64, copy=False)
+    cents = np.rint(amount * 100).astype(np.int64)
+
+    def channel_mask(name):
+        if name not in table.channels:
+            return np.zeros(len(table), dtype=bool)
+        return table.channel == table.channels.index(name)
+
+    counts = group_count(codes, n)
+    amount_sum = group_sum(codes, amount, n)
+    groups = SortedGroups(codes, amount, n)
+    low, high = JUST_BELOW_THRESHOLD
+    distance = np.abs(amount - np.round(amount / NEAR_50K_UNIT) * NEAR_50K_UNIT)
+    wire = channel_mask('wire')
+    abm = channel_mask('abm')
+    abm_cash = abm & table.cash
+    western_union = channel_mask('western_union')
+    eft = channel_mask('eft')
+
+    # Channels used, as a bitmask over channel codes
+    n_channels = len(table.channels)
+    pairs = np.bincount(codes.astype(np.int64) * n_channels + table.channel, minlength=n * n_channels)
+    channel_bits = (pairs.reshape(n, n_channels) > 0) @ (np.int64(1) << np.arange(n_channels, dtype=np.int64))
+
+    state = {
+        'txn_count': counts,
+        'amount_sum': amount_sum,
+        'amount_m2': group_m2(codes, amount, safe_divide(amount_sum, counts, fill=0.0)),
+        'amount_min': groups.min(),
+        'amount_max': groups.max(),
+        'debit_sum': group_sum(codes, amount, n, table.is_debit),
+        'credit_sum': group_sum(codes, amount, n, ~table.is_debit),
+        'just_below_count': group_count(codes, n, (amount >= low) & (amount < high)),
+        'round_count': group_count(codes, n, (cents > 0) & (cents % (ROUND_AMOUNT_UNIT * 100) == 0)),
+        'near_50k_count': group_count(
+            codes, n, (amount >= NEAR_50K_UNIT - NEAR_50K_TOLERANCE) & (distance <= NEAR_50K_TOLERANCE)),
+        'channel_bits': channel_bits,
+        'wire_count': group_count(codes, n, wire),
+        'wire_sum': group_sum(codes, amount, n, wire),
+        'wire_cents': np.rint(group_sum(codes, cents.astype(np.float64), n, wire)).astype(np.int64),
+        'wire_max': groups.masked_max(wire),
+        'wire_large_count': group_count(codes, n, wire & (amount > WIRE_LARGE_THRESHOLD)),
+        'abm_count': group_count(codes, n, abm),
+        'abm_cash_count': group_count(codes, n, abm_cash),
+        'abm_cash_sum': group_sum(codes, amount, n, abm_cash),
+        'abm_cash_large_count': group_count(codes, n, abm_cash & (amount > ABM_CASH_LARGE_THRESHOLD)),
+        'western_union_count': group_count(codes, n, western_union),
+        'western_union_sum': group_sum(codes, amount, n, western_union),
+        'eft_count': group_count(codes, n, eft),
+        'eft_sum': group_sum(codes, amount, n, eft),
+        'cross_border_count': group_count(codes, n, table.cross_border),
+        'first_seen': group_extreme(codes, table.timestamp, n, np.minimum, TIMESTAMP_NONE),
+        'last_seen': group_extreme(codes, table.timestamp, n, np.maximum, TIMESTAMP_NONE),
+    }
+    for suffix, threshold in LARGE_TXN_THRESHOLDS.items():
+        state[f'large_count_{suffix}'] = group_count(codes, n, amount > threshold)
+    return state, groups
+
+
+def aggregate_features(state):
+    """
+    Transaction features from aggregate state (every TRANSACTION_FEATURES
+    column except amount_median, which needs the transactions themselves).
+
+    Returns:
+        Dict of feature arrays
+    """
+    counts = state['txn_count']
+    mean = safe_divide(state['amount_sum'], counts)
+    std = np.sqrt(safe_divide(state['amount_m2'], counts - 1))
+    channels_used = np.zeros(len(counts), dtype=np.int64)
+    bits = state['channel_bits'].copy()
+    while bits.any():
+        channels_used += bits & 1
+        bits >>= 1
+
+    features = {
+        'txn_count_total': counts,
+        'volume_debit_total': state['debit_sum'],
+        'volume_credit_total': state['credit_sum'],
+        'account_turnover_rate': safe_divide(state['debit_sum'], state['credit_sum']),
+        'amount_mean': mean,
+        'amount_stddev': std,
+        'amount_min': state['amount_min'],
+        'amount_max': state['amount_max'],
+        'amount_max_ratio_mean': safe_divide(state['amount_max'], mean),
+        'amount_stddev_ratio_mean': safe_divide(std, mean),
+        'just_below_threshold_count': state['just_below_count'],
+        'structuring_pattern_flag': _flag(state['just_below_count'] >= STRUCTURING_MIN_COUNT),
+        'round_amount_count': state['round_count'],
+        'round_amount_pct': safe_divide(state['round_count'], counts, fill=0.0),
+        'round_amount_flag': _flag(state['round_count'] > 0),
+        'amount_near_50k_increment_count': state['near_50k_count'],
+        'high_frequency_customer_flag': _flag(counts > HIGH_FREQUENCY_MIN),
+        'channels_used_count': channels_used,
+        'multi_channel_flag': _flag(channels_used >= MULTI_CHANNEL_MIN),
+        'wire_txn_count': state['wire_count'],
+        'wire_volume_total': state['wire_cents'],
+        'wire_volume_avg': safe_divide(state['wire_sum'], state['wire_count']),
+        'wire_volume_max': state['wire_max'],
+        'wire_large_count': state['wire_large_count'],
+        'has_wire_transfers': _flag(state['wire_count'] > 0),
+        'abm_cash_txn_count': state['abm_cash_count'],
+        'abm_cash_volume': state['abm_cash_sum'],
+        'abm_cash_volume_avg': safe_divide(state['abm_cash_sum'], state['abm_cash_count']),
+        'abm_cash_pct': safe_divide(state['abm_cash_count'], state['abm_count'], fill=0.0),
+        'abm_cash_large_count': state['abm_cash_large_count'],
+        'western_union_txn_count': state['western_union_count'],
+        'western_union_volume_total': state['western_union_sum'],
+        'has_western_union': _flag(state['western_union_count'] > 0),
+        'eft_txn_count': state['eft_count'],
+        'eft_volume_total': state['eft_sum'],
+        'cross_border_txn_count': state['cross_border_count'],
+        'cross_border_txn_pct': safe_divide(state['cross_border_count'], counts, fill=0.0),
+        'cross_border_flag': _flag(state['cross_border_count'] > 0),
+    }
+    for suffix in LARGE_TXN_THRESHOLDS:
+        features[f'large_txn_count_{suffix}'] = state[f'large_count_{suffix}']
+    return features
+
+
+def build_transaction_features(table, customer_ids=None):
+    """
+    Per-customer transaction features.
+
+    Args:
+        table: TransactionTable
+        customer_ids: Customers to return, in order (e.g. the master_features
+            customer_id column); customers without transactions get the
+            TRANSACTION_FEATURES fill values. Default: every customer in
+            the table, in code order.
+
+    Returns:
+        DataFrame with customer_id (interned) and TRANSACTION_FEATURES columns
+    """
+    if customer_ids is not None:
+        index = CustomerIndex.of(pd.Series(customer_ids))
+        table = table.with_index(index)
+    state, groups = customer_aggregates(table)
+    features = aggregate_features(state)
+    features['amount_median'] = groups.median()
+
+    rows = np.arange(table.n_customers) if customer_ids is None else index.encode(customer_ids)
+    features_df = pd.DataFrame({name: features[name][rows] for name in TRANSACTION_FEATURES})
+    features_df.insert(0, 'customer_id', table.customer_index.categorical(rows))
+    return features_df
+
+
+def replace_columns(df, columns):
+    """
+    df with the given columns (dict of name -> row-aligned array) replacing
+    its own or appended after them. The result is built in one DataFrame
+    construction, which consolidates it into one block per dtype; assigning
+    ~50 columns to a wide frame fragments it.
+    """
+    order = list(df.columns) + [name for name in columns if name not in df]
+    return pd.DataFrame({name: columns[name] if name in columns else df[name].array for name in order},
+                        index=df.index)
+
+
+def merge_transaction_features(master_df, features_df):
+    """
+    master_df with its transaction feature columns replaced by (or extended
+    with) those of features_df, matched on customer_id. Customers missing
+    from features_df keep their master values (NaN for new columns).
+    """
+    index, master_codes, feature_codes = shared_codes(master_df['customer_id'], features_df['customer_id'])
+    master_rows, feature_rows = align_codes(master_codes, feature_codes, len(index))
+    every_row = np.array_equal(master_rows, np.arange(len(master_df)))
+
+    columns = {}
+    for name in features_df.columns.drop('customer_id'):
+        new_values = features_df[name].to_numpy()[feature_rows]
+        if every_row:
+            values = new_values
+        else:
+            values = (master_df[name].to_numpy(dtype=np.float64, copy=True) if name in master_df
+                      else np.full(len(master_df), np.nan))
+            values[master_rows] = new_values
+        if name in master_df:
+            values = values.astype(master_df[name].dtype, copy=False)
+        columns[name] = values
+    return replace_columns(master_df, columns)
+
+
+def main(raw_dir=None, output_path=None, master_path=None, store_dir=None, start=None, end=None):
+    """
+    Compute transaction features from the channel tables.
+
+    Args:
+        raw_dir: Directory with clean_txn_<channel>.csv tables
+        output_path: Where to write the features (CSV)
+        master_path: master_features to merge into; when given, features are
+            computed for its customers and the merged master is written
+        store_dir: Read a TransactionStore instead of the CSV tables
+        start, end: Date range to read from the store (end exclusive)
+    """
+    BASE_DIR = Path(__file__).resolve().parent.parent
+    PROJECT_ROOT = BASE_DIR.parent
+
+    raw_dir = Path(raw_dir) if raw_dir else (PROJECT_ROOT / 'clean_data' / 'transactions')
+    output_path = Path(output_path) if output_path else (
+        BASE_DIR / 'data' / 'intermediate' / 'transaction_features.csv'
+    )
+
+    if store_dir:
+        from feature_engineering.transaction_store import TransactionStore
+        print(f"Loading transactions from store {store_dir}...")
+        table = TransactionStore(store_dir).load(start, end)
+    else:
+        print(f"Loading transactions from {raw_dir}...")
+        table = load_transactions(raw_dir)
+    print(f"  Loaded {len(table):,} transactions for {table.n_customers:,} customers")
+
+    master_df = None
+    customer_ids = None
+    if master_path:
+        from preprocessing.feature_loader import load_master_features
+        master_df = load_master_features(master_path)
+        customer_ids = master_df['customer_id']
+
+    print("Computing transaction features...")
+    features_df = build_transaction_features(table, customer_ids)
+    velocity_df = build_velocity_features(table, customer_ids)
+    features_df = pd.concat([features_df, velocity_df.drop(columns='customer_id')], axis=1)
+    print(f"  {len(features_df.columns) - 1} features for {len(features_df):,} customers")
+
+    if master_df is not None:
+        features_df = merge_transaction_features(master_df, features_df)
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    features_df.to_csv(output_path, index=False)
+    print(f"Saved features to: {output_path}")
+
+    return features_df
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compute transaction features from the channel tables')
+    parser.add_argument('--raw-dir', type=str, default=None, help='Directory with clean_txn_<channel>.csv')
+    parser.add_argument('--output', type=str, default=None, help='Path to write the features CSV')
+    parser.add_argument('--master', type=str, default=None,
+                        help='master_features to merge the features into')
+    parser.add_argument('--store', type=str, default=None,
+                        help='Transaction store to read instead of the CSV tables')
+    parser.add_argument('--start', type=str, default=None, help='First date to read from the store')
+    parser.add_argument('--end', type=str, default=None, help='Date to stop reading the store at (exclusive)')
+    args = parser.parse_args()
+
+    main(args.raw_dir, args.output, args.master, args.store, args.start, args.end)
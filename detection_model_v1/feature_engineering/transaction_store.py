@@ -0,0 +1,426 @@
+"""
+Partitioned Transaction Store
+
+Columnar on-disk layout for the channel transaction tables, written once
+at ingest and memory-mapped on read:
+
+    store/
+        manifest.json                   format version, channels, shard count,
+                                        ingested sources (by sha256), partitions
+                                        (rows, timestamp range and file
+                                        generation each)
+        customer_ids.npy                customer ID per code (dictionary; codes
+                                        are append-only across ingests)
+        month=YYYY-MM/shard=NNN/
+            customer.<gen>.npy          int32 customer code
+            amount.<gen>.npy            float32 CAD amount
+            timestamp.<gen>.npy         int64 epoch seconds
+            is_debit.<gen>.npy, channel.<gen>.npy, cross_border.<gen>.npy, cash.<gen>.npy
+
+An ingest never rewrites a file the manifest points to: partitions it
+touches are written as files of a new generation, the manifest is
+replaced atomically (the commit point) and only then are the superseded
+files deleted. A crash mid-ingest leaves the previous store intact, and a
+reader holding the previous manifest keeps reading consistent files
+(already-mapped files stay readable after deletion).
+
+Rows are partitioned by transaction month and by a stable hash of the
+customer ID (N_SHARDS shards), and sorted by (customer, timestamp) inside
+a partition. Reads prune partitions by date range and by the shards of
+the requested customers before touching any file, and a single partition
+is returned as read-only memory maps without copying.
+
+float32 amounts keep cent precision up to about $130K and exact whole
+dollars up to $16M (round-amount and threshold features are unaffected);
+the feature kernels widen them to float64.
+"""
+
+import json
+import os
+import numpy as np
+import pandas as pd
+from pathlib import Path
+import sys
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from preprocessing.customer_index import CustomerIndex
+from feature_engineering.transactions import (
+    CHANNEL_FILES, READ_CHUNKSIZE, TransactionTable, file_fingerprint, read_channel_table
+)
+
+STORE_FORMAT = 'aml-transaction-store'
+STORE_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+CUSTOMER_IDS_FILE = 'customer_ids.npy'
+
+N_SHARDS = 16
+
+# Stored column -> dtype (the TransactionTable arrays)
+STORE_COLUMNS = {
+    'customer': np.int32,
+    'amount': np.float32,
+    'timestamp': np.int64,
+    'is_debit': np.bool_,
+    'channel': np.uint8,
+    'cross_border': np.bool_,
+    'cash': np.bool_,
+}
+
+
+def customer_shards(customer_ids, n_shards):
+    """Shard of each customer ID (stable across runs and processes)"""
+    ids = np.asarray(customer_ids, dtype=object).astype(str).astype(object)
+    return (pd.util.hash_array(ids) % np.uint64(n_shards)).astype(np.int32)
+
+
+def _months(timestamps):
+    """Months since 1970-01 of epoch-second timestamps"""
+    return timestamps.astype('datetime64[s]').astype('datetime64[M]').astype(np.int64)
+
+
+def _month_name(month):
+    return np.datetime_as_string(np.datetime64(int(month), 'M'), unit='M')
+
+
+def _epoch_seconds(value):
+    return int(pd.Timestamp(value).to_datetime64().astype('datetime64[s]').astype(np.int64))
+
+
+def partition_name(month, shard):
+    """Partition directory for a month (months since 1970-01) and shard"""
+    return f"month={_month_name(month)}/shard={shard:03d}"
+
+
+def column_file(col, generation):
+    """File of a partition column written by an ingest generation"""
+    return f'{col}.{generation:06d}.npy'
+
+
+def _save_replace(path, values):
+    """np.save to a temporary file, then rename it over path"""
+    tmp = path.with_name(f'{path.name}.tmp-{os.getpid()}')
+    with open(tmp, 'wb') as f:
+        np.save(f, values, allow_pickle=False)
+    os.replace(tmp, path)
+
+
+class TransactionStore:
+    """
+    Month x customer-shard partitioned transaction columns.
+
+    Args:
+        store_dir: Store directory
+        manifest: Parsed manifest.json (read from store_dir if None)
+    """
+
+    def __init__(self, store_dir, manifest=None):
+        self.store_dir = Path(store_dir)
+        if manifest is None:
+            with open(self.store_dir / MANIFEST_FILE) as f:
+                manifest = json.load(f)
+        if manifest.get('format') != STORE_FORMAT:
+            raise ValueError(f"{self.store_dir} is not a transaction store (format {manifest.get('format')!r})")
+        if manifest.get('version') != STORE_VERSION:
+            raise ValueError(f"Unsupported transaction store version {manifest.get('version')}")
+        self.manifest = manifest
+        self._customer_index = None
+
+    @classmethod
+    def create(cls, store_dir, n_shards=N_SHARDS, channels=None):
+        """
+        Empty store.
+
+        Args:
+            store_dir: Store directory (created if missing)
+            n_shards: Customer hash shards per month
+            channels: Channel names the channel codes refer to
+                (default: CHANNEL_FILES)
+        """
+        store_dir = Path(store_dir)
+        if (store_dir / MANIFEST_FILE).exists():
+            raise ValueError(f"A transaction store already exists in {store_dir}")
+        store_dir.mkdir(parents=True, exist_ok=True)
+        manifest = {
+            'format': STORE_FORMAT,
+            'version': STORE_VERSION,
+            'n_shards': int(n_shards),
+            'channels': list(channels) if channels is not None else list(CHANNEL_FILES),
+            'columns': {name: np.dtype(dtype).name for name, dtype in STORE_COLUMNS.items()},
+            'n_customers': 0,
+            'generation': 0,
+            'sources': {},
+            'partitions': {},
+        }
+        _save_replace(store_dir / CUSTOMER_IDS_FILE, np.empty(0, dtype='<U1'))
+        store = cls(store_dir, manifest)
+        store._write_manifest()
+        return store
+
+    @classmethod
+    def open(cls, store_dir, n_shards=N_SHARDS):
+        """Existing store in store_dir, or a new one"""
+        if (Path(store_dir) / MANIFEST_FILE).exists():
+            return cls(store_dir)
+        return cls.create(store_dir, n_shards)
+
+    def _write_manifest(self):
+        """Replace manifest.json atomically (readers see the old or the new one)"""
+        path = self.store_dir / MANIFEST_FILE
+        tmp = path.with_name(f'{MANIFEST_FILE}.tmp-{os.getpid()}')
+        with open(tmp, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp, path)
+
+    @property
+    def n_shards(self):
+        return self.manifest['n_shards']
+
+    @property
+    def channels(self):
+        return tuple(self.manifest['channels'])
+
+    @property
+    def n_rows(self):
+        return sum(part['rows'] for part in self.manifest['partitions'].values())
+
+    @property
+    def customer_index(self):
+        """CustomerIndex of the dictionary (codes stored in the partitions)"""
+        if self._customer_index is None:
+            ids = np.load(self.store_dir / CUSTOMER_IDS_FILE, allow_pickle=False)
+            # The file may already hold IDs of an ingest that is not committed yet
+            self._customer_index = CustomerIndex(ids[:self.manifest['n_customers']].astype(object))
+        return self._customer_index
+
+    def ingest(self, path, channel, chunksize=READ_CHUNKSIZE):
+        """
+        Add one channel table to the store. A file already ingested (same
+        contents, by sha256) is skipped.
+
+        Args:
+            path: clean_txn_<channel>.csv
+            channel: Channel name
+            chunksize: Rows per read block
+
+        Returns:
+            Number of rows added
+        """
+        path = Path(path)
+        digest = file_fingerprint(path)
+        source = {'name': path.name, 'channel': channel, 'bytes': path.stat().st_size}
+        sources = self.manifest['sources']
+        if digest in sources:
+            return 0
+        if channel not in self.channels:
+            raise ValueError(f"Channel '{channel}' is not in this store: {list(self.channels)}")
+
+        table = read_channel_table(path, channel, self.customer_index, chunksize)
+        # read_channel_table codes channels by the live registry; store codes are fixed at create
+        table.channel = np.full(len(table), self.channels.index(channel), dtype=np.uint8)
+        generation = self.manifest['generation'] + 1
+        partitions, superseded = self._write_partitions(table, generation)
+
+        manifest = dict(self.manifest, generation=generation,
+                        n_customers=len(table.customer_index), partitions=partitions,
+                        sources=dict(sources, **{digest: source}))
+        self.manifest = manifest
+        self._write_manifest()
+        self._customer_index = table.customer_index
+        for stale in superseded:
+            stale.unlink(missing_ok=True)
+        return len(table)
+
+    def ingest_dir(self, raw_dir, channels=None, chunksize=READ_CHUNKSIZE):
+        """
+        Ingest the channel tables found in raw_dir.
+
+        Returns:
+            Dict of channel -> rows added
+        """
+        raw_dir = Path(raw_dir)
+        if channels is None:
+            channels = [name for name in self.channels
+                        if name in CHANNEL_FILES and (raw_dir / CHANNEL_FILES[name]).exists()]
+        return {channel: self.ingest(raw_dir / CHANNEL_FILES[channel], channel, chunksize)
+                for channel in channels}
+
+    def _write_partitions(self, table, generation):
+        """
+        Write a table's rows into their partitions (merging with existing
+        rows) as files of a new generation, without touching the manifest.
+
+        Returns:
+            partitions: Manifest partition entries after the ingest
+            superseded: Files of the previous generation of rewritten partitions
+        """
+        # The dictionary only grows, so readers of the old manifest can use the new file
+        ids = table.customer_index.ids
+        _save_replace(self.store_dir / CUSTOMER_IDS_FILE, ids.astype(str))
+        partitions = dict(self.manifest['partitions'])
+        superseded = []
+        if not len(table):
+            return partitions, superseded
+
+        shard_of = customer_shards(ids, self.n_shards)
+        months = _months(table.timestamp)
+        keys = (months - months.min()) * self.n_shards + shard_of[table.customer]
+        order = np.lexsort((table.timestamp, table.customer, keys))
+        keys = keys[order]
+        starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+        stops = np.append(starts[1:], len(keys))
+
+        for start, stop in zip(starts, stops):
+            rows = order[start:stop]
+            month = int(months[rows[0]])
+            name = partition_name(month, int(shard_of[table.customer[rows[0]]]))
+            columns = {col: getattr(table, col)[rows].astype(dtype, copy=False)
+                       for col, dtype in STORE_COLUMNS.items()}
+            part_dir = self.store_dir / name
+            if name in partitions:
+                existing = self.read_partition(name, mmap=False)
+                merged = {col: np.concatenate([existing[col], columns[col]]) for col in STORE_COLUMNS}
+                resort = np.lexsort((merged['timestamp'], merged['customer']))
+                columns = {col: values[resort] for col, values in merged.items()}
+                old_generation = partitions[name]['generation']
+                superseded.extend(part_dir / column_file(col, old_generation) for col in STORE_COLUMNS)
+
+            part_dir.mkdir(parents=True, exist_ok=True)
+            for col, values in columns.items():
+                # Unreferenced until the manifest names this generation
+                np.save(part_dir / column_file(col, generation), values, allow_pickle=False)
+            partitions[name] = {
+                'month': _month_name(month),
+                'shard': int(shard_of[table.customer[rows[0]]]),
+                'rows': int(len(columns['customer'])),
+                'min_timestamp': int(columns['timestamp'].min()),
+                'max_timestamp': int(columns['timestamp'].max()),
+                'generation': generation,
+            }
+        return partitions, superseded
+
+    def read_partition(self, name, mmap=True):
+        """Columns of one partition (read-only memory maps by default)"""
+        part_dir = self.store_dir / name
+        generation = self.manifest['partitions'][name]['generation']
+        columns = {}
+        for col in STORE_COLUMNS:
+            values = np.load(part_dir / column_file(col, generation), mmap_mode='r' if mmap else None,
+                             allow_pickle=False)
+            # Plain ndarray view of the map: indexing a np.memmap goes through Python-level hooks
+            columns[col] = np.asarray(values) if mmap else values
+        return columns
+
+    def partitions(self, start=None, end=None, shards=None):
+        """
+        Names of the partitions that can hold rows in [start, end) and the
+        given shards (partition pruning; no files are read).
+
+        Args:
+            start, end: Date range (anything pd.Timestamp accepts; end exclusive)
+            shards: Shard numbers to keep (default: all)
+        """
+        low = _epoch_seconds(start) if start is not None else None
+        high = _epoch_seconds(end) if end is not None else None
+        shards = set(int(s) for s in shards) if shards is not None else None
+        names = []
+        for name, part in sorted(self.manifest['partitions'].items()):
+            if shards is not None and part['shard'] not in shards:
+                continue
+            if low is not None and part['max_timestamp'] < low:
+                continue
+            if high is not None and part['min_timestamp'] >= high:
+                continue
+            names.append(name)
+        return names
+
+    def load(self, start=None, end=None, customer_ids=None, channels=None):
+        """
+        Transactions in a date range, optionally for given customers and
+        channels, as one TransactionTable over the store's customer index.
+        Only the partitions that can match are read; a single partition
+        with no row filter stays memory-mapped.
+
+        Args:
+            start, end: Date range (end exclusive)
+            customer_ids: Customers to keep (prunes to their shards)
+            channels: Channel names to keep
+
+        Returns:
+            TransactionTable
+        """
+        index = self.customer_index
+        codes = None
+        shards = None
+        if customer_ids is not None:
+            codes = index.encode(pd.Series(customer_ids))
+            codes = np.unique(codes[codes >= 0])
+            shards = np.unique(customer_shards(index.decode(codes), self.n_shards))
+        low = _epoch_seconds(start) if start is not None else None
+        high = _epoch_seconds(end) if end is not None else None
+        channel_codes = [self.channels.index(name) for name in channels] if channels is not None else None
+
+        parts = []
+        for name in self.partitions(start, end, shards):
+            columns = self.read_partition(name)
+            keep = None
+            if low is not None and self.manifest['partitions'][name]['min_timestamp'] < low:
+                keep = columns['timestamp'] >= low
+            if high is not None and self.manifest['partitions'][name]['max_timestamp'] >= high:
+                keep = _and(keep, columns['timestamp'] < high)
+            if codes is not None:
+                keep = _and(keep, np.isin(columns['customer'], codes))
+            if channel_codes is not None:
+                keep = _and(keep, np.isin(columns['channel'], channel_codes))
+            if keep is not None:
+                columns = {col: values[keep] for col, values in columns.items()}
+            parts.append(columns)
+
+        if not parts:
+            return TransactionTable.empty(index)
+        if len(parts) == 1:
+            arrays = parts[0]
+        else:
+            arrays = {col: np.concatenate([part[col] for part in parts]) for col in STORE_COLUMNS}
+        return TransactionTable(index, channels=self.channels, **arrays)
+
+
+def _and(mask, other):
+    return other if mask is None else mask & other
+
+
+def main(raw_dir=None, store_dir=None, n_shards=N_SHARDS):
+    """
+    Ingest the channel tables of raw_dir into a transaction store.
+
+    Args:
+        raw_dir: Directory with clean_txn_<channel>.csv tables
+        store_dir: Store directory (created if missing)
+        n_shards: Customer shards per month for a new store
+    """
+    BASE_DIR = Path(__file__).resolve().parent.parent
+    PROJECT_ROOT = BASE_DIR.parent
+
+    raw_dir = Path(raw_dir) if raw_dir else (PROJECT_ROOT / 'clean_data' / 'transactions')
+    store_dir = Path(store_dir) if store_dir else (BASE_DIR / 'data' / 'transaction_store')
+
+    store = TransactionStore.open(store_dir, n_shards)
+    print(f"Ingesting {raw_dir} into {store_dir}...")
+    for channel, rows in store.ingest_dir(raw_dir).items():
+        print(f"  {channel}: {rows:,} rows" if rows else f"  {channel}: already ingested")
+    print(f"Store: {store.n_rows:,} rows, {store.manifest['n_customers']:,} customers, "
+          f"{len(store.manifest['partitions'])} partitions")
+    return store
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Ingest channel transaction tables into a partitioned store')
+    parser.add_argument('--raw-dir', type=str, default=None, help='Directory with clean_txn_<channel>.csv')
+    parser.add_argument('--store', type=str, default=None, help='Transaction store directory')
+    parser.add_argument('--shards', type=int, default=N_SHARDS, help='Customer shards per month (new store)')
+    args = parser.parse_args()
+
+    main(args.raw_dir, args.store, args.shards)
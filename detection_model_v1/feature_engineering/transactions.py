@@ -0,0 +1,261 @@
+"""
+Channel Transaction Tables
+
+Reads the per-channel clean transaction tables (clean_txn_<channel>.csv)
+into one columnar TransactionTable: parallel NumPy arrays with customer
+IDs interned to int32 codes (CustomerIndex), so every per-customer
+aggregate is an integer-keyed bincount or a pass over sorted groups.
+
+Every channel table has the columns of clean_txn_wire.csv:
+
+    customer_id            customer identifier
+    amount_cad             amount in CAD dollars
+    debit_credit           'debit'/'credit' (or D/C)
+    transaction_datetime   timestamp
+
+and optionally:
+
+    country                counterparty country; anything outside
+                           HOME_COUNTRIES marks the transaction cross-border
+    cash_indicator         ABM only: Y/Yes/1/True for cash transactions
+                           (without it every ABM transaction counts as cash)
+
+Transactions in the cross_border table are cross-border by definition.
+Tables are read in row blocks, so memory is bounded by the arrays rather
+than by pandas objects.
+"""
+
+import hashlib
+import numpy as np
+import pandas as pd
+from pathlib import Path
+import sys
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from preprocessing.customer_index import CODE_DTYPE, CustomerIndex
+
+# Channel name -> clean transaction table file
+CHANNEL_FILES = {
+    'wire': 'clean_txn_wire.csv',
+    'eft': 'clean_txn_eft.csv',
+    'abm': 'clean_txn_abm.csv',
+    'western_union': 'clean_txn_western_union.csv',
+    'cross_border': 'clean_txn_cross_border.csv',
+}
+
+REQUIRED_COLUMNS = ('customer_id', 'amount_cad', 'debit_credit', 'transaction_datetime')
+OPTIONAL_COLUMNS = ('country', 'cash_indicator')
+
+# Counterparty countries that are not cross-border (compared upper-case)
+HOME_COUNTRIES = frozenset({'CA', 'CAN', 'CANADA'})
+
+# cash_indicator values that mark a cash transaction (compared upper-case);
+# anything else, including blanks, is not cash
+CASH_VALUES = frozenset({'1', '1.0', 'Y', 'YES', 'T', 'TRUE'})
+
+# Rows per block when reading a channel table
+READ_CHUNKSIZE = 1_000_000
+
+
+def register_channel(name, filename):
+    """Add a channel table (e.g. a new clean_txn_<channel>.csv)"""
+    CHANNEL_FILES[name] = filename
+
+
+def channel_code(name):
+    """uint8 code of a channel in TransactionTable.channel"""
+    if name not in CHANNEL_FILES:
+        raise ValueError(f"Unknown channel '{name}'. Registered: {list(CHANNEL_FILES)}")
+    return list(CHANNEL_FILES).index(name)
+
+
+class TransactionTable:
+    """
+    Transactions of all channels as parallel arrays.
+
+    Args:
+        customer_index: CustomerIndex the customer codes refer to
+        customer: int32 customer code per transaction
+        amount: Amount in CAD dollars (float64; float32 when read from a
+            TransactionStore)
+        is_debit: True for money out
+        timestamp: int64 seconds since the epoch
+        channel: uint8 channel code (position in CHANNEL_FILES)
+        cross_border: True for cross-border transactions
+        cash: True for ABM cash transactions
+        channels: Channel names the codes refer to
+    """
+
+    def __init__(self, customer_index, customer, amount, is_debit, timestamp, channel, cross_border, cash,
+                 channels=None):
+        self.customer_index = customer_index
+        self.customer = customer
+        self.amount = amount
+        self.is_debit = is_debit
+        self.timestamp = timestamp
+        self.channel = channel
+        self.cross_border = cross_border
+        self.cash = cash
+        self.channels = tuple(channels) if channels is not None else tuple(CHANNEL_FILES)
+
+    ARRAYS = ('customer', 'amount', 'is_debit', 'timestamp', 'channel', 'cross_border', 'cash')
+
+    def __len__(self):
+        return len(self.customer)
+
+    @property
+    def n_customers(self):
+        return len(self.customer_index)
+
+    @classmethod
+    def empty(cls, customer_index=None):
+        return cls(
+            customer_index if customer_index is not None else CustomerIndex(),
+            customer=np.empty(0, dtype=CODE_DTYPE),
+            amount=np.empty(0, dtype=np.float64),
+            is_debit=np.empty(0, dtype=bool),
+            timestamp=np.empty(0, dtype=np.int64),
+            channel=np.empty(0, dtype=np.uint8),
+            cross_border=np.empty(0, dtype=bool),
+            cash=np.empty(0, dtype=bool),
+        )
+
+    def take(self, rows):
+        """Table of the given rows (positions or boolean mask), same customer index"""
+        return TransactionTable(self.customer_index, channels=self.channels,
+                                **{name: getattr(self, name)[rows] for name in self.ARRAYS})
+
+    def with_index(self, customer_index):
+        """
+        Table recoded to another CustomerIndex; transactions of customers
+        not in it are dropped.
+        """
+        mapping = customer_index.encode(self.customer_index.ids)
+        codes = mapping[self.customer] if len(mapping) else np.empty(0, dtype=CODE_DTYPE)
+        table = self.take(codes >= 0)
+        table.customer = codes[codes >= 0].astype(CODE_DTYPE)
+        table.customer_index = customer_index
+        return table
+
+
+def _debit_mask(values):
+    """True where debit_credit says debit ('debit', 'D', 'DR', ...)"""
+    return values.astype(str).str.strip().str[:1].str.upper().eq('D').to_numpy()
+
+
+def _cash_mask(values):
+    """True where cash_indicator says cash ('Y', 'Yes', '1', 'TRUE', ...)"""
+    return values.str.strip().str.upper().isin(CASH_VALUES).to_numpy()
+
+
+def _epoch_seconds(values):
+    """int64 seconds since the epoch (any datetime unit pandas parses to)"""
+    return pd.to_datetime(values).to_numpy(dtype='datetime64[s]').astype(np.int64)
+
+
+def _cross_border_mask(countries):
+    normalized = countries.astype(str).str.strip().str.upper()
+    return (countries.notna() & ~normalized.isin(HOME_COUNTRIES)).to_numpy()
+
+
+def file_fingerprint(path):
+    """sha256 of a file's contents (identifies a channel table already applied)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_channel_table(path, channel, customer_index=None, chunksize=READ_CHUNKSIZE):
+    """
+    Read one clean_txn_<channel>.csv into a TransactionTable.
+
+    Rows without a customer_id, amount or timestamp are skipped.
+
+    Args:
+        path: Channel table path
+        channel: Channel name (key of CHANNEL_FILES)
+        customer_index: Existing CustomerIndex to extend (codes of known
+            customers are kept)
+        chunksize: Rows per read block
+
+    Returns:
+        TransactionTable
+    """
+    path = Path(path)
+    code = channel_code(channel)
+    index = customer_index if customer_index is not None else CustomerIndex()
+    header = pd.read_csv(path, nrows=0).columns
+    missing = [col for col in REQUIRED_COLUMNS if col not in header]
+    if missing:
+        raise ValueError(f"{path.name} is missing columns: {missing}")
+    usecols = list(REQUIRED_COLUMNS) + [col for col in OPTIONAL_COLUMNS if col in header]
+
+    blocks = []
+    reader = pd.read_csv(path, usecols=usecols, chunksize=chunksize,
+                         dtype={'customer_id': str, 'amount_cad': np.float64, 'debit_credit': str,
+                                'country': str, 'cash_indicator': str})
+    for chunk in reader:
+        chunk = chunk.dropna(subset=['customer_id', 'amount_cad', 'transaction_datetime'])
+        index, codes = index.extend(chunk['customer_id'].to_numpy(dtype=object))
+        n_rows = len(chunk)
+
+        cross_border = np.full(n_rows, channel == 'cross_border')
+        if 'country' in chunk:
+            cross_border |= _cross_border_mask(chunk['country'])
+        if channel != 'abm':
+            cash = np.zeros(n_rows, dtype=bool)
+        elif 'cash_indicator' in chunk:
+            cash = _cash_mask(chunk['cash_indicator'])
+        else:
+            cash = np.ones(n_rows, dtype=bool)
+
+        blocks.append(dict(
+            customer=codes,
+            amount=chunk['amount_cad'].to_numpy(dtype=np.float64),
+            is_debit=_debit_mask(chunk['debit_credit']),
+            timestamp=_epoch_seconds(chunk['transaction_datetime']),
+            channel=np.full(n_rows, code, dtype=np.uint8),
+            cross_border=cross_border,
+            cash=cash,
+        ))
+
+    if not blocks:
+        return TransactionTable.empty(index)
+    return TransactionTable(index, **{name: np.concatenate([b[name] for b in blocks])
+                                      for name in TransactionTable.ARRAYS})
+
+
+def load_transactions(raw_dir, channels=None, customer_index=None, chunksize=READ_CHUNKSIZE):
+    """
+    Read the channel tables found in raw_dir into one TransactionTable.
+
+    Args:
+        raw_dir: Directory holding clean_txn_<channel>.csv files
+        channels: Channel names to read (default: every registered channel
+            whose file exists)
+        customer_index: CustomerIndex to extend (e.g. the master_features
+            customers, so codes line up with it)
+        chunksize: Rows per read block
+
+    Returns:
+        TransactionTable
+    """
+    raw_dir = Path(raw_dir)
+    if channels is None:
+        channels = [name for name, filename in CHANNEL_FILES.items() if (raw_dir / filename).exists()]
+    if not channels:
+        raise FileNotFoundError(f"No channel transaction tables in {raw_dir}")
+
+    index = customer_index if customer_index is not None else CustomerIndex()
+    tables = []
+    for channel in channels:
+        table = read_channel_table(raw_dir / CHANNEL_FILES[channel], channel, index, chunksize)
+        index = table.customer_index
+        tables.append(table)
+    # Each table extended the previous index, so earlier codes are still valid
+    return TransactionTable(index, **{name: np.concatenate([getattr(t, name) for t in tables])
+                                      for name in TransactionTable.ARRAYS})
@@ -0,0 +1,248 @@
+"""
+Time-Window Kernels
+
+Velocity features (rule_based_scorer BEHAVIORAL_FEATURES) over
+per-customer time-sorted transaction arrays. The transactions are sorted
+once by (customer, timestamp); within a partition each row gets the key
+
+    customer << KEY_SHIFT | seconds since the partition's first transaction
+
+so one sorted int64 array orders every customer's timeline and a window
+[t, t + w] of one customer is the key range [key, key + w]. Rolling
+counts and window totals are np.searchsorted over the keys (plus prefix
+sums), credit -> debit matching is a searchsorted of credit keys into the
+debit keys, and same-day bucketing is a run-length pass over (customer,
+day) keys. Total cost is O(n log n); customer partitions of about
+PARTITION_ROWS transactions run on a thread pool.
+
+Features:
+    flow_through_velocity_hours       mean hours from a credit to the
+                                      customer's next debit (credits with
+                                      no debit within FLOW_THROUGH_HORIZON_HOURS
+                                      count as the horizon)
+    rapid_fire_flag                   RAPID_FIRE_MIN_TXNS+ transactions within
+                                      RAPID_FIRE_WINDOW_SECONDS
+    structured_cash_deposits_same_day days with SAME_DAY_MIN_DEPOSITS+ ABM cash
+                                      deposits, each under the reporting
+                                      threshold but together at or over it
+    sudden_inflow_outflow_pattern     a credit of SUDDEN_INFLOW_MIN+ followed
+                                      within SUDDEN_OUTFLOW_WINDOW_HOURS by
+                                      SUDDEN_OUTFLOW_MIN_COUNT+ debits moving
+                                      SUDDEN_OUTFLOW_SHARE of it out
+"""
+
+import numpy as np
+import pandas as pd
+from pathlib import Path
+import sys
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from preprocessing.customer_index import CustomerIndex
+from models.neighbors import map_blocks
+
+# Bits of a window key below the customer code: the time span of one
+# partition must stay under 2**KEY_SHIFT seconds (~544 years)
+KEY_SHIFT = 34
+
+# Transactions per partition (partitions never split a customer)
+PARTITION_ROWS = 1_000_000
+
+SECONDS_PER_HOUR = 3600
+SECONDS_PER_DAY = 86400
+
+FLOW_THROUGH_HORIZON_HOURS = 720
+
+RAPID_FIRE_WINDOW_SECONDS = 3600
+RAPID_FIRE_MIN_TXNS = 5
+
+CASH_REPORTING_THRESHOLD = 10_000.0
+SAME_DAY_MIN_DEPOSITS = 2
+
+SUDDEN_INFLOW_MIN = 10_000.0
+SUDDEN_OUTFLOW_WINDOW_HOURS = 72
+SUDDEN_OUTFLOW_MIN_COUNT = 3
+SUDDEN_OUTFLOW_SHARE = 0.8
+
+# Feature -> value (and dtype) for customers without transactions
+VELOCITY_FEATURES = {
+    'flow_through_velocity_hours': np.float64(FLOW_THROUGH_HORIZON_HOURS),
+    'rapid_fire_flag': np.uint8(0),
+    'structured_cash_deposits_same_day': np.int64(0),
+    'sudden_inflow_outflow_pattern': np.uint8(0),
+}
+
+
+def window_keys(codes, timestamps, origin):
+    """
+    Sortable int64 keys of (customer, time) pairs.
+
+    Args:
+        codes: Customer code per row (non-negative, < 2**(63 - KEY_SHIFT))
+        timestamps: Epoch seconds per row
+        origin: Earliest timestamp of the rows
+    """
+    offsets = timestamps - origin
+    if len(offsets) and offsets.max() >= (1 << KEY_SHIFT):
+        raise ValueError("Transaction time span too large for window keys")
+    return (codes.astype(np.int64) << KEY_SHIFT) | offsets
+
+
+def rolling_count(keys, window):
+    """Rows in [key, key + window] of each row's customer (keys sorted)"""
+    return np.searchsorted(keys, keys + window, side='right') - np.arange(len(keys))
+
+
+def window_totals(keys, values, query_keys, window):
+    """
+    Count and sum of the rows with keys in [q, q + window] for each query
+    key q (keys sorted; one customer's window never reaches the next).
+
+    Returns:
+        counts, sums
+    """
+    prefix = np.zeros(len(values) + 1)
+    np.cumsum(values, out=prefix[1:])
+    low = np.searchsorted(keys, query_keys, side='left')
+    high = np.searchsorted(keys, query_keys + window, side='right')
+    return high - low, prefix[high] - prefix[low]
+
+
+def next_match(source_keys, target_keys, horizon):
+    """
+    Position in target_keys (sorted) of each source row's first target at
+    or after it, within horizon seconds and the same customer; -1 if none.
+    """
+    positions = np.searchsorted(target_keys, source_keys, side='left')
+    found = positions < len(target_keys)
+    # Keys of one customer differ by the time offset only, so a target of
+    # the next customer is always beyond the horizon
+    found[found] = target_keys[positions[found]] - source_keys[found] <= horizon
+    return np.where(found, positions, -1)
+
+
+class CustomerTimeline:
+    """
+    Transactions sorted by (customer, timestamp), with per-customer offsets.
+
+    Args:
+        table: TransactionTable
+    """
+
+    def __init__(self, table):
+        order = np.lexsort((table.timestamp, table.customer))
+        self.n_customers = table.n_customers
+        self.customer = table.customer[order]
+        self.timestamp = table.timestamp[order]
+        self.amount = np.abs(table.amount[order]).astype(np.float64, copy=False)
+        self.is_debit = table.is_debit[order]
+        if 'abm' in table.channels:
+            abm = table.channel[order] == table.channels.index('abm')
+            self.cash_deposit = abm & table.cash[order] & ~self.is_debit
+        else:
+            self.cash_deposit = np.zeros(len(order), dtype=bool)
+        self.offsets = np.zeros(self.n_customers + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.customer, minlength=self.n_customers), out=self.offsets[1:])
+
+    def partitions(self, rows_per_partition=PARTITION_ROWS):
+        """Customer ranges [start, stop) of about rows_per_partition transactions each"""
+        targets = np.arange(0, self.offsets[-1], max(1, rows_per_partition))
+        cuts = np.unique(np.concatenate([np.searchsorted(self.offsets, targets, side='left'),
+                                         [self.n_customers]]))
+        cuts = cuts[cuts > 0]
+        starts = np.concatenate([[0], cuts[:-1]])
+        return [(int(start), int(stop)) for start, stop in zip(starts, cuts) if stop > start]
+
+
+def _partition_features(timeline, start, stop):
+    """VELOCITY_FEATURES of customers [start, stop)"""
+    rows = slice(timeline.offsets[start], timeline.offsets[stop])
+    n = stop - start
+    codes = timeline.customer[rows] - start
+    timestamps = timeline.timestamp[rows]
+    amount = timeline.amount[rows]
+    is_debit = timeline.is_debit[rows]
+    cash_deposit = timeline.cash_deposit[rows]
+    if len(codes) == 0:
+        return {name: np.full(n, fill) for name, fill in VELOCITY_FEATURES.items()}
+    features = {}
+    keys = window_keys(codes, timestamps, timestamps.min())
+
+    # Flow-through: each credit to the customer's next debit
+    credit_keys, debit_keys = keys[~is_debit], keys[is_debit]
+    match = next_match(credit_keys, debit_keys, FLOW_THROUGH_HORIZON_HOURS * SECONDS_PER_HOUR)
+    matched = match >= 0
+    hours = np.full(len(credit_keys), float(FLOW_THROUGH_HORIZON_HOURS))
+    hours[matched] = (debit_keys[match[matched]] - credit_keys[matched]) / SECONDS_PER_HOUR
+    credit_codes = codes[~is_debit]
+    n_credits = np.bincount(credit_codes, minlength=n)
+    features['flow_through_velocity_hours'] = np.divide(
+        np.bincount(credit_codes, weights=hours, minlength=n), n_credits,
+        out=np.full(n, float(FLOW_THROUGH_HORIZON_HOURS)), where=n_credits > 0)
+
+    # Rapid fire: a burst of transactions in one window
+    burst = rolling_count(keys, RAPID_FIRE_WINDOW_SECONDS) >= RAPID_FIRE_MIN_TXNS
+    features['rapid_fire_flag'] = (np.bincount(codes[burst], minlength=n) > 0).astype(np.uint8)
+
+    # Same-day cash deposits: run-length over (customer, day), already sorted
+    deposit_codes = codes[cash_deposit]
+    days = window_keys(deposit_codes, timestamps[cash_deposit] // SECONDS_PER_DAY,
+                       timestamps.min() // SECONDS_PER_DAY)
+    structured = np.zeros(n, dtype=np.int64)
+    if len(days):
+        starts = np.flatnonzero(np.concatenate([[True], days[1:] != days[:-1]]))
+        deposits = amount[cash_deposit]
+        per_day = np.diff(np.append(starts, len(days)))
+        totals = np.add.reduceat(deposits, starts)
+        below = np.add.reduceat((deposits < CASH_REPORTING_THRESHOLD).astype(np.int64), starts) == per_day
+        hit = (per_day >= SAME_DAY_MIN_DEPOSITS) & below & (totals >= CASH_REPORTING_THRESHOLD)
+        structured = np.bincount(deposit_codes[starts[hit]], minlength=n).astype(np.int64)
+    features['structured_cash_deposits_same_day'] = structured
+
+    # Sudden inflow/outflow: large credit, then several debits draining it
+    large = ~is_debit & (amount >= SUDDEN_INFLOW_MIN)
+    pattern = np.zeros(n, dtype=np.uint8)
+    if large.any():
+        n_out, volume_out = window_totals(debit_keys, amount[is_debit], keys[large],
+                                          SUDDEN_OUTFLOW_WINDOW_HOURS * SECONDS_PER_HOUR)
+        drained = (n_out >= SUDDEN_OUTFLOW_MIN_COUNT) & (volume_out >= SUDDEN_OUTFLOW_SHARE * amount[large])
+        pattern = (np.bincount(codes[large][drained], minlength=n) > 0).astype(np.uint8)
+    features['sudden_inflow_outflow_pattern'] = pattern
+    return features
+
+
+def build_velocity_features(table, customer_ids=None, rows_per_partition=PARTITION_ROWS, n_jobs=-1):
+    """
+    Per-customer velocity features.
+
+    Args:
+        table: TransactionTable
+        customer_ids: Customers to return, in order (default: every customer
+            in the table, in code order); customers without transactions
+            get the VELOCITY_FEATURES fill values
+        rows_per_partition: Transactions per parallel partition
+        n_jobs: Worker threads (-1 = all cores)
+
+    Returns:
+        DataFrame with customer_id (interned) and VELOCITY_FEATURES columns
+    """
+    if customer_ids is not None:
+        index = CustomerIndex.of(pd.Series(customer_ids))
+        table = table.with_index(index)
+    timeline = CustomerTimeline(table)
+    partitions = timeline.partitions(rows_per_partition)
+
+    def run(block):
+        return [_partition_features(timeline, start, stop) for start, stop in partitions[block]]
+
+    results = [features for block in map_blocks(run, len(partitions), 1, n_jobs) for features in block]
+    features = {
+        name: np.concatenate([part[name] for part in results]) if results else np.full(0, fill)
+        for name, fill in VELOCITY_FEATURES.items()
+    }
+
+    rows = np.arange(table.n_customers) if customer_ids is None else index.encode(customer_ids)
+    features_df = pd.DataFrame({name: features[name][rows] for name in VELOCITY_FEATURES})
+    features_df.insert(0, 'customer_id', table.customer_index.categorical(rows))
+    return features_df
@@ -2,6 +2,7 @@
 
 from .anomaly_detector import (
     train_isolation_forest,
+    update_isolation_forest,
     predict_anomaly_scores,
     save_model,
     load_model
@@ -9,14 +10,85 @@ from .anomaly_detector import (
 
 from .risk_fusion import (
     fuse_risk_scores,
-    generate_predictions
+    fuse_score_matrix,
+    generate_predictions,
+    sweep_fusion
 )
 
+from .lof_detector import (
+    LocalOutlierFactorDetector,
+    train_lof,
+    predict_lof_scores,
+    save_lof_model,
+    load_lof_model
+)
+
+from .cblof_detector import (
+    ClusterBasedDetector,
+    train_cblof,
+    predict_cblof_scores,
+    save_cblof_model,
+    load_cblof_model
+)
+
+from .abod_detector import (
+    AngleBasedDetector,
+    train_abod,
+    predict_abod_scores,
+    save_abod_model,
+    load_abod_model
+)
+
+from .neighbors import make_neighbor_index, kneighbors_chunked
+from .training_set import ReservoirSampler, TrainingSetBuilder
+from .rule_engine import RuleEngine
+from .score_matrix import ScoreMatrix
+from .thresholds import ScoreHistogram, TopKSelector, select_top_k, top_k_count, top_k_cutoff
+from .flat_forest import FlatIsolationForest
+from .calibration import ScoreCalibrator
+from .model_bundle import save_bundle, load_bundle, verify_bundle
+from .risk_scorer import RiskScorer
+
 __all__ = [
     'train_isolation_forest',
+    'update_isolation_forest',
     'predict_anomaly_scores',
     'save_model',
     'load_model',
     'fuse_risk_scores',
-    'generate_predictions'
+    'fuse_score_matrix',
+    'generate_predictions',
+    'sweep_fusion',
+    'LocalOutlierFactorDetector',
+    'train_lof',
+    'predict_lof_scores',
+    'save_lof_model',
+    'load_lof_model',
+    'ClusterBasedDetector',
+    'train_cblof',
+    'predict_cblof_scores',
+    'save_cblof_model',
+    'load_cblof_model',
+    'AngleBasedDetector',
+    'train_abod',
+    'predict_abod_scores',
+    'save_abod_model',
+    'load_abod_model',
+    'make_neighbor_index',
+    'kneighbors_chunked',
+    'ReservoirSampler',
+    'TrainingSetBuilder',
+    'RuleEngine',
+    'ScoreMatrix',
+    'ScoreHistogram',
+    'TopKSelector',
+    'select_top_k',
+    'top_k_count',
+    'top_k_cutoff',
+    'FlatIsolationForest',
+    'ScoreCalibrator',
+    'save_bundle',
+    'load_bundle',
+    'verify_bundle',
+    'RiskScorer'
 ]
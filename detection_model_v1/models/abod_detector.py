@@ -0,0 +1,280 @@
+"""
+Angle-Based Outlier Detection
+
+Fast ABOD: the angle-based outlier factor of a customer is computed over
+its k nearest neighbors instead of every pair of customers (O(n k^2)
+rather than O(n^3)):
+
+    ABOF(p) = Var over neighbor pairs (a, b) of
+              <a - p, b - p> / (||a - p||^2 * ||b - p||^2)
+
+Outliers see their neighbors within a narrow cone, so a low ABOF is more
+anomalous. Neighbor search goes through models/neighbors.py and the
+per-customer factors are computed in row blocks on a thread pool. Writes
+scores_abod.csv (customer_id, score in 0-1, 1 = most anomalous).
+"""
+
+import pandas as pd
+import numpy as np
+from pathlib import Path
+import pickle
+import sys
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from preprocessing.data_preprocessor import preprocess_features, save_scaler, load_scaler
+from preprocessing.feature_loader import load_master_features
+from models.calibration import ScoreCalibrator
+from models.neighbors import CHUNK_SIZE, NEIGHBOR_BACKENDS, kneighbors_chunked, make_neighbor_index, map_blocks
+
+N_NEIGHBORS = 10
+
+ABOD_MODEL_FILE = 'abod.pkl'
+ABOD_PREPROCESSOR_FILE = 'abod_preprocessor.pkl'
+
+
+def angle_based_factors(X, fit_X, indices):
+    """
+    ABOF of each row of X over its neighbors fit_X[indices].
+
+    Neighbor pairs with a zero-length side (duplicate points) are skipped;
+    rows with no valid pair get NaN.
+    """
+    diffs = fit_X[indices] - X[:, np.newaxis, :]                 # (rows x k x features)
+    sq_norms = np.einsum('ijk,ijk->ij', diffs, diffs)             # (rows x k)
+    gram = np.einsum('ijk,ilk->ijl', diffs, diffs)                # (rows x k x k)
+    pair_a, pair_b = np.triu_indices(indices.shape[1], k=1)
+
+    denom = sq_norms[:, pair_a] * sq_norms[:, pair_b]
+    valid = denom > 0
+    weighted_cos = np.divide(gram[:, pair_a, pair_b], denom, out=np.zeros_like(denom), where=valid)
+
+    n_valid = valid.sum(axis=1)
+    mean = weighted_cos.sum(axis=1) / np.maximum(n_valid, 1)
+    variance = np.where(valid, (weighted_cos - mean[:, np.newaxis]) ** 2, 0.0).sum(axis=1) / np.maximum(n_valid, 1)
+    return np.where(n_valid > 0, variance, np.nan)
+
+
+class AngleBasedDetector:
+    """
+    kNN-restricted (fast) ABOD.
+
+    Args:
+        n_neighbors: Neighbors per point (capped at n_samples - 1)
+        backend: Neighbor backend name (see models.neighbors.NEIGHBOR_BACKENDS)
+        backend_params: Extra arguments for the backend
+        chunk_size: Rows per block
+        n_jobs: Worker threads (-1 = all cores)
+    """
+
+    def __init__(self, n_neighbors=N_NEIGHBORS, backend='auto', backend_params=None,
+                 chunk_size=CHUNK_SIZE, n_jobs=-1):
+        self.n_neighbors = n_neighbors
+        self.backend = backend
+        self.backend_params = backend_params or {}
+        self.chunk_size = chunk_size
+        self.n_jobs = n_jobs
+        self._index = None
+
+    def __getstate__(self):
+        # The neighbor index is rebuilt from the training matrix on load
+        state = self.__dict__.copy()
+        state['_index'] = None
+        return state
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = make_neighbor_index(self.backend, **self.backend_params).fit(self.fit_X_)
+        return self._index
+
+    def _factors(self, X, exclude_self=False):
+        _, indices = kneighbors_chunked(self.index, X, self.n_neighbors_, exclude_self=exclude_self,
+                                        chunk_size=self.chunk_size, n_jobs=self.n_jobs)
+        blocks = map_blocks(lambda rows: angle_based_factors(X[rows], self.fit_X_, indices[rows]),
+                            len(X), self.chunk_size, self.n_jobs)
+        return np.concatenate(blocks) if blocks else np.empty(0)
+
+    def fit(self, X):
+        """
+        Fit on the training matrix.
+
+        Sets training_scores_ (ABOF per training row; lower = more anomalous).
+        """
+        self.fit_X_ = np.ascontiguousarray(X, dtype=np.float64)
+        if len(self.fit_X_) < 3:
+            raise ValueError("ABOD needs at least 3 samples")
+        self.n_neighbors_ = max(2, min(self.n_neighbors, len(self.fit_X_) - 1))
+        self._index = None
+
+        factors = self._factors(self.fit_X_, exclude_self=True)
+        # Points whose neighbors all coincide with them sit in the densest
+        # region: give them the least anomalous training factor
+        finite = factors[np.isfinite(factors)]
+        self.max_factor_ = float(finite.max()) if len(finite) else 0.0
+        self.training_scores_ = np.where(np.isfinite(factors), factors, self.max_factor_)
+        return self
+
+    def score_samples(self, X):
+        """ABOF of new rows against the training set (lower = more anomalous)"""
+        factors = self._factors(np.ascontiguousarray(X, dtype=np.float64))
+        return np.where(np.isfinite(factors), factors, self.max_factor_)
+
+
+def train_abod(features_df, n_neighbors=N_NEIGHBORS, backend='auto', n_jobs=-1,
+               preprocessed_df=None, preprocessor=None, **backend_params):
+    """
+    Train fast ABOD on preprocessed features.
+
+    Args:
+        features_df: DataFrame with customer features (unused when
+            preprocessed_df is given; may be None)
+        n_neighbors: Neighbors per customer
+        backend: 'auto', 'kd_tree', 'ball_tree', 'brute' or 'approx'
+        n_jobs: Worker threads (-1 = all cores)
+        preprocessed_df: Already preprocessed features, to skip preprocessing
+        preprocessor: Preprocessor that produced preprocessed_df
+        backend_params: Extra neighbor backend arguments
+
+    Returns:
+        detector: Fitted AngleBasedDetector
+        preprocessor: Fitted Preprocessor
+        preprocessed_df: Preprocessed features used for training
+    """
+    if preprocessed_df is None:
+        preprocessed_df, preprocessor = preprocess_features(features_df, fit_scaler=True)
+    elif preprocessor is None:
+        raise ValueError("preprocessor is required when passing preprocessed_df")
+
+    detector = AngleBasedDetector(
+        n_neighbors=n_neighbors,
+        backend=backend,
+        backend_params=backend_params,
+        n_jobs=n_jobs
+    )
+    detector.fit(preprocessed_df.to_numpy(dtype=np.float64))
+
+    return detector, preprocessor, preprocessed_df
+
+
+def predict_abod_scores(detector, preprocessor, features_df, calibrator, preprocessed_df=None):
+    """
+    Score customers against the training set.
+
+    Args:
+        detector: Fitted AngleBasedDetector
+        preprocessor: Fitted Preprocessor
+        features_df: DataFrame with customer features
+        calibrator: ScoreCalibrator fitted on the training ABOF values
+        preprocessed_df: features_df already run through preprocessor
+
+    Returns:
+        scores_df: DataFrame with customer_id and score (0-1, 1 = most anomalous)
+    """
+    if preprocessed_df is None:
+        preprocessed_df, _ = preprocess_features(features_df, scaler=preprocessor, fit_scaler=False)
+
+    raw_scores = detector.score_samples(preprocessed_df.to_numpy(dtype=np.float64))
+
+    return pd.DataFrame({
+        'customer_id': features_df['customer_id'].values,
+        'score': calibrator.transform(raw_scores)
+    })
+
+
+def save_abod_model(detector, preprocessor, calibrator, model_dir):
+    """Save fitted ABOD (with its calibrator) and preprocessor"""
+    model_dir = Path(model_dir)
+    model_dir.mkdir(parents=True, exist_ok=True)
+
+    with open(model_dir / ABOD_MODEL_FILE, 'wb') as f:
+        pickle.dump({'detector': detector, 'calibrator': calibrator}, f)
+
+    save_scaler(preprocessor, model_dir / ABOD_PREPROCESSOR_FILE)
+
+
+def load_abod_model(model_dir):
+    """
+    Load a model saved by save_abod_model().
+
+    Returns:
+        detector: AngleBasedDetector (neighbor index rebuilt on first use)
+        preprocessor: Fitted Preprocessor
+        calibrator: ScoreCalibrator
+    """
+    model_dir = Path(model_dir)
+
+    with open(model_dir / ABOD_MODEL_FILE, 'rb') as f:
+        saved = pickle.load(f)
+
+    preprocessor = load_scaler(model_dir / ABOD_PREPROCESSOR_FILE)
+    return saved['detector'], preprocessor, saved['calibrator']
+
+
+def main(input_path=None, output_path=None, model_dir=None, n_neighbors=N_NEIGHBORS, backend='auto'):
+    """
+    Main function to train fast ABOD and generate scores.
+
+    Args:
+        input_path: Path to master_features.csv
+        output_path: Path to save scores_abod.csv
+        model_dir: Directory to save trained model
+        n_neighbors: Neighbors per customer
+        backend: Neighbor backend ('auto', 'kd_tree', 'ball_tree', 'brute', 'approx')
+    """
+    BASE_DIR = Path(__file__).resolve().parent.parent
+    PROJECT_ROOT = BASE_DIR.parent
+
+    input_path = Path(input_path) if input_path else (
+        PROJECT_ROOT / 'clean_data' / 'features' / 'final' / 'master_features.csv'
+    )
+    output_path = Path(output_path) if output_path else (
+        BASE_DIR / 'data' / 'intermediate' / 'scores_abod.csv'
+    )
+    model_dir = Path(model_dir) if model_dir else (BASE_DIR / 'models' / 'saved')
+
+    if not input_path.exists():
+        raise FileNotFoundError(f"Input file not found: {input_path}")
+
+    print("Loading features...")
+    features_df = load_master_features(input_path)
+    print(f"  Loaded {len(features_df):,} customers with {len(features_df.columns)} features")
+
+    print(f"Training ABOD (n_neighbors={n_neighbors}, backend={backend})...")
+    detector, preprocessor, preprocessed_df = train_abod(features_df, n_neighbors=n_neighbors, backend=backend)
+    print(f"  Trained on {len(preprocessed_df.columns)} features")
+
+    print("Generating anomaly scores...")
+    raw_scores = detector.training_scores_
+    calibrator = ScoreCalibrator.fit(raw_scores)
+    scores_df = pd.DataFrame({
+        'customer_id': features_df['customer_id'].values,
+        'score': calibrator.transform(raw_scores)
+    })
+    print(f"  Score range: {scores_df['score'].min():.4f} .. {scores_df['score'].max():.4f}")
+    print(f"  Mean score: {scores_df['score'].mean():.4f}")
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    scores_df.to_csv(output_path, index=False)
+    print(f"Saved scores to: {output_path}")
+
+    save_abod_model(detector, preprocessor, calibrator, model_dir)
+    print(f"Saved model to: {model_dir}")
+
+    return scores_df
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Train fast ABOD and write scores_abod.csv')
+    parser.add_argument('--input', type=str, default=None, help='Path to master_features.csv')
+    parser.add_argument('--output', type=str, default=None, help='Path to write scores_abod.csv')
+    parser.add_argument('--model-dir', type=str, default=None, help='Directory to save the model')
+    parser.add_argument('--n-neighbors', type=int, default=N_NEIGHBORS, help='Neighbors per customer')
+    parser.add_argument('--backend', type=str, default='auto',
+                        choices=list(NEIGHBOR_BACKENDS), help='Neighbor search backend')
+    args = parser.parse_args()
+
+    main(args.input, args.output, args.model_dir, args.n_neighbors, args.backend)
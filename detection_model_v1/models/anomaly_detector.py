@@ -2,12 +2,19 @@
 Isolation Forest Anomaly Detection
 
 Trains Isolation Forest model and generates anomaly scores.
-Outputs scores in 0-1 range where higher = more anomalous.
+Outputs scores in 0-1 range where higher = more anomalous, calibrated
+against the training score distribution (see models/calibration.py).
+
+Besides training from scratch, a saved forest can be updated in place
+(warm start): each run retires the oldest trees, up to a per-run tree
+budget, and grows as many replacements on a reservoir sample of the
+current customers. The preprocessor stays frozen so the surviving trees'
+splits keep their meaning; every tree records the run (generation) that
+grew it.
 """
 
 import pandas as pd
 import numpy as np
-from sklearn.ensemble import IsolationForest
 from pathlib import Path
 import pickle
 import sys
@@ -16,85 +23,241 @@ import sys
 sys.path.append(str(Path(__file__).parent.parent))
 
 from preprocessing.data_preprocessor import preprocess_features, save_scaler, load_scaler
+from preprocessing.feature_loader import load_master_features
+from models.calibration import ScoreCalibrator
+from models.flat_forest import FlatIsolationForest, flatten_forest
+from models.model_bundle import save_bundle, load_bundle, load_calibrator, bundle_exists
+from models.training_set import RESERVOIR_SIZE, ReservoirSampler
+
+# Subdirectory of model_dir holding the memory-mappable model bundle
+BUNDLE_DIR = 'bundle'
+
+# Trees replaced per incremental run (a quarter of the default forest)
+TREE_BUDGET = 25
+
+
+def prepare_training_set(features_df, training_set):
+    """
+    Fit a Preprocessor on the rows and columns a TrainingSetBuilder chooses.
+
+    Returns:
+        preprocessed_df: Every row of features_df through that preprocessor
+        preprocessor: Preprocessor recording the choices (training_set)
+        train_rows: Positions of the training rows in features_df
+    """
+    train_rows, columns, summary = training_set.build(features_df)
+    _, preprocessor = preprocess_features(features_df.iloc[train_rows], fit_scaler=True, columns=columns)
+    preprocessor.training_set = summary
+    return preprocessor.transform(features_df), preprocessor, train_rows
 
 
-def train_isolation_forest(features_df, contamination=0.05, random_state=42, n_estimators=100):
+def train_isolation_forest(features_df, contamination=0.05, random_state=42, n_estimators=100,
+                           preprocessed_df=None, preprocessor=None, warm_start=None,
+                           tree_budget=TREE_BUDGET, reservoir_size=RESERVOIR_SIZE,
+                           training_set=None, max_samples='auto', max_features=1.0, train_rows=None):
     """
     Train Isolation Forest on preprocessed features.
     
     Args:
-        features_df: DataFrame with customer features
+        features_df: DataFrame with customer features (unused when
+            preprocessed_df is given; may be None)
         contamination: Expected proportion of anomalies (default 0.05 = 5%)
         random_state: Random seed for reproducibility
-        n_estimators: Number of trees in the forest
+        n_estimators: Number of trees in the forest (ignored with warm_start)
+        preprocessed_df: Already preprocessed features, to skip preprocessing
+        preprocessor: Preprocessor that produced preprocessed_df
+        warm_start: (detector, preprocessor) of a saved model (see
+            load_warm_start) to update instead of training from scratch.
+            Features go through its preprocessor; preprocessed_df is only
+            reused if it came from that same preprocessor.
+        tree_budget: Warm start only: oldest trees replaced in this run
+        reservoir_size: Warm start only: rows sampled to grow the new trees
+        training_set: TrainingSetBuilder choosing the training rows and
+            columns; a new Preprocessor is fit on them (preprocessed_df is
+            ignored) and records the choices
+        max_samples: Rows drawn per tree (IsolationForest max_samples)
+        max_features: Features drawn per tree (IsolationForest max_features)
+        train_rows: Rows of preprocessed_df to fit on, when preprocessed_df
+            and preprocessor come from prepare_training_set() (default: all)
     
     Returns:
-        detector: Trained Isolation Forest model
-        scaler: Fitted scaler
-        preprocessed_df: Preprocessed features used for training
+        detector: Trained Isolation Forest model (a FlatIsolationForest
+            when warm-started)
+        preprocessor: Fitted Preprocessor (columns, training medians, scaler)
+        preprocessed_df: Every row of features_df through that preprocessor
+            (the trees may have been fit on a sample of it)
     """
-    # Preprocess features
-    preprocessed_df, scaler = preprocess_features(features_df, fit_scaler=True)
+    if warm_start is not None:
+        detector, warm_preprocessor = warm_start
+        if preprocessed_df is None or preprocessor is not warm_preprocessor:
+            preprocessed_df, _ = preprocess_features(features_df, scaler=warm_preprocessor, fit_scaler=False)
+        detector = update_isolation_forest(
+            detector, preprocessed_df, contamination=contamination, random_state=random_state,
+            tree_budget=tree_budget, reservoir_size=reservoir_size
+        )
+        return detector, warm_preprocessor, preprocessed_df
+
+    if training_set is not None:
+        # Fit the preprocessor on the chosen rows and columns only
+        preprocessed_df, preprocessor, train_rows = prepare_training_set(features_df, training_set)
+    # Preprocess features (once per run: callers that already did pass the result)
+    elif preprocessed_df is None:
+        preprocessed_df, preprocessor = preprocess_features(features_df, fit_scaler=True)
+    elif preprocessor is None:
+        raise ValueError("preprocessor is required when passing preprocessed_df")
     
+    # Imported here so scoring from a model bundle never loads sklearn
+    from sklearn.ensemble import IsolationForest
+
     # Train Isolation Forest
     detector = IsolationForest(
         contamination=contamination,
         random_state=random_state,
         n_estimators=n_estimators,
+        max_samples=max_samples,
+        max_features=max_features,
         n_jobs=-1  # Use all available cores
     )
     
-    detector.fit(preprocessed_df)
+    detector.fit(preprocessed_df if train_rows is None else preprocessed_df.iloc[train_rows])
     
-    return detector, scaler, preprocessed_df
+    return detector, preprocessor, preprocessed_df
 
 
-def predict_anomaly_scores(detector, scaler, features_df):
+def update_isolation_forest(detector, preprocessed_df, contamination=0.05, random_state=42,
+                            tree_budget=TREE_BUDGET, reservoir_size=RESERVOIR_SIZE):
     """
-    Generate anomaly scores for customers.
+    Warm-start update: retire the tree_budget oldest trees of a fitted
+    forest and grow as many new ones on a reservoir sample of
+    preprocessed_df. The forest keeps its size and max_samples; the new
+    trees get the next generation number.
     
     Args:
-        detector: Trained Isolation Forest model
-        scaler: Fitted scaler
-        features_df: DataFrame with customer features
+        detector: Fitted IsolationForest or FlatIsolationForest
+        preprocessed_df: Recent customers, run through the model's own preprocessor
+        contamination: Expected proportion of anomalies, for the new offset
+        random_state: Base seed (offset by the generation, so runs differ)
+        tree_budget: Maximum trees replaced
+        reservoir_size: Rows sampled from preprocessed_df to grow the new trees
     
     Returns:
-        scores_df: DataFrame with customer_id and normalized score (0-1)
+        forest: Updated FlatIsolationForest
+    """
+    forest = flatten_forest(detector)
+    X = np.ascontiguousarray(preprocessed_df, dtype=np.float64)
+    n_new = min(int(tree_budget), forest.n_trees)
+    if n_new <= 0:
+        return forest
+    if forest.tree_features.max() >= X.shape[1]:
+        raise ValueError(f"Model was trained on more than the {X.shape[1]} features given")
+
+    generation = forest.generation + 1
+    seed = None if random_state is None else random_state + generation
+    sample = ReservoirSampler(reservoir_size, random_state=seed).add(X).sample
+    if len(sample) < forest.max_samples:
+        raise ValueError(
+            f"Reservoir holds {len(sample)} rows, fewer than the forest's max_samples ({forest.max_samples})"
+        )
+
+    # Imported here so scoring from a model bundle never loads sklearn
+    from sklearn.ensemble import IsolationForest
+
+    # Same tree shape as the survivors: subsample size and features per tree
+    n_tree_features = forest.tree_features.shape[1]
+    replacements = IsolationForest(
+        n_estimators=n_new,
+        max_samples=forest.max_samples,
+        max_features=1.0 if n_tree_features == X.shape[1] else n_tree_features,
+        random_state=seed,
+        n_jobs=-1
+    ).fit(sample)
+    new_trees = flatten_forest(replacements)
+    new_trees.tree_generation[:] = generation
+
+    # Oldest first; ties keep forest order
+    retired = np.argsort(forest.tree_generation, kind='stable')[:n_new]
+    survivors = np.setdiff1d(np.arange(forest.n_trees), retired)
+    parts = [forest.select_trees(survivors), new_trees] if len(survivors) else [new_trees]
+    updated = FlatIsolationForest.concatenate(parts)
+
+    # Threshold as IsolationForest.fit sets it, over all recent customers
+    if contamination == 'auto':
+        updated.offset = -0.5
+    else:
+        updated.offset = float(np.percentile(updated.score_samples(X), 100.0 * contamination))
+    return updated
+
+
+def normalize_anomaly_scores(raw_scores, score_range=None):
     """
-    # Preprocess features using existing scaler
-    preprocessed_df, _ = preprocess_features(features_df, scaler=scaler, fit_scaler=False)
+    Min/max-normalize raw score_samples output to 0-1 where 1 = most
+    anomalous, for models saved without a calibrator.
     
-    # Get anomaly scores (negative scores = more anomalous)
-    anomaly_scores = detector.score_samples(preprocessed_df)
+    Args:
+        raw_scores: Array from detector.score_samples
+        score_range: (min, max) raw score to normalize against (default:
+            the batch's own range)
     
-    # Isolation Forest returns negative scores for anomalies
-    # Normalize to 0-1 range where 1 = most anomalous
-    # Method: shift to positive, then normalize
-    min_score = anomaly_scores.min()
-    max_score = anomaly_scores.max()
+    Returns:
+        Array of scores rounded to 4 decimals
+    """
+    raw_scores = np.asarray(raw_scores, dtype=np.float64)
+    if score_range is None:
+        score_range = (raw_scores.min(), raw_scores.max())
+    min_score, max_score = score_range
     
     if max_score == min_score:
         # All scores are the same
-        normalized_scores = np.ones(len(anomaly_scores)) * 0.5
+        normalized_scores = np.ones(len(raw_scores)) * 0.5
     else:
         # Normalize: (score - min) / (max - min)
         # But we want higher = more anomalous, so invert
-        normalized_scores = 1.0 - ((anomaly_scores - min_score) / (max_score - min_score))
+        normalized_scores = 1.0 - ((raw_scores - min_score) / (max_score - min_score))
+    
+    return np.round(normalized_scores, 4)
+
+
+def predict_anomaly_scores(detector, preprocessor, features_df, preprocessed_df=None, calibrator=None):
+    """
+    Generate anomaly scores for customers.
+    
+    Args:
+        detector: Trained Isolation Forest model (sklearn or
+            FlatIsolationForest; scored through the flat arrays either way)
+        preprocessor: Fitted Preprocessor (or legacy scaler)
+        features_df: DataFrame with customer features
+        preprocessed_df: features_df already run through preprocessor, to
+            skip preprocessing (e.g. the matrix the model was trained on)
+        calibrator: ScoreCalibrator fitted on the training scores. Without
+            one, scores are min/max-normalized over this batch.
+    
+    Returns:
+        scores_df: DataFrame with customer_id and score (0-1, 1 = most anomalous)
+    """
+    # Preprocess features with the frozen training state
+    if preprocessed_df is None:
+        preprocessed_df, _ = preprocess_features(features_df, scaler=preprocessor, fit_scaler=False)
+    
+    # Get anomaly scores (negative scores = more anomalous); the flat
+    # forest gives sklearn's exact scores in one pass over all trees
+    anomaly_scores = flatten_forest(detector).score_samples(preprocessed_df)
+    
+    if calibrator is not None:
+        scores = calibrator.transform(anomaly_scores)
+    else:
+        scores = normalize_anomaly_scores(anomaly_scores)
     
     # Create output DataFrame
     scores_df = pd.DataFrame({
         'customer_id': features_df['customer_id'].values,
-        'score': normalized_scores
+        'score': scores
     })
     
-    # Round to 4 decimal places
-    scores_df['score'] = scores_df['score'].round(4)
-    
     return scores_df
 
 
-def save_model(detector, scaler, model_dir):
-    """Save trained model and scaler"""
+def save_model(detector, preprocessor, model_dir, calibrator=None):
+    """Save trained model, preprocessor and score calibrator (pickles plus a model bundle)"""
     model_dir = Path(model_dir)
     model_dir.mkdir(parents=True, exist_ok=True)
     
@@ -102,22 +265,77 @@ def save_model(detector, scaler, model_dir):
     with open(model_dir / 'isolation_forest.pkl', 'wb') as f:
         pickle.dump(detector, f)
     
-    # Save scaler
-    save_scaler(scaler, model_dir / 'scaler.pkl')
+    # Save preprocessor (and its bare scaler for older readers)
+    save_scaler(preprocessor, model_dir / 'preprocessor.pkl')
+    save_scaler(preprocessor.scaler, model_dir / 'scaler.pkl')
+    
+    # Save flat arrays for fast, sklearn-free loading
+    save_bundle(detector, preprocessor, model_dir / BUNDLE_DIR, calibrator=calibrator)
 
 
-def load_model(model_dir):
-    """Load trained model and scaler"""
+def load_model(model_dir, use_bundle=True, mmap=True):
+    """
+    Load trained model and preprocessor.
+    
+    Args:
+        model_dir: Directory written by save_model()
+        use_bundle: Load the model bundle when present (FlatIsolationForest,
+            same scores); False loads the pickled detector (an sklearn
+            IsolationForest, or a FlatIsolationForest after a warm start)
+        mmap: Memory-map the bundle arrays instead of reading them
+    
+    Returns:
+        detector: FlatIsolationForest or IsolationForest
+        preprocessor: Fitted Preprocessor (or legacy scaler)
+    """
     model_dir = Path(model_dir)
     
+    if use_bundle and bundle_exists(model_dir / BUNDLE_DIR):
+        return load_bundle(model_dir / BUNDLE_DIR, mmap=mmap)
+    
     # Load detector
     with open(model_dir / 'isolation_forest.pkl', 'rb') as f:
         detector = pickle.load(f)
     
-    # Load scaler
-    scaler = load_scaler(model_dir / 'scaler.pkl')
+    # Load preprocessor; models saved before it existed only have scaler.pkl
+    if (model_dir / 'preprocessor.pkl').exists():
+        preprocessor = load_scaler(model_dir / 'preprocessor.pkl')
+    else:
+        preprocessor = load_scaler(model_dir / 'scaler.pkl')
+    
+    return detector, preprocessor
+
+
+def load_warm_start(model_dir):
+    """
+    Saved model to continue training from, or None if model_dir has none.
+    
+    The forest is read into memory (not memory-mapped), so it does not
+    depend on a bundle version that saving the updated model may prune;
+    the preprocessor is the pickled one, which keeps its StandardScaler
+    for scaler.pkl.
+    
+    Returns:
+        (detector, preprocessor) for train_isolation_forest(warm_start=...)
+    """
+    model_dir = Path(model_dir)
+    if not (model_dir / 'isolation_forest.pkl').exists() and not bundle_exists(model_dir / BUNDLE_DIR):
+        return None
     
-    return detector, scaler
+    detector, preprocessor = load_model(model_dir, mmap=False)
+    if (model_dir / 'preprocessor.pkl').exists():
+        preprocessor = load_scaler(model_dir / 'preprocessor.pkl')
+    if not hasattr(preprocessor, 'columns'):
+        raise ValueError(f"Model in {model_dir} has only a legacy scaler; retrain it from scratch")
+    return flatten_forest(detector), preprocessor
+
+
+def load_anomaly_calibrator(model_dir):
+    """ScoreCalibrator saved with the model, or None for models saved without one"""
+    bundle_dir = Path(model_dir) / BUNDLE_DIR
+    if not bundle_exists(bundle_dir):
+        return None
+    return load_calibrator(bundle_dir)
 
 
 def main(input_path=None, output_path=None, model_dir=None):
@@ -146,15 +364,20 @@ def main(input_path=None, output_path=None, model_dir=None):
         raise FileNotFoundError(f"Input file not found: {input_path}")
     
     print("Loading features...")
-    features_df = pd.read_csv(input_path)
+    features_df = load_master_features(input_path)
     print(f"  Loaded {len(features_df):,} customers with {len(features_df.columns)} features")
     
     print("Training Isolation Forest...")
-    detector, scaler, preprocessed_df = train_isolation_forest(features_df)
+    detector, preprocessor, preprocessed_df = train_isolation_forest(features_df)
     print(f"  Trained on {len(preprocessed_df.columns)} features")
     
     print("Generating anomaly scores...")
-    scores_df = predict_anomaly_scores(detector, scaler, features_df)
+    raw_scores = flatten_forest(detector).score_samples(preprocessed_df)
+    calibrator = ScoreCalibrator.fit(raw_scores)
+    scores_df = pd.DataFrame({
+        'customer_id': features_df['customer_id'].values,
+        'score': calibrator.transform(raw_scores)
+    })
     print(f"  Score range: {scores_df['score'].min():.4f} .. {scores_df['score'].max():.4f}")
     print(f"  Mean score: {scores_df['score'].mean():.4f}")
     
@@ -164,7 +387,7 @@ def main(input_path=None, output_path=None, model_dir=None):
     print(f"Saved scores to: {output_path}")
     
     # Save model
-    save_model(detector, scaler, model_dir)
+    save_model(detector, preprocessor, model_dir, calibrator=calibrator)
     print(f"Saved model to: {model_dir}")
     
     return scores_df
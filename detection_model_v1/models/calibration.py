@@ -0,0 +1,75 @@
+"""
+Anomaly Score Calibration
+
+Maps raw Isolation Forest scores (score_samples; lower = more anomalous)
+to a 0-1 anomaly score with a calibration fitted once on the training
+scores, instead of the min/max of whatever batch is being scored.
+
+The calibration is the empirical CDF of the training scores, stored as k
+quantile breakpoints:
+
+    anomaly_score = 1 - ECDF(raw_score)
+
+so 0.97 means "more anomalous than 97% of the training customers". Scoring
+is a binary search over the breakpoints plus a linear interpolation per
+record (O(log k)), independent of the batch, chunk or worker.
+"""
+
+import numpy as np
+
+# Quantile breakpoints kept from the training scores
+N_QUANTILES = 1001
+
+
+class ScoreCalibrator:
+    """
+    Training-score ECDF.
+
+    Attributes:
+        breakpoints: Strictly increasing raw scores (quantiles of the training scores)
+        levels: ECDF value at each breakpoint, non-decreasing in [0, 1]
+    """
+
+    def __init__(self, breakpoints, levels):
+        self.breakpoints = breakpoints
+        self.levels = levels
+
+    @classmethod
+    def fit(cls, raw_scores, n_quantiles=N_QUANTILES):
+        """
+        Fit on the raw training scores.
+
+        Args:
+            raw_scores: detector.score_samples() of the training matrix
+            n_quantiles: Number of quantile breakpoints to keep
+
+        Returns:
+            ScoreCalibrator
+        """
+        raw_scores = np.asarray(raw_scores, dtype=np.float64)
+        if len(raw_scores) == 0:
+            raise ValueError("Cannot calibrate on zero scores")
+        n_quantiles = max(2, min(n_quantiles, len(raw_scores)))
+
+        levels = np.linspace(0.0, 1.0, n_quantiles)
+        breakpoints = np.quantile(raw_scores, levels)
+        # Tied quantiles (repeated scores) keep their highest level, as the
+        # ECDF is right-continuous
+        breakpoints, last = np.unique(breakpoints[::-1], return_index=True)
+        levels = levels[::-1][last]
+        return cls(breakpoints, levels)
+
+    @property
+    def n_quantiles(self):
+        return len(self.breakpoints)
+
+    def cdf(self, raw_scores):
+        """Fraction of training scores at or below each raw score (interpolated)"""
+        raw_scores = np.asarray(raw_scores, dtype=np.float64)
+        if self.n_quantiles == 1:
+            return np.where(raw_scores >= self.breakpoints[0], 1.0, 0.0)
+        return np.interp(raw_scores, self.breakpoints, self.levels, left=0.0, right=1.0)
+
+    def transform(self, raw_scores):
+        """Anomaly score in 0-1 (1 = most anomalous), rounded to 4 decimals"""
+        return np.round(1.0 - self.cdf(raw_scores), 4)
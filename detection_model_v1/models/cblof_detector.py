@@ -0,0 +1,294 @@
+"""
+Cluster-Based Local Outlier Factor
+
+Clusters customers with MiniBatchKMeans, splits the clusters into large
+and small ones (alpha/beta rule of He et al.) and scores each customer by
+its distance to a large cluster:
+
+    customer in a large cluster   distance to its own cluster center
+    customer in a small cluster   distance to the nearest large center
+
+(optionally multiplied by the cluster size). A high CBLOF is more
+anomalous. Distances are computed in row blocks on a thread pool. Writes
+scores_cblof.csv (customer_id, score in 0-1, 1 = most anomalous).
+"""
+
+import pandas as pd
+import numpy as np
+from pathlib import Path
+import pickle
+import sys
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from preprocessing.data_preprocessor import preprocess_features, save_scaler, load_scaler
+from preprocessing.feature_loader import load_master_features
+from models.calibration import ScoreCalibrator
+from models.neighbors import CHUNK_SIZE, KMEANS_BATCH, map_blocks
+
+N_CLUSTERS = 8
+
+# Large clusters hold at least ALPHA of the customers; the boundary is
+# preferably where a cluster is BETA times larger than the next one
+ALPHA = 0.9
+BETA = 5
+
+CBLOF_MODEL_FILE = 'cblof.pkl'
+CBLOF_PREPROCESSOR_FILE = 'cblof_preprocessor.pkl'
+
+
+def split_large_clusters(cluster_sizes, alpha=ALPHA, beta=BETA):
+    """
+    Boolean mask of the large clusters.
+
+    Clusters are taken largest first; the boundary is the first position
+    meeting both the alpha and the beta condition, else the first meeting
+    alpha, else the first meeting beta.
+    """
+    cluster_sizes = np.asarray(cluster_sizes)
+    order = np.argsort(-cluster_sizes, kind='stable')
+    sizes = cluster_sizes[order]
+    if len(sizes) < 2:
+        return np.ones(len(cluster_sizes), dtype=bool)
+
+    positions = np.arange(1, len(sizes))
+    alpha_ok = np.cumsum(sizes)[:-1] >= alpha * sizes.sum()
+    ratios = np.divide(sizes[:-1], sizes[1:], out=np.full(len(positions), np.inf), where=sizes[1:] > 0)
+    beta_ok = ratios >= beta
+
+    for candidates in (alpha_ok & beta_ok, alpha_ok, beta_ok):
+        if candidates.any():
+            n_large = positions[np.argmax(candidates)]
+            break
+    else:
+        raise ValueError("Could not separate large and small clusters; adjust alpha, beta or n_clusters")
+
+    large = np.zeros(len(cluster_sizes), dtype=bool)
+    large[order[:n_large]] = True
+    return large
+
+
+class ClusterBasedDetector:
+    """
+    CBLOF over MiniBatchKMeans clusters.
+
+    Args:
+        n_clusters: Number of clusters
+        alpha, beta: Large/small cluster split parameters
+        use_weights: Multiply distances by the cluster size (original CBLOF)
+        random_state: Clustering seed
+        chunk_size: Rows per block
+        n_jobs: Worker threads (-1 = all cores)
+    """
+
+    def __init__(self, n_clusters=N_CLUSTERS, alpha=ALPHA, beta=BETA, use_weights=False,
+                 random_state=42, chunk_size=CHUNK_SIZE, n_jobs=-1):
+        self.n_clusters = n_clusters
+        self.alpha = alpha
+        self.beta = beta
+        self.use_weights = use_weights
+        self.random_state = random_state
+        self.chunk_size = chunk_size
+        self.n_jobs = n_jobs
+
+    def _cblof(self, X):
+        """CBLOF of each row (higher = more anomalous)"""
+        center_sq = np.einsum('ij,ij->i', self.cluster_centers_, self.cluster_centers_)
+
+        def score(rows):
+            block = X[rows]
+            block_sq = np.einsum('ij,ij->i', block, block)[:, np.newaxis]
+            sq = np.maximum(block_sq - 2.0 * (block @ self.cluster_centers_.T) + center_sq, 0.0)
+            labels = np.argmin(sq, axis=1)
+            own = np.sqrt(sq[np.arange(len(block)), labels])
+            nearest_large = np.sqrt(sq[:, self.large_clusters_].min(axis=1))
+            distances = np.where(self.large_clusters_[labels], own, nearest_large)
+            if self.use_weights:
+                distances = distances * self.cluster_sizes_[labels]
+            return distances
+
+        blocks = map_blocks(score, len(X), self.chunk_size, self.n_jobs)
+        return np.concatenate(blocks) if blocks else np.empty(0)
+
+    def fit(self, X):
+        """
+        Cluster the training matrix.
+
+        Sets training_scores_ (-CBLOF per training row; lower = more
+        anomalous, as score_samples).
+        """
+        from sklearn.cluster import MiniBatchKMeans
+
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        kmeans = MiniBatchKMeans(n_clusters=min(self.n_clusters, len(X)), random_state=self.random_state,
+                                 n_init=3, batch_size=KMEANS_BATCH)
+        labels = kmeans.fit_predict(X)
+        self.cluster_centers_ = kmeans.cluster_centers_
+        self.cluster_sizes_ = np.bincount(labels, minlength=len(self.cluster_centers_))
+        self.large_clusters_ = split_large_clusters(self.cluster_sizes_, self.alpha, self.beta)
+        self.training_scores_ = -self._cblof(X)
+        return self
+
+    def score_samples(self, X):
+        """-CBLOF of new rows (lower = more anomalous)"""
+        return -self._cblof(np.ascontiguousarray(X, dtype=np.float64))
+
+
+def train_cblof(features_df, n_clusters=N_CLUSTERS, alpha=ALPHA, beta=BETA, use_weights=False,
+                random_state=42, n_jobs=-1, preprocessed_df=None, preprocessor=None):
+    """
+    Train CBLOF on preprocessed features.
+
+    Args:
+        features_df: DataFrame with customer features (unused when
+            preprocessed_df is given; may be None)
+        n_clusters: Number of MiniBatchKMeans clusters
+        alpha, beta: Large/small cluster split parameters
+        use_weights: Multiply distances by the cluster size
+        random_state: Clustering seed
+        n_jobs: Worker threads for scoring (-1 = all cores)
+        preprocessed_df: Already preprocessed features, to skip preprocessing
+        preprocessor: Preprocessor that produced preprocessed_df
+
+    Returns:
+        detector: Fitted ClusterBasedDetector
+        preprocessor: Fitted Preprocessor
+        preprocessed_df: Preprocessed features used for training
+    """
+    if preprocessed_df is None:
+        preprocessed_df, preprocessor = preprocess_features(features_df, fit_scaler=True)
+    elif preprocessor is None:
+        raise ValueError("preprocessor is required when passing preprocessed_df")
+
+    detector = ClusterBasedDetector(
+        n_clusters=n_clusters,
+        alpha=alpha,
+        beta=beta,
+        use_weights=use_weights,
+        random_state=random_state,
+        n_jobs=n_jobs
+    )
+    detector.fit(preprocessed_df.to_numpy(dtype=np.float64))
+
+    return detector, preprocessor, preprocessed_df
+
+
+def predict_cblof_scores(detector, preprocessor, features_df, calibrator, preprocessed_df=None):
+    """
+    Score customers against the fitted clusters.
+
+    Args:
+        detector: Fitted ClusterBasedDetector
+        preprocessor: Fitted Preprocessor
+        features_df: DataFrame with customer features
+        calibrator: ScoreCalibrator fitted on the training scores
+        preprocessed_df: features_df already run through preprocessor
+
+    Returns:
+        scores_df: DataFrame with customer_id and score (0-1, 1 = most anomalous)
+    """
+    if preprocessed_df is None:
+        preprocessed_df, _ = preprocess_features(features_df, scaler=preprocessor, fit_scaler=False)
+
+    raw_scores = detector.score_samples(preprocessed_df.to_numpy(dtype=np.float64))
+
+    return pd.DataFrame({
+        'customer_id': features_df['customer_id'].values,
+        'score': calibrator.transform(raw_scores)
+    })
+
+
+def save_cblof_model(detector, preprocessor, calibrator, model_dir):
+    """Save fitted CBLOF (with its calibrator) and preprocessor"""
+    model_dir = Path(model_dir)
+    model_dir.mkdir(parents=True, exist_ok=True)
+
+    with open(model_dir / CBLOF_MODEL_FILE, 'wb') as f:
+        pickle.dump({'detector': detector, 'calibrator': calibrator}, f)
+
+    save_scaler(preprocessor, model_dir / CBLOF_PREPROCESSOR_FILE)
+
+
+def load_cblof_model(model_dir):
+    """
+    Load a model saved by save_cblof_model().
+
+    Returns:
+        detector: ClusterBasedDetector
+        preprocessor: Fitted Preprocessor
+        calibrator: ScoreCalibrator
+    """
+    model_dir = Path(model_dir)
+
+    with open(model_dir / CBLOF_MODEL_FILE, 'rb') as f:
+        saved = pickle.load(f)
+
+    preprocessor = load_scaler(model_dir / CBLOF_PREPROCESSOR_FILE)
+    return saved['detector'], preprocessor, saved['calibrator']
+
+
+def main(input_path=None, output_path=None, model_dir=None, n_clusters=N_CLUSTERS):
+    """
+    Main function to train CBLOF and generate scores.
+
+    Args:
+        input_path: Path to master_features.csv
+        output_path: Path to save scores_cblof.csv
+        model_dir: Directory to save trained model
+        n_clusters: Number of clusters
+    """
+    BASE_DIR = Path(__file__).resolve().parent.parent
+    PROJECT_ROOT = BASE_DIR.parent
+
+    input_path = Path(input_path) if input_path else (
+        PROJECT_ROOT / 'clean_data' / 'features' / 'final' / 'master_features.csv'
+    )
+    output_path = Path(output_path) if output_path else (
+        BASE_DIR / 'data' / 'intermediate' / 'scores_cblof.csv'
+    )
+    model_dir = Path(model_dir) if model_dir else (BASE_DIR / 'models' / 'saved')
+
+    if not input_path.exists():
+        raise FileNotFoundError(f"Input file not found: {input_path}")
+
+    print("Loading features...")
+    features_df = load_master_features(input_path)
+    print(f"  Loaded {len(features_df):,} customers with {len(features_df.columns)} features")
+
+    print(f"Training CBLOF (n_clusters={n_clusters})...")
+    detector, preprocessor, preprocessed_df = train_cblof(features_df, n_clusters=n_clusters)
+    print(f"  Trained on {len(preprocessed_df.columns)} features, "
+          f"{int(detector.large_clusters_.sum())} of {len(detector.cluster_sizes_)} clusters large")
+
+    print("Generating anomaly scores...")
+    raw_scores = detector.training_scores_
+    calibrator = ScoreCalibrator.fit(raw_scores)
+    scores_df = pd.DataFrame({
+        'customer_id': features_df['customer_id'].values,
+        'score': calibrator.transform(raw_scores)
+    })
+    print(f"  Score range: {scores_df['score'].min():.4f} .. {scores_df['score'].max():.4f}")
+    print(f"  Mean score: {scores_df['score'].mean():.4f}")
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    scores_df.to_csv(output_path, index=False)
+    print(f"Saved scores to: {output_path}")
+
+    save_cblof_model(detector, preprocessor, calibrator, model_dir)
+    print(f"Saved model to: {model_dir}")
+
+    return scores_df
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Train CBLOF and write scores_cblof.csv')
+    parser.add_argument('--input', type=str, default=None, help='Path to master_features.csv')
+    parser.add_argument('--output', type=str, default=None, help='Path to write scores_cblof.csv')
+    parser.add_argument('--model-dir', type=str, default=None, help='Directory to save the model')
+    parser.add_argument('--n-clusters', type=int, default=N_CLUSTERS, help='Number of clusters')
+    args = parser.parse_args()
+
+    main(args.input, args.output, args.model_dir, args.n_clusters)
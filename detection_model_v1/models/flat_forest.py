@@ -0,0 +1,362 @@
+"""
+Flattened Isolation Forest
+
+Holds a fitted IsolationForest as flat NumPy node arrays (all trees
+concatenated) and scores samples without sklearn. Produces the same
+values as IsolationForest.score_samples.
+
+Per node the arrays store the split feature and threshold, the global
+index of both children (-1 at leaves) and the leaf path length
+(depth + average_path_length(n_node_samples) - 1), which is what sklearn
+adds up per tree, plus where a NaN goes at each split (missing_left).
+
+For scoring the arrays are packed once more (_PackedNodes): children
+interleaved in one array with leaves pointing at themselves, split columns
+resolved to input columns, and thresholds rounded down to float32. Every
+(tree, row) pair then takes exactly max_depth branch-free steps of flat
+gathers over a row block, with no per-tree Python loop.
+
+Trees can be dropped (select_trees) and forests joined (concatenate), which
+is how incremental retraining swaps old trees for new ones; tree_generation
+records which training run grew each tree.
+"""
+
+import numpy as np
+
+# Rows per scoring pass
+BLOCK_SIZE = 512
+
+# Array name -> dtype, in the order they are stored in a model bundle
+FOREST_ARRAYS = {
+    'feature': np.int32,
+    'threshold': np.float64,
+    'left': np.int32,
+    'right': np.int32,
+    'leaf_value': np.float64,
+    'tree_offsets': np.int64,
+    'tree_features': np.int32,
+    'missing_left': np.uint8,
+    'tree_generation': np.int32,
+}
+
+
+def average_path_length(n_samples_leaf):
+    """
+    Average path length of an unsuccessful BST search in an n-sample tree
+    (same formula as sklearn's isolation forest).
+    """
+    n_samples_leaf = np.asarray(n_samples_leaf, dtype=np.float64)
+    result = np.zeros(n_samples_leaf.shape)
+    mask_2 = n_samples_leaf == 2
+    not_mask = n_samples_leaf > 2
+    result[mask_2] = 1.0
+    result[not_mask] = (
+        2.0 * (np.log(n_samples_leaf[not_mask] - 1.0) + np.euler_gamma)
+        - 2.0 * (n_samples_leaf[not_mask] - 1.0) / n_samples_leaf[not_mask]
+    )
+    return result
+
+
+def _node_depths(left, right):
+    """Depth of every node, root = 1 (matches Tree.compute_node_depths)"""
+    depths = np.zeros(len(left), dtype=np.int64)
+    depths[0] = 1
+    # Children always have a larger index than their parent
+    for node in range(len(left)):
+        if left[node] != -1:
+            depths[left[node]] = depths[node] + 1
+            depths[right[node]] = depths[node] + 1
+    return depths
+
+
+def _float32_floor(values):
+    """
+    Largest float32 <= each float64 value. For float32 x,
+    x <= t  <=>  x <= _float32_floor(t), so splits can compare in float32.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    rounded = values.astype(np.float32)
+    above = rounded.astype(np.float64) > values
+    rounded[above] = np.nextafter(rounded[above], np.float32(-np.inf))
+    return rounded
+
+
+class _PackedNodes:
+    """
+    Scoring layout of a forest's nodes.
+
+    Attributes:
+        children: (2 * n_nodes) next node; [2n] if the row goes left, [2n + 1]
+            if right. Leaves point to themselves on both sides.
+        columns: Input column of each node's split (0 at leaves)
+        threshold: float32 split thresholds (see _float32_floor)
+        missing_left: True where a NaN goes left; None if it never does
+        n_levels: Steps needed to reach a leaf from any root
+    """
+
+    def __init__(self, forest):
+        n_nodes = len(forest.left)
+        nodes = np.arange(n_nodes)
+        is_leaf = forest.left == -1
+
+        self.children = np.empty(2 * n_nodes, dtype=np.intp)
+        self.children[0::2] = np.where(is_leaf, nodes, forest.left)
+        self.children[1::2] = np.where(is_leaf, nodes, forest.right)
+        self.columns = forest._node_columns()
+        self.threshold = _float32_floor(forest.threshold)
+        missing_left = np.asarray(forest.missing_left, dtype=bool) & ~is_leaf
+        self.missing_left = missing_left if missing_left.any() else None
+        self.roots = forest.tree_offsets[:-1].astype(np.intp)
+
+        # Deepest root-to-leaf path, walking all trees one level at a time
+        self.n_levels = 0
+        frontier = self.roots[~is_leaf[self.roots]]
+        while frontier.size:
+            self.n_levels += 1
+            frontier = np.concatenate([forest.left[frontier], forest.right[frontier]])
+            frontier = frontier[~is_leaf[frontier]]
+
+
+class FlatIsolationForest:
+    """
+    Isolation Forest scorer over flat node arrays.
+
+    Args:
+        feature, threshold, left, right, leaf_value: Per-node arrays for all
+            trees; left/right are global node indices, -1 at leaves
+        tree_offsets: Index of each tree's root, plus the total node count
+        tree_features: (n_trees x n_tree_features) columns each tree was fit on
+        missing_left: Per node, 1 if a NaN input goes to the left child
+            (default: all right, as a plain `x <= threshold` test)
+        max_samples: Samples drawn per tree at fit time
+        offset: IsolationForest.offset_ (decision_function = score - offset)
+        tree_generation: Per tree, the training run that grew it (default:
+            all 0; see anomaly_detector.update_isolation_forest)
+    """
+
+    def __init__(self, feature, threshold, left, right, leaf_value, tree_offsets, tree_features,
+                 max_samples, offset=-0.5, missing_left=None, tree_generation=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.leaf_value = leaf_value
+        self.tree_offsets = tree_offsets
+        self.tree_features = tree_features
+        self.missing_left = np.zeros(len(left), dtype=np.uint8) if missing_left is None else missing_left
+        self.max_samples = int(max_samples)
+        self.offset = float(offset)
+        n_trees = len(tree_offsets) - 1
+        self.tree_generation = np.zeros(n_trees, dtype=np.int32) if tree_generation is None else tree_generation
+        self._columns = None
+        self._packed = None
+
+    def __getstate__(self):
+        # Scoring caches are rebuilt on first use
+        state = self.__dict__.copy()
+        state['_columns'] = None
+        state['_packed'] = None
+        return state
+
+    @classmethod
+    def from_sklearn(cls, detector):
+        """Flatten a fitted sklearn IsolationForest"""
+        feature, threshold, left, right, leaf_value, missing_left, offsets = [], [], [], [], [], [], [0]
+        for estimator in detector.estimators_:
+            tree = estimator.tree_
+            base = offsets[-1]
+            is_leaf = tree.children_left == -1
+            depths = _node_depths(tree.children_left, tree.children_right)
+
+            feature.append(tree.feature)
+            threshold.append(tree.threshold)
+            left.append(np.where(is_leaf, -1, tree.children_left + base))
+            right.append(np.where(is_leaf, -1, tree.children_right + base))
+            # Same operation order as sklearn: (depth + avg_path_length) - 1.0
+            leaf_value.append(depths + average_path_length(tree.n_node_samples) - 1.0)
+            missing_left.append(getattr(tree, 'missing_go_to_left', np.zeros(tree.node_count, dtype=np.uint8)))
+            offsets.append(base + tree.node_count)
+
+        # Trees only see a column subset when max_features < n_features;
+        # otherwise estimators_features_ is an unused permutation
+        n_features = detector.n_features_in_
+        if detector._max_features == n_features:
+            tree_features = np.tile(np.arange(n_features), (len(detector.estimators_), 1))
+        else:
+            tree_features = np.asarray(detector.estimators_features_)
+
+        return cls(
+            feature=np.concatenate(feature).astype(np.int32),
+            threshold=np.concatenate(threshold).astype(np.float64),
+            left=np.concatenate(left).astype(np.int32),
+            right=np.concatenate(right).astype(np.int32),
+            leaf_value=np.concatenate(leaf_value).astype(np.float64),
+            tree_offsets=np.asarray(offsets, dtype=np.int64),
+            tree_features=tree_features.astype(np.int32),
+            missing_left=np.concatenate(missing_left).astype(np.uint8),
+            max_samples=detector.max_samples_,
+            offset=detector.offset_,
+        )
+
+    @classmethod
+    def concatenate(cls, forests, offset=None):
+        """
+        One forest holding the trees of several, in order.
+
+        Args:
+            forests: FlatIsolationForests fit with the same max_samples and
+                number of features per tree
+            offset: offset of the result (default: the first forest's)
+        """
+        forests = list(forests)
+        if not forests:
+            raise ValueError("No forests to concatenate")
+        first = forests[0]
+        for forest in forests[1:]:
+            if forest.max_samples != first.max_samples:
+                raise ValueError(
+                    f"Cannot mix forests with max_samples {first.max_samples} and {forest.max_samples}"
+                )
+            if forest.tree_features.shape[1] != first.tree_features.shape[1]:
+                raise ValueError("Cannot mix forests with different features per tree")
+
+        # Shift each forest's child pointers and tree offsets past the nodes before it
+        node_base = np.cumsum([0] + [len(forest.left) for forest in forests[:-1]])
+        left = [np.where(f.left == -1, -1, f.left + base) for f, base in zip(forests, node_base)]
+        right = [np.where(f.right == -1, -1, f.right + base) for f, base in zip(forests, node_base)]
+        offsets = [np.zeros(1, dtype=np.int64)] + [f.tree_offsets[1:] + base for f, base in zip(forests, node_base)]
+
+        return cls(
+            feature=np.concatenate([f.feature for f in forests]).astype(np.int32),
+            threshold=np.concatenate([f.threshold for f in forests]).astype(np.float64),
+            left=np.concatenate(left).astype(np.int32),
+            right=np.concatenate(right).astype(np.int32),
+            leaf_value=np.concatenate([f.leaf_value for f in forests]).astype(np.float64),
+            tree_offsets=np.concatenate(offsets).astype(np.int64),
+            tree_features=np.concatenate([f.tree_features for f in forests]).astype(np.int32),
+            missing_left=np.concatenate([f.missing_left for f in forests]).astype(np.uint8),
+            tree_generation=np.concatenate([f.tree_generation for f in forests]).astype(np.int32),
+            max_samples=first.max_samples,
+            offset=first.offset if offset is None else offset,
+        )
+
+    def select_trees(self, trees):
+        """Forest of the given trees (positions, in the order given), nodes renumbered"""
+        trees = np.asarray(trees, dtype=np.intp)
+        if not len(trees):
+            raise ValueError("A forest needs at least one tree")
+        starts = self.tree_offsets[trees]
+        sizes = self.tree_offsets[trees + 1] - starts
+        new_offsets = np.concatenate([[0], np.cumsum(sizes)])
+        # Old node index of every kept node, and the shift to its new index
+        shift = np.repeat(new_offsets[:-1] - starts, sizes)
+        nodes = np.arange(new_offsets[-1]) - shift
+
+        return FlatIsolationForest(
+            feature=self.feature[nodes],
+            threshold=self.threshold[nodes],
+            left=np.where(self.left[nodes] == -1, -1, self.left[nodes] + shift).astype(np.int32),
+            right=np.where(self.right[nodes] == -1, -1, self.right[nodes] + shift).astype(np.int32),
+            leaf_value=self.leaf_value[nodes],
+            tree_offsets=new_offsets.astype(np.int64),
+            tree_features=self.tree_features[trees],
+            missing_left=self.missing_left[nodes],
+            tree_generation=self.tree_generation[trees],
+            max_samples=self.max_samples,
+            offset=self.offset,
+        )
+
+    @property
+    def n_trees(self):
+        return len(self.tree_offsets) - 1
+
+    @property
+    def generation(self):
+        """Latest training run that grew trees in this forest"""
+        return int(self.tree_generation.max()) if self.n_trees else 0
+
+    def arrays(self):
+        """Dict of the node arrays (see FOREST_ARRAYS)"""
+        return {name: getattr(self, name) for name in FOREST_ARRAYS}
+
+    def _node_columns(self):
+        """Input column of every node's split (tree_features resolved), cached"""
+        if self._columns is None:
+            node_tree = np.repeat(np.arange(self.n_trees), np.diff(self.tree_offsets))
+            local = np.maximum(self.feature, 0)
+            self._columns = self.tree_features[node_tree, local].astype(np.intp)
+        return self._columns
+
+    def _packed_nodes(self):
+        if self._packed is None:
+            self._packed = _PackedNodes(self)
+        return self._packed
+
+    def apply(self, X):
+        """Leaf node index of every (tree, row) pair, shape (n_trees x n_rows)"""
+        return self._leaves(X).T
+
+    def _leaves(self, X):
+        """
+        Leaf node index per (row, tree), shape (n_rows x n_trees).
+
+        All trees descend together: each step moves every (row, tree) pair
+        one level down (leaves stay put), so a block costs max_depth
+        vectorized steps regardless of tree count.
+        """
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_rows, n_features = X.shape
+        packed = self._packed_nodes()
+        values = X.ravel()
+        nan_splits = packed.missing_left is not None and np.isnan(values).any()
+
+        # Pairs are row-major (row, tree): consecutive gathers hit the same
+        # input row. Indices are in range by construction, so take() skips
+        # bounds checks (mode='clip').
+        node = np.tile(packed.roots, n_rows)
+        row_start = np.repeat(np.arange(n_rows, dtype=np.intp) * n_features, self.n_trees)
+        index = np.empty_like(node)
+        go_right = np.empty(node.size, dtype=bool)
+        for _ in range(packed.n_levels):
+            np.take(packed.columns, node, out=index, mode='clip')
+            index += row_start
+            x = values.take(index, mode='clip')
+            # NaN compares False and goes right unless the split sends it left
+            np.less_equal(x, packed.threshold.take(node, mode='clip'), out=go_right)
+            np.logical_not(go_right, out=go_right)
+            if nan_splits:
+                go_right &= ~(np.isnan(x) & packed.missing_left.take(node, mode='clip'))
+            node <<= 1
+            node += go_right
+            np.take(packed.children, node, out=node, mode='clip')
+        return node.reshape(n_rows, self.n_trees)
+
+    def score_samples(self, X, block_size=BLOCK_SIZE):
+        """
+        Opposite of the anomaly score (lower = more abnormal), as
+        IsolationForest.score_samples.
+
+        Args:
+            X: (n_rows x n_features) array or DataFrame in training column order
+            block_size: Rows scored per pass (bounds the n_trees x rows work arrays)
+        """
+        # sklearn casts inputs to float32 before walking the trees
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        depths = np.zeros(X.shape[0])
+        for start in range(0, X.shape[0], block_size):
+            path_lengths = self.leaf_value.take(self._leaves(X[start:start + block_size]), mode='clip')
+            # cumsum adds tree by tree, in the same order as sklearn's loop
+            depths[start:start + block_size] = np.cumsum(path_lengths, axis=1)[:, -1]
+
+        denominator = self.n_trees * average_path_length(np.array([self.max_samples]))[0]
+        if denominator == 0:
+            return -np.ones(X.shape[0])
+        return -(2 ** (-(depths / denominator)))
+
+    def decision_function(self, X):
+        return self.score_samples(X) - self.offset
+
+
+def flatten_forest(detector):
+    """FlatIsolationForest for a fitted IsolationForest (returned as is if already flat)"""
+    return detector if isinstance(detector, FlatIsolationForest) else FlatIsolationForest.from_sklearn(detector)
@@ -0,0 +1,265 @@
+"""
+Local Outlier Factor Anomaly Detection
+
+Production version of scripts/partner_models/individual_LOF.py: trains LOF
+on the same preprocessed features as the Isolation Forest and writes
+scores_lof.csv (customer_id, score in 0-1, 1 = most anomalous).
+
+The neighbor search goes through models/neighbors.py, so the backend is a
+parameter (kd_tree, ball_tree, brute, auto, or approx for an inverted-file
+approximate search) and queries run in chunks on a thread pool. The fitted
+model keeps the training matrix, k-distances and local reachability
+densities, so new customers are scored against the training set (novelty
+scoring) without refitting.
+"""
+
+import pandas as pd
+import numpy as np
+from pathlib import Path
+import pickle
+import sys
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from preprocessing.data_preprocessor import preprocess_features, save_scaler, load_scaler
+from preprocessing.feature_loader import load_master_features
+from models.calibration import ScoreCalibrator
+from models.neighbors import CHUNK_SIZE, NEIGHBOR_BACKENDS, kneighbors_chunked, make_neighbor_index
+
+# Partner model setting (LocalOutlierFactor(n_neighbors=215))
+N_NEIGHBORS = 215
+
+LOF_MODEL_FILE = 'lof.pkl'
+LOF_PREPROCESSOR_FILE = 'lof_preprocessor.pkl'
+
+
+class LocalOutlierFactorDetector:
+    """
+    LOF with a pluggable neighbor backend; the same scores as sklearn's
+    LocalOutlierFactor for the exact backends.
+
+    Args:
+        n_neighbors: Neighbors per point (capped at n_samples - 1)
+        backend: Neighbor backend name (see models.neighbors.NEIGHBOR_BACKENDS)
+        backend_params: Extra arguments for the backend
+        chunk_size: Query rows per kNN block
+        n_jobs: Worker threads for kNN queries (-1 = all cores)
+    """
+
+    def __init__(self, n_neighbors=N_NEIGHBORS, backend='auto', backend_params=None,
+                 chunk_size=CHUNK_SIZE, n_jobs=-1):
+        self.n_neighbors = n_neighbors
+        self.backend = backend
+        self.backend_params = backend_params or {}
+        self.chunk_size = chunk_size
+        self.n_jobs = n_jobs
+        self._index = None
+
+    def __getstate__(self):
+        # The neighbor index is rebuilt from the training matrix on load
+        state = self.__dict__.copy()
+        state['_index'] = None
+        return state
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = make_neighbor_index(self.backend, **self.backend_params).fit(self.fit_X_)
+        return self._index
+
+    def _kneighbors(self, X, exclude_self=False):
+        return kneighbors_chunked(self.index, X, self.n_neighbors_, exclude_self=exclude_self,
+                                  chunk_size=self.chunk_size, n_jobs=self.n_jobs)
+
+    def _local_reachability_density(self, distances, indices):
+        """1 / mean reachability distance to the neighbors"""
+        reach = np.maximum(distances, self.k_distance_[indices])
+        return 1.0 / (np.mean(reach, axis=1) + 1e-10)
+
+    def fit(self, X):
+        """
+        Fit on the training matrix.
+
+        Sets negative_outlier_factor_ (one per training row; lower = more
+        anomalous, as sklearn).
+        """
+        self.fit_X_ = np.ascontiguousarray(X, dtype=np.float64)
+        if len(self.fit_X_) < 2:
+            raise ValueError("LOF needs at least 2 samples")
+        self.n_neighbors_ = max(1, min(self.n_neighbors, len(self.fit_X_) - 1))
+        self._index = None
+
+        distances, indices = self._kneighbors(self.fit_X_, exclude_self=True)
+        self.k_distance_ = distances[:, -1].copy()
+        self.lrd_ = self._local_reachability_density(distances, indices)
+        self.negative_outlier_factor_ = -np.mean(self.lrd_[indices] / self.lrd_[:, np.newaxis], axis=1)
+        return self
+
+    def score_samples(self, X):
+        """
+        Novelty score of new rows against the training set (lower = more
+        anomalous); rows are not compared to each other.
+        """
+        distances, indices = self._kneighbors(X)
+        lrd = self._local_reachability_density(distances, indices)
+        return -np.mean(self.lrd_[indices] / lrd[:, np.newaxis], axis=1)
+
+
+def train_lof(features_df, n_neighbors=N_NEIGHBORS, backend='auto', n_jobs=-1,
+              preprocessed_df=None, preprocessor=None, **backend_params):
+    """
+    Train LOF on preprocessed features.
+
+    Args:
+        features_df: DataFrame with customer features (unused when
+            preprocessed_df is given; may be None)
+        n_neighbors: Neighbors per customer
+        backend: 'auto', 'kd_tree', 'ball_tree', 'brute' or 'approx'
+        n_jobs: Worker threads for kNN queries (-1 = all cores)
+        preprocessed_df: Already preprocessed features, to skip preprocessing
+        preprocessor: Preprocessor that produced preprocessed_df
+        backend_params: Extra neighbor backend arguments (e.g. n_probe)
+
+    Returns:
+        detector: Fitted LocalOutlierFactorDetector
+        preprocessor: Fitted Preprocessor
+        preprocessed_df: Preprocessed features used for training
+    """
+    if preprocessed_df is None:
+        preprocessed_df, preprocessor = preprocess_features(features_df, fit_scaler=True)
+    elif preprocessor is None:
+        raise ValueError("preprocessor is required when passing preprocessed_df")
+
+    detector = LocalOutlierFactorDetector(
+        n_neighbors=n_neighbors,
+        backend=backend,
+        backend_params=backend_params,
+        n_jobs=n_jobs
+    )
+    detector.fit(preprocessed_df.to_numpy(dtype=np.float64))
+
+    return detector, preprocessor, preprocessed_df
+
+
+def predict_lof_scores(detector, preprocessor, features_df, calibrator, preprocessed_df=None):
+    """
+    Score customers against the training set (novelty scoring).
+
+    Args:
+        detector: Fitted LocalOutlierFactorDetector
+        preprocessor: Fitted Preprocessor
+        features_df: DataFrame with customer features
+        calibrator: ScoreCalibrator fitted on the training LOF scores
+        preprocessed_df: features_df already run through preprocessor
+
+    Returns:
+        scores_df: DataFrame with customer_id and score (0-1, 1 = most anomalous)
+    """
+    if preprocessed_df is None:
+        preprocessed_df, _ = preprocess_features(features_df, scaler=preprocessor, fit_scaler=False)
+
+    raw_scores = detector.score_samples(preprocessed_df.to_numpy(dtype=np.float64))
+
+    return pd.DataFrame({
+        'customer_id': features_df['customer_id'].values,
+        'score': calibrator.transform(raw_scores)
+    })
+
+
+def save_lof_model(detector, preprocessor, calibrator, model_dir):
+    """Save fitted LOF (with its calibrator) and preprocessor"""
+    model_dir = Path(model_dir)
+    model_dir.mkdir(parents=True, exist_ok=True)
+
+    with open(model_dir / LOF_MODEL_FILE, 'wb') as f:
+        pickle.dump({'detector': detector, 'calibrator': calibrator}, f)
+
+    save_scaler(preprocessor, model_dir / LOF_PREPROCESSOR_FILE)
+
+
+def load_lof_model(model_dir):
+    """
+    Load a model saved by save_lof_model().
+
+    Returns:
+        detector: LocalOutlierFactorDetector (neighbor index rebuilt on first use)
+        preprocessor: Fitted Preprocessor
+        calibrator: ScoreCalibrator
+    """
+    model_dir = Path(model_dir)
+
+    with open(model_dir / LOF_MODEL_FILE, 'rb') as f:
+        saved = pickle.load(f)
+
+    preprocessor = load_scaler(model_dir / LOF_PREPROCESSOR_FILE)
+    return saved['detector'], preprocessor, saved['calibrator']
+
+
+def main(input_path=None, output_path=None, model_dir=None, n_neighbors=N_NEIGHBORS, backend='auto'):
+    """
+    Main function to train LOF and generate scores.
+
+    Args:
+        input_path: Path to master_features.csv
+        output_path: Path to save scores_lof.csv
+        model_dir: Directory to save trained model
+        n_neighbors: Neighbors per customer
+        backend: Neighbor backend ('auto', 'kd_tree', 'ball_tree', 'brute', 'approx')
+    """
+    BASE_DIR = Path(__file__).resolve().parent.parent
+    PROJECT_ROOT = BASE_DIR.parent
+
+    input_path = Path(input_path) if input_path else (
+        PROJECT_ROOT / 'clean_data' / 'features' / 'final' / 'master_features.csv'
+    )
+    output_path = Path(output_path) if output_path else (
+        BASE_DIR / 'data' / 'intermediate' / 'scores_lof.csv'
+    )
+    model_dir = Path(model_dir) if model_dir else (BASE_DIR / 'models' / 'saved')
+
+    if not input_path.exists():
+        raise FileNotFoundError(f"Input file not found: {input_path}")
+
+    print("Loading features...")
+    features_df = load_master_features(input_path)
+    print(f"  Loaded {len(features_df):,} customers with {len(features_df.columns)} features")
+
+    print(f"Training LOF (n_neighbors={n_neighbors}, backend={backend})...")
+    detector, preprocessor, preprocessed_df = train_lof(features_df, n_neighbors=n_neighbors, backend=backend)
+    print(f"  Trained on {len(preprocessed_df.columns)} features")
+
+    print("Generating anomaly scores...")
+    # Training customers are scored by their own fit-time LOF (self excluded)
+    raw_scores = detector.negative_outlier_factor_
+    calibrator = ScoreCalibrator.fit(raw_scores)
+    scores_df = pd.DataFrame({
+        'customer_id': features_df['customer_id'].values,
+        'score': calibrator.transform(raw_scores)
+    })
+    print(f"  Score range: {scores_df['score'].min():.4f} .. {scores_df['score'].max():.4f}")
+    print(f"  Mean score: {scores_df['score'].mean():.4f}")
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    scores_df.to_csv(output_path, index=False)
+    print(f"Saved scores to: {output_path}")
+
+    save_lof_model(detector, preprocessor, calibrator, model_dir)
+    print(f"Saved model to: {model_dir}")
+
+    return scores_df
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Train LOF and write scores_lof.csv')
+    parser.add_argument('--input', type=str, default=None, help='Path to master_features.csv')
+    parser.add_argument('--output', type=str, default=None, help='Path to write scores_lof.csv')
+    parser.add_argument('--model-dir', type=str, default=None, help='Directory to save the model')
+    parser.add_argument('--n-neighbors', type=int, default=N_NEIGHBORS, help='Neighbors per customer')
+    parser.add_argument('--backend', type=str, default='auto',
+                        choices=list(NEIGHBOR_BACKENDS), help='Neighbor search backend')
+    args = parser.parse_args()
+
+    main(args.input, args.output, args.model_dir, args.n_neighbors, args.backend)
@@ -0,0 +1,208 @@
+"""
+Model Bundle
+
+Versioned on-disk format for a fitted Isolation Forest and its Preprocessor
+that loads without unpickling or importing sklearn:
+
+    bundle/
+        CURRENT                    live version (utils.versioned_dir)
+        vNNNNNN/
+            manifest.json          format version, feature list and plan, forest
+                                   params, tree generations, training set choices,
+                                   sha256 per array file and of the whole bundle
+            forest_<name>.npy      flat tree arrays (see flat_forest.FOREST_ARRAYS)
+            preprocessor_<name>.npy  nan_fill, inf_fill, mean, scale vectors
+            calibration_<name>.npy   anomaly score calibration (optional)
+
+Arrays are memory-mapped read-only by default, so loading is near-instant
+and the OS page cache shares one copy across worker processes. Each save
+writes a new version directory and then switches CURRENT, so workers that
+have a version mapped never see its files rewritten. Bundles written
+before versioning (files directly in bundle/) still load.
+"""
+
+import hashlib
+import json
+
+import numpy as np
+
+from utils.versioned_dir import current_version, publish_version
+
+from .calibration import ScoreCalibrator
+from .flat_forest import FOREST_ARRAYS, FlatIsolationForest, flatten_forest
+
+BUNDLE_FORMAT = 'aml-isolation-forest-bundle'
+BUNDLE_VERSION = 2
+# Version 1 bundles have no forest_missing_left (NaN always goes right).
+# forest_tree_generation is optional in both: without it every tree is
+# generation 0.
+SUPPORTED_VERSIONS = (1, 2)
+MANIFEST_FILE = 'manifest.json'
+
+# Preprocessor vectors stored in a bundle (one value per feature)
+PREPROCESSOR_ARRAYS = ('nan_fill', 'inf_fill', 'mean', 'scale')
+
+# ScoreCalibrator arrays
+CALIBRATION_ARRAYS = ('breakpoints', 'levels')
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _bundle_checksum(files):
+    """Checksum over every array file's name and digest"""
+    digest = hashlib.sha256()
+    for name in sorted(files):
+        digest.update(f"{name}:{files[name]}\n".encode())
+    return digest.hexdigest()
+
+
+def resolve_bundle(bundle_dir):
+    """Directory of the live version of a bundle (bundle_dir itself for unversioned bundles)"""
+    return current_version(bundle_dir)
+
+
+def bundle_exists(bundle_dir):
+    """Whether bundle_dir holds a saved bundle"""
+    return (resolve_bundle(bundle_dir) / MANIFEST_FILE).exists()
+
+
+def save_bundle(detector, preprocessor, bundle_dir, calibrator=None):
+    """
+    Write a model bundle as a new version of bundle_dir.
+
+    Args:
+        detector: Fitted sklearn IsolationForest or FlatIsolationForest
+        preprocessor: Fitted Preprocessor
+        bundle_dir: Bundle directory (created if missing)
+        calibrator: Optional ScoreCalibrator fitted on the training scores
+
+    Returns:
+        manifest: Dict written to manifest.json
+    """
+    forest = flatten_forest(detector)
+
+    arrays = {}
+    for name, dtype in FOREST_ARRAYS.items():
+        arrays[f'forest_{name}'] = np.ascontiguousarray(getattr(forest, name), dtype=dtype)
+    for name in PREPROCESSOR_ARRAYS:
+        arrays[f'preprocessor_{name}'] = np.ascontiguousarray(getattr(preprocessor, name), dtype=np.float64)
+    if calibrator is not None:
+        for name in CALIBRATION_ARRAYS:
+            arrays[f'calibration_{name}'] = np.ascontiguousarray(getattr(calibrator, name), dtype=np.float64)
+
+    with publish_version(bundle_dir) as version_dir:
+        files = {}
+        for key, array in arrays.items():
+            filename = f'{key}.npy'
+            np.save(version_dir / filename, array, allow_pickle=False)
+            files[filename] = _sha256(version_dir / filename)
+        manifest = _manifest(forest, preprocessor, calibrator, files)
+        with open(version_dir / MANIFEST_FILE, 'w') as f:
+            json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def _manifest(forest, preprocessor, calibrator, files):
+    return {
+        'format': BUNDLE_FORMAT,
+        'format_version': BUNDLE_VERSION,
+        'features': list(preprocessor.columns),
+        'feature_plan': preprocessor.plan.to_dict() if getattr(preprocessor, 'plan', None) is not None else None,
+        'n_trees': forest.n_trees,
+        'max_samples': forest.max_samples,
+        'offset': forest.offset,
+        'generation': forest.generation,
+        'trees_per_generation': {
+            str(generation): int(count)
+            for generation, count in zip(*np.unique(forest.tree_generation, return_counts=True))
+        },
+        'calibrated': calibrator is not None,
+        'training_set': getattr(preprocessor, 'training_set', None),
+        'files': files,
+        'checksum': _bundle_checksum(files),
+    }
+
+
+def read_manifest(bundle_dir):
+    """Read and validate the manifest of a bundle's live version"""
+    path = resolve_bundle(bundle_dir) / MANIFEST_FILE
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != BUNDLE_FORMAT:
+        raise ValueError(f"Not a model bundle: {path}")
+    if manifest.get('format_version') not in SUPPORTED_VERSIONS:
+        raise ValueError(
+            f"Unsupported bundle version {manifest.get('format_version')} "
+            f"(expected {BUNDLE_VERSION}): {path}"
+        )
+    return manifest
+
+
+def verify_bundle(bundle_dir, manifest=None):
+    """Recompute array checksums; raises ValueError on any mismatch"""
+    bundle_dir = resolve_bundle(bundle_dir)
+    manifest = manifest or read_manifest(bundle_dir)
+    files = manifest['files']
+    if _bundle_checksum(files) != manifest['checksum']:
+        raise ValueError(f"Bundle manifest checksum mismatch: {bundle_dir}")
+    for filename, expected in files.items():
+        if _sha256(bundle_dir / filename) != expected:
+            raise ValueError(f"Bundle file checksum mismatch: {bundle_dir / filename}")
+
+
+def _load_array(bundle_dir, key, mmap):
+    array = np.load(bundle_dir / f'{key}.npy', mmap_mode='r' if mmap else None, allow_pickle=False)
+    # Plain ndarray view of the map: indexing a np.memmap goes through Python-level hooks
+    return np.asarray(array)
+
+
+def load_bundle(bundle_dir, mmap=True, verify=False):
+    """
+    Load a model bundle.
+
+    Args:
+        bundle_dir: Directory written by save_bundle() (or one of its versions)
+        mmap: Memory-map arrays read-only instead of reading them into memory
+        verify: Check every array against its manifest checksum first
+            (reads the whole bundle, so off by default)
+
+    Returns:
+        forest: FlatIsolationForest
+        preprocessor: Preprocessor (no sklearn scaler attached)
+    """
+    from preprocessing.data_preprocessor import Preprocessor
+    from preprocessing.feature_plan import FeaturePlan
+
+    # Resolved once, so every array comes from the same version
+    bundle_dir = resolve_bundle(bundle_dir)
+    manifest = read_manifest(bundle_dir)
+    if verify:
+        verify_bundle(bundle_dir, manifest)
+
+    forest = FlatIsolationForest(
+        **{name: _load_array(bundle_dir, f'forest_{name}', mmap) for name in FOREST_ARRAYS
+           if f'forest_{name}.npy' in manifest['files']},
+        max_samples=manifest['max_samples'],
+        offset=manifest['offset'],
+    )
+    preprocessor = Preprocessor(
+        columns=manifest['features'],
+        training_set=manifest.get('training_set'),
+        plan=FeaturePlan.from_dict(manifest['feature_plan']) if manifest.get('feature_plan') else None,
+        **{name: _load_array(bundle_dir, f'preprocessor_{name}', mmap) for name in PREPROCESSOR_ARRAYS},
+    )
+    return forest, preprocessor
+
+
+def load_calibrator(bundle_dir, mmap=True):
+    """ScoreCalibrator stored in a bundle, or None if it was saved without one"""
+    bundle_dir = resolve_bundle(bundle_dir)
+    if not read_manifest(bundle_dir).get('calibrated'):
+        return None
+    return ScoreCalibrator(**{name: _load_array(bundle_dir, f'calibration_{name}', mmap) for name in CALIBRATION_ARRAYS})
@@ -0,0 +1,230 @@
+"""
+Nearest Neighbor Backends
+
+k-nearest-neighbor search shared by the neighbor-based detectors (LOF,
+fast ABOD). Every backend has the same two calls:
+
+    index = make_neighbor_index('kd_tree').fit(X)
+    distances, indices = index.kneighbors(Q, k)     # sorted by distance
+
+Backends:
+    kd_tree, ball_tree, brute   Exact search (sklearn.neighbors)
+    auto                        kd_tree for low-dimensional data, else brute
+    approx                      Inverted file: points bucketed into k-means
+                                cells; a query scans only its nearest cells
+
+kneighbors_chunked() splits the query rows into blocks and runs them on a
+thread pool: the tree queries and the BLAS distance kernels release the
+GIL, and each block's result is written to its own rows.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Query rows per block in kneighbors_chunked
+CHUNK_SIZE = 4096
+
+# Above this many features the exact 'auto' backend scans instead of
+# using a KD tree
+TREE_MAX_FEATURES = 20
+
+# Approximate backend: k-means cells searched per query, and the
+# mini-batch size used to fit the cells
+N_PROBE = 16
+KMEANS_BATCH = 4096
+
+
+class TreeNeighbors:
+    """
+    Exact kNN with sklearn NearestNeighbors.
+
+    Args:
+        algorithm: 'kd_tree', 'ball_tree' or 'brute'
+        leaf_size: Tree leaf size
+    """
+
+    def __init__(self, algorithm='kd_tree', leaf_size=40):
+        self.algorithm = algorithm
+        self.leaf_size = leaf_size
+        self._nn = None
+
+    def fit(self, X):
+        from sklearn.neighbors import NearestNeighbors
+        self._nn = NearestNeighbors(algorithm=self.algorithm, leaf_size=self.leaf_size)
+        self._nn.fit(np.asarray(X, dtype=np.float64))
+        return self
+
+    @property
+    def n_samples(self):
+        return self._nn.n_samples_fit_
+
+    def kneighbors(self, X, k):
+        return self._nn.kneighbors(np.asarray(X, dtype=np.float64), n_neighbors=k)
+
+
+class ClusteredNeighbors:
+    """
+    Approximate kNN over an inverted file: the indexed points are bucketed
+    into MiniBatchKMeans cells and each query searches only the points of
+    its n_probe nearest cells, with exact Euclidean distances.
+
+    Args:
+        n_cells: Number of cells (default: sqrt(n_samples))
+        n_probe: Cells searched per query
+        random_state: Seed of the clustering
+    """
+
+    def __init__(self, n_cells=None, n_probe=N_PROBE, random_state=42):
+        self.n_cells = n_cells
+        self.n_probe = n_probe
+        self.random_state = random_state
+        self._X = None
+
+    def fit(self, X):
+        from sklearn.cluster import MiniBatchKMeans
+        self._X = np.asarray(X, dtype=np.float64)
+        n_cells = self.n_cells or max(1, int(np.sqrt(len(self._X))))
+        kmeans = MiniBatchKMeans(n_clusters=min(n_cells, len(self._X)), random_state=self.random_state,
+                                 n_init=3, batch_size=KMEANS_BATCH)
+        labels = kmeans.fit_predict(self._X)
+        self._centers = kmeans.cluster_centers_
+        self._center_sq = np.einsum('ij,ij->i', self._centers, self._centers)
+        # Points grouped by cell: cell c holds _members[_offsets[c]:_offsets[c + 1]]
+        self._members = np.argsort(labels, kind='stable')
+        self._offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=len(self._centers)))])
+        self._sq_norms = np.einsum('ij,ij->i', self._X, self._X)
+        return self
+
+    @property
+    def n_samples(self):
+        return len(self._X)
+
+    def kneighbors(self, X, k):
+        X = np.asarray(X, dtype=np.float64)
+        query_sq = np.einsum('ij,ij->i', X, X)
+        n_probe = min(self.n_probe, len(self._centers))
+        center_dist = self._center_sq[np.newaxis, :] - 2.0 * (X @ self._centers.T)
+        probes = np.argpartition(center_dist, n_probe - 1, axis=1)[:, :n_probe]
+
+        # Running k best squared distances per query, merged cell by cell
+        best_sq = np.full((len(X), k), np.inf)
+        best_idx = np.full((len(X), k), -1, dtype=np.int64)
+        for cell in np.unique(probes):
+            members = self._members[self._offsets[cell]:self._offsets[cell + 1]]
+            queries = np.flatnonzero((probes == cell).any(axis=1))
+            sq = (self._sq_norms[members][np.newaxis, :]
+                  - 2.0 * (X[queries] @ self._X[members].T)
+                  + query_sq[queries][:, np.newaxis])
+            merged_sq = np.concatenate([best_sq[queries], sq], axis=1)
+            merged_idx = np.concatenate([best_idx[queries], np.broadcast_to(members, sq.shape)], axis=1)
+            keep = np.argpartition(merged_sq, k - 1, axis=1)[:, :k]
+            best_sq[queries] = np.take_along_axis(merged_sq, keep, axis=1)
+            best_idx[queries] = np.take_along_axis(merged_idx, keep, axis=1)
+
+        # Queries whose probed cells hold fewer than k points scan everything
+        short = np.flatnonzero(best_idx[:, -1] < 0)
+        if len(short):
+            sq = (self._sq_norms[np.newaxis, :] - 2.0 * (X[short] @ self._X.T)
+                  + query_sq[short][:, np.newaxis])
+            keep = np.argpartition(sq, k - 1, axis=1)[:, :k]
+            best_sq[short] = np.take_along_axis(sq, keep, axis=1)
+            best_idx[short] = keep
+
+        order = np.argsort(best_sq, axis=1, kind='stable')
+        distances = np.sqrt(np.maximum(np.take_along_axis(best_sq, order, axis=1), 0.0))
+        return distances, np.take_along_axis(best_idx, order, axis=1)
+
+
+class AutoNeighbors(TreeNeighbors):
+    """
+    Exact kNN choosing the algorithm at fit time: space-partitioning trees
+    degrade towards a full scan beyond a few dozen features, where a
+    blocked BLAS scan is faster.
+    """
+
+    def __init__(self, leaf_size=40):
+        super().__init__('auto', leaf_size)
+
+    def fit(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        self.algorithm = 'kd_tree' if X.shape[1] <= TREE_MAX_FEATURES else 'brute'
+        return super().fit(X)
+
+
+NEIGHBOR_BACKENDS = {
+    'kd_tree': lambda **kw: TreeNeighbors('kd_tree', **kw),
+    'ball_tree': lambda **kw: TreeNeighbors('ball_tree', **kw),
+    'brute': lambda **kw: TreeNeighbors('brute', **kw),
+    'auto': lambda **kw: AutoNeighbors(**kw),
+    'approx': lambda **kw: ClusteredNeighbors(**kw),
+}
+
+
+def make_neighbor_index(backend='kd_tree', **params):
+    """Unfitted neighbor index for a backend name (see NEIGHBOR_BACKENDS)"""
+    if backend not in NEIGHBOR_BACKENDS:
+        raise ValueError(f"Unknown neighbor backend: {backend}. Available: {list(NEIGHBOR_BACKENDS)}")
+    return NEIGHBOR_BACKENDS[backend](**params)
+
+
+def resolve_n_jobs(n_jobs):
+    """Worker count for n_jobs (-1 = all cores)"""
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        return max(1, (os.cpu_count() or 1) + 1 + n_jobs)
+    return max(1, n_jobs)
+
+
+def map_blocks(func, n_rows, chunk_size=CHUNK_SIZE, n_jobs=-1):
+    """
+    Run func(rows) over consecutive row slices, on a thread pool when
+    n_jobs > 1. Results are returned in row order.
+    """
+    blocks = [slice(start, min(start + chunk_size, n_rows)) for start in range(0, n_rows, chunk_size)]
+    n_workers = min(resolve_n_jobs(n_jobs), len(blocks))
+    if n_workers <= 1:
+        return [func(rows) for rows in blocks]
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        return list(pool.map(func, blocks))
+
+
+def kneighbors_chunked(index, X, k, exclude_self=False, chunk_size=CHUNK_SIZE, n_jobs=-1):
+    """
+    k nearest indexed points of each row of X, in row blocks.
+
+    Args:
+        index: Fitted neighbor index
+        X: Query matrix
+        k: Neighbors per row
+        exclude_self: X is the indexed matrix; row i does not count as its
+            own neighbor (as sklearn's kneighbors(X=None))
+        chunk_size: Query rows per block
+        n_jobs: Worker threads (-1 = all cores)
+
+    Returns:
+        distances: (n_rows x k) float64, ascending per row
+        indices: (n_rows x k) int64
+    """
+    X = np.asarray(X, dtype=np.float64)
+    n_query = k + 1 if exclude_self else k
+    distances = np.empty((len(X), k), dtype=np.float64)
+    indices = np.empty((len(X), k), dtype=np.int64)
+
+    def query(rows):
+        dist, idx = index.kneighbors(X[rows], n_query)
+        if exclude_self:
+            # Drop the row itself; with duplicate points it may not come first,
+            # and if it was not returned at all the farthest neighbor goes
+            is_self = idx == np.arange(rows.start, rows.stop)[:, None]
+            is_self[~is_self.any(axis=1), -1] = True
+            keep = ~is_self
+            dist = dist[keep].reshape(len(dist), k)
+            idx = idx[keep].reshape(len(idx), k)
+        distances[rows] = dist
+        indices[rows] = idx
+
+    map_blocks(query, len(X), chunk_size, n_jobs)
+    return distances, indices
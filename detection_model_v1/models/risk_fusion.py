@@ -7,6 +7,13 @@ Combines rule-based scores with unsupervised anomaly scores.
 import pandas as pd
 import numpy as np
 from pathlib import Path
+import sys
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from models.thresholds import top_k_count, top_k_cutoff, TopKSelector
+from preprocessing.customer_index import align_codes, shared_codes
 
 
 def fuse_risk_scores(rule_scores_df, anomaly_scores_df, rule_weight=0.7, anomaly_weight=0.3):
@@ -26,16 +33,17 @@ def fuse_risk_scores(rule_scores_df, anomaly_scores_df, rule_weight=0.7, anomaly
     if abs(rule_weight + anomaly_weight - 1.0) > 0.001:
         raise ValueError(f"Weights must sum to 1.0, got {rule_weight} + {anomaly_weight} = {rule_weight + anomaly_weight}")
     
-    # Merge on customer_id
-    merged = pd.merge(
-        rule_scores_df[['customer_id', 'rule_based_score']],
-        anomaly_scores_df[['customer_id', 'score']],
-        on='customer_id',
-        how='inner'
-    )
+    # Inner join on customer_id codes, in rule_scores_df order. Frames from
+    # the same load share one CustomerIndex, so no IDs are hashed here.
+    rule_ids = rule_scores_df['customer_id']
+    index, rule_codes, anomaly_codes = shared_codes(rule_ids, anomaly_scores_df['customer_id'])
+    left_rows, right_rows = align_codes(rule_codes, anomaly_codes, len(index))
     
-    # Rename anomaly score column for clarity
-    merged = merged.rename(columns={'score': 'anomaly_score'})
+    merged = pd.DataFrame({
+        'customer_id': rule_ids.values.take(left_rows),
+        'rule_based_score': rule_scores_df['rule_based_score'].to_numpy().take(left_rows),
+        'anomaly_score': anomaly_scores_df['score'].to_numpy().take(right_rows),
+    })
     
     # Calculate fused risk score
     merged['risk_score'] = (
@@ -54,34 +62,188 @@ def fuse_risk_scores(rule_scores_df, anomaly_scores_df, rule_weight=0.7, anomaly
     return merged
 
 
+def fuse_score_matrix(matrix, model_name, rule_weight=0.7, anomaly_weight=0.3, rule_name='rule_based_score'):
+    """
+    fuse_risk_scores for two columns of a ScoreMatrix, without a join.
+    
+    Args:
+        matrix: ScoreMatrix holding the rule-based score and model_name
+        model_name: Column with the anomaly score
+        rule_weight: Weight for rule-based score (default 0.7)
+        anomaly_weight: Weight for anomaly score (default 0.3)
+        rule_name: Column with the rule-based score
+    
+    Returns:
+        fused_df: Same frame as fuse_risk_scores (customer_id, rule_based_score,
+            anomaly_score, risk_score)
+    """
+    if abs(rule_weight + anomaly_weight - 1.0) > 0.001:
+        raise ValueError(f"Weights must sum to 1.0, got {rule_weight} + {anomaly_weight} = {rule_weight + anomaly_weight}")
+    
+    rows, risk_scores = matrix.fuse({rule_name: rule_weight, model_name: anomaly_weight})
+    return pd.DataFrame({
+        'customer_id': matrix.index.categorical(rows),
+        'rule_based_score': np.round(matrix.column(rule_name)[rows], 4),
+        'anomaly_score': np.round(matrix.column(model_name)[rows], 4),
+        'risk_score': risk_scores,
+    })
+
+
 def generate_predictions(fused_df, threshold=None, top_percentile=5):
     """
     Generate binary predictions from risk scores.
     
     Args:
         fused_df: DataFrame with risk_score
-        threshold: Fixed threshold (if None, uses percentile)
-        top_percentile: Top N% to flag (default 5%)
+        threshold: Fixed threshold (if None, flags the top_percentile)
+        top_percentile: Top N% to flag (default 5%). Exactly that many
+            customers are flagged; ties at the cutoff go to earlier rows.
     
     Returns:
         predictions_df: DataFrame with customer_id, predicted_label, risk_score
+        threshold: The fixed threshold, or the lowest flagged risk score
+            (inf when the top N% rounds to no customers)
     """
-    predictions_df = fused_df[['customer_id', 'risk_score']].copy()
+    risk_scores = fused_df['risk_score'].to_numpy()
     
-    # Determine threshold
     if threshold is None:
-        # Use percentile-based threshold
-        threshold = np.percentile(fused_df['risk_score'], 100 - top_percentile)
+        # Exact top-k selection
+        k = top_k_count(len(risk_scores), top_percentile)
+        threshold, tie_quota = top_k_cutoff(risk_scores, k)
+        flagged = TopKSelector(threshold, tie_quota).select(risk_scores)
+    else:
+        flagged = risk_scores >= threshold
     
-    # Generate predictions
-    predictions_df['predicted_label'] = (fused_df['risk_score'] >= threshold).astype(int)
-    
-    # Reorder columns
-    predictions_df = predictions_df[['customer_id', 'predicted_label', 'risk_score']]
+    predictions_df = pd.DataFrame({
+        'customer_id': fused_df['customer_id'].values,
+        'predicted_label': flagged.astype(int),
+        'risk_score': risk_scores,
+    })
     
     return predictions_df, threshold
 
 
+def _top_k_masks(fused, ks):
+    """
+    Top-k flags for each row of a (weights x customers) matrix and each k,
+    with the same tie rule as generate_predictions.
+
+    Returns:
+        flags: bool (weights x len(ks) x customers)
+        cutoffs: (weights x len(ks)) lowest flagged score (inf when k == 0,
+            as generate_predictions)
+    """
+    n_rows, n = fused.shape
+    flags = np.zeros((n_rows, len(ks), n), dtype=bool)
+    cutoffs = np.full((n_rows, len(ks)), np.inf)
+    positive = [idx for idx, k in enumerate(ks) if k > 0]
+    if not positive:
+        return flags, cutoffs
+
+    # One partial sort per row yields the cutoff for every k
+    kth = sorted({n - ks[idx] for idx in positive})
+    partitioned = np.partition(fused, kth, axis=1)
+    for idx in positive:
+        cutoff = partitioned[:, n - ks[idx]][:, None]
+        above = fused > cutoff
+        tied = fused == cutoff
+        quota = ks[idx] - above.sum(axis=1, keepdims=True)
+        flags[:, idx] = above | (tied & (np.cumsum(tied, axis=1) <= quota))
+        cutoffs[:, idx] = cutoff[:, 0]
+    return flags, cutoffs
+
+
+def _fuse_matrix(rule, anomaly, rule_weights, anomaly_weights):
+    """(weights x customers) risk scores, same arithmetic as fuse_risk_scores"""
+    fused = rule_weights[:, None] * rule[None, :] + anomaly_weights[:, None] * anomaly[None, :]
+    return np.round(np.clip(fused, 0.0, 1.0), 4)
+
+
+def sweep_fusion(rule_scores, anomaly_scores, rule_weights, top_percentiles, baseline=(0.7, 5), block_size=16):
+    """
+    Evaluate a grid of fusion weights and flag percentiles in one pass.
+    
+    Each grid point flags the same customers generate_predictions would
+    for fuse_risk_scores(rule_weight, 1 - rule_weight).
+    
+    Args:
+        rule_scores: rule_based_score per customer (aligned with anomaly_scores)
+        anomaly_scores: Anomaly score per customer
+        rule_weights: Rule weights to try; anomaly weight = 1 - rule weight
+        top_percentiles: Top N% values to try
+        baseline: (rule_weight, top_percentile) the overlaps are measured against
+        block_size: Weights fused per block (bounds memory to block_size x customers)
+    
+    Returns:
+        DataFrame with one row per (rule_weight, top_percentile): threshold,
+        flagged_count, flag_rate, mean_risk_score, baseline_overlap and
+        baseline_jaccard (vs the baseline flags), rule_top_overlap and
+        anomaly_top_overlap (share of flags also in the rule-only /
+        anomaly-only top N%), and stability (Jaccard with the previous
+        rule weight at the same percentile)
+    """
+    rule = np.asarray(rule_scores, dtype=np.float64)
+    anomaly = np.asarray(anomaly_scores, dtype=np.float64)
+    rule_weights = np.sort(np.asarray(rule_weights, dtype=np.float64))
+    # 1 - 0.7 is 0.30000000000000004; round so weights match the CLI's 0.3
+    anomaly_weights = np.round(1.0 - rule_weights, 10)
+    n = len(rule)
+    ks = [top_k_count(n, p) for p in top_percentiles]
+
+    base_weight = np.array([baseline[0]], dtype=np.float64)
+    base_fused = _fuse_matrix(rule, anomaly, base_weight, np.round(1.0 - base_weight, 10))
+    base_flags = _top_k_masks(base_fused, [top_k_count(n, baseline[1])])[0][0, 0]
+    # Single-source flags per percentile: rule-only and anomaly-only top N%
+    rule_flags = _top_k_masks(np.round(rule, 4)[None, :], ks)[0][0]
+    anomaly_flags = _top_k_masks(np.round(anomaly, 4)[None, :], ks)[0][0]
+
+    def overlap(flags, other):
+        # flags: (rows x customers), other: (customers,) or same shape
+        inter = (flags & other).sum(axis=-1)
+        union = (flags | other).sum(axis=-1)
+        return inter, union
+
+    rows = []
+    previous = None
+    for start in range(0, len(rule_weights), block_size):
+        weights = rule_weights[start:start + block_size]
+        fused = _fuse_matrix(rule, anomaly, weights, anomaly_weights[start:start + block_size])
+        flags, cutoffs = _top_k_masks(fused, ks)
+        means = fused.mean(axis=1)
+
+        for p_idx, percentile in enumerate(top_percentiles):
+            grid_flags = flags[:, p_idx]
+            counts = grid_flags.sum(axis=1)
+            base_inter, base_union = overlap(grid_flags, base_flags)
+            rule_inter, _ = overlap(grid_flags, rule_flags[p_idx])
+            anomaly_inter, _ = overlap(grid_flags, anomaly_flags[p_idx])
+            # Stability vs the previous weight (crossing block boundaries)
+            prev = np.vstack([previous[p_idx][None, :] if previous is not None else grid_flags[:1], grid_flags[:-1]])
+            stab_inter, stab_union = overlap(grid_flags, prev)
+
+            with np.errstate(invalid='ignore', divide='ignore'):
+                for w_idx in range(len(weights)):
+                    rows.append({
+                        'rule_weight': weights[w_idx],
+                        'anomaly_weight': anomaly_weights[start + w_idx],
+                        'top_percentile': percentile,
+                        'threshold': cutoffs[w_idx, p_idx],
+                        'flagged_count': int(counts[w_idx]),
+                        'flag_rate': 100 * counts[w_idx] / n,
+                        'mean_risk_score': means[w_idx],
+                        'baseline_overlap': base_inter[w_idx] / base_flags.sum(),
+                        'baseline_jaccard': base_inter[w_idx] / base_union[w_idx],
+                        'rule_top_overlap': rule_inter[w_idx] / counts[w_idx],
+                        'anomaly_top_overlap': anomaly_inter[w_idx] / counts[w_idx],
+                        'stability': (stab_inter[w_idx] / stab_union[w_idx]
+                                      if start + w_idx > 0 else np.nan),
+                    })
+        previous = flags[-1]
+
+    results = pd.DataFrame(rows)
+    return results.sort_values(['top_percentile', 'rule_weight'], kind='stable').reset_index(drop=True)
+
+
 def main(rule_scores_path=None, anomaly_scores_path=None, output_path=None, 
          rule_weight=0.7, anomaly_weight=0.3, threshold=None, top_percentile=5):
     """
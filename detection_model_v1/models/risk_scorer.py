@@ -0,0 +1,157 @@
+"""
+Online Risk Scorer
+
+Scores single customers or small batches against a saved model without
+running the batch pipeline. The preprocessor, the flattened Isolation
+Forest and the compiled rule tables are loaded once; each call is a few
+vectorized array operations with no DataFrame construction:
+
+    scorer = RiskScorer.load(BASE_DIR / 'models' / 'saved')
+    result = scorer.score(customer_record)
+
+Outputs match the batch pipeline (rule_based_scorer + anomaly detector +
+risk fusion) for the same customer: anomaly scores come from the
+calibrator fitted at training time, not from the batch.
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .anomaly_detector import BUNDLE_DIR
+from .model_bundle import load_bundle, load_calibrator, resolve_bundle
+
+
+def _record_matrix(records, columns):
+    """float64 (n_records x n_columns) matrix; missing keys and None become NaN"""
+    return np.array(
+        [[record.get(col, np.nan) for col in columns] for record in records],
+        dtype=np.float64
+    ).reshape(len(records), len(columns))
+
+
+def _record_rule_matrix(records, engine):
+    """
+    Records counterpart of RuleEngine.feature_matrix: NaN is treated as 0
+    and a rule only counts as present for records that have its key.
+    """
+    values = _record_matrix(records, engine.features)
+    values[np.isnan(values)] = 0.0
+    present = np.array(
+        [[name in record for name in engine.features] for record in records],
+        dtype=bool
+    ).reshape(len(records), engine.n_rules)
+    return values, present
+
+
+class RiskScorer:
+    """
+    Loaded model for per-customer scoring.
+
+    Args:
+        forest: FlatIsolationForest (or fitted IsolationForest)
+        preprocessor: Fitted Preprocessor
+        engine: Compiled RuleEngine
+        calibrator: ScoreCalibrator fitted on the training scores
+        rule_weight: Weight for rule-based score
+        anomaly_weight: Weight for anomaly score
+    """
+
+    def __init__(self, forest, preprocessor, engine, calibrator, rule_weight=0.7, anomaly_weight=0.3):
+        if abs(rule_weight + anomaly_weight - 1.0) > 0.001:
+            raise ValueError(f"Weights must sum to 1.0, got {rule_weight} + {anomaly_weight} = {rule_weight + anomaly_weight}")
+        self.forest = forest
+        self.preprocessor = preprocessor
+        self.engine = engine
+        self.calibrator = calibrator
+        self.rule_weight = rule_weight
+        self.anomaly_weight = anomaly_weight
+
+    @classmethod
+    def load(cls, model_dir, engine=None, rule_weight=0.7, anomaly_weight=0.3):
+        """
+        Load a scorer from a model directory written by save_model().
+
+        Args:
+            model_dir: e.g. detection_model_v1/models/saved
+            engine: RuleEngine (default: the rule tables in rule_based_scorer)
+        """
+        # One version for the calibrator and the forest, even if a save publishes a new one meanwhile
+        bundle_dir = resolve_bundle(Path(model_dir) / BUNDLE_DIR)
+        calibrator = load_calibrator(bundle_dir)
+        if calibrator is None:
+            raise ValueError(f"Model bundle has no score calibrator; retrain and save the model: {bundle_dir}")
+        forest, preprocessor = load_bundle(bundle_dir)
+
+        if engine is None:
+            from scripts.rule_based_scorer import RULE_ENGINE
+            engine = RULE_ENGINE
+
+        return cls(forest, preprocessor, engine, calibrator, rule_weight, anomaly_weight)
+
+    def _score_arrays(self, rule_values, rule_present, anomaly_values):
+        """Score prepared matrices; returns a dict of per-customer arrays"""
+        rule_score, category_scores = self.engine.score_matrix(rule_values, rule_present)
+        # Same rounding as the batch pipeline: rule scores to 2, fused scores to 4 decimals
+        rule_score = np.round(rule_score, 2)
+        category_scores = np.round(category_scores, 2)
+
+        raw = self.forest.score_samples(self.preprocessor.transform_values(anomaly_values))
+        anomaly_score = self.calibrator.transform(raw)
+
+        risk_score = np.clip(self.rule_weight * rule_score + self.anomaly_weight * anomaly_score, 0.0, 1.0)
+
+        result = {'rule_based_score': rule_score}
+        for idx, category in enumerate(self.engine.categories):
+            result[category] = category_scores[:, idx]
+        result['anomaly_score'] = anomaly_score
+        result['risk_score'] = np.round(risk_score, 4)
+        return result
+
+    def score(self, record):
+        """
+        Score one customer.
+
+        Args:
+            record: Mapping of master_features column -> value. As with a
+                column missing from a frame, rules on missing keys never
+                fire; missing anomaly features get the training median.
+
+        Returns:
+            Dict with customer_id (if given), rule_based_score, the category
+            scores, anomaly_score and risk_score
+        """
+        records = [record]
+        rule_values, rule_present = _record_rule_matrix(records, self.engine)
+        scores = self._score_arrays(rule_values, rule_present, _record_matrix(records, self.preprocessor.columns))
+        result = {'customer_id': record['customer_id']} if 'customer_id' in record else {}
+        result.update({name: float(values[0]) for name, values in scores.items()})
+        return result
+
+    def score_batch(self, records):
+        """
+        Score several customers.
+
+        Args:
+            records: master_features DataFrame, or a list of record mappings
+
+        Returns:
+            DataFrame with customer_id, rule_based_score, the category scores,
+            anomaly_score and risk_score
+        """
+        if isinstance(records, pd.DataFrame):
+            rule_values, rule_present = self.engine.feature_matrix(records)
+            anomaly_values = self.preprocessor.feature_values(records)
+            customer_ids = records['customer_id'].values if 'customer_id' in records.columns else None
+        else:
+            records = list(records)
+            rule_values, rule_present = _record_rule_matrix(records, self.engine)
+            anomaly_values = _record_matrix(records, self.preprocessor.columns)
+            customer_ids = [record.get('customer_id') for record in records]
+
+        scores = self._score_arrays(rule_values, rule_present, anomaly_values)
+        out = pd.DataFrame(scores)
+        if customer_ids is not None:
+            out.insert(0, 'customer_id', customer_ids)
+        return out
@@ -0,0 +1,158 @@
+"""
+Compiled Rule Engine
+
+Compiles the red-flag rule tables (feature -> threshold/weight/comparison)
+into dense arrays once, so scoring a frame is a single vectorized comparison
+over an (n_customers x n_rules) matrix followed by a weighted sum:
+
+    triggered = where(less_than, X < thresholds, X >= thresholds)
+    category_scores = (triggered @ weights) * category_weights
+    rule_based_score = clip(category_scores.sum(axis=1), 0, 1)
+
+The sums are evaluated in rule order, so a customer's score does not depend
+on the batch it is scored in. The triggered matrix can also be kept packed,
+one bit per rule (pack_rules), for the explanation generator.
+"""
+
+import numpy as np
+
+
+class RuleEngine:
+    """
+    Dense form of the rule tables.
+
+    Attributes:
+        features: Feature name per rule (length n_rules)
+        thresholds: Threshold per rule, float64 (n_rules,)
+        less_than: True where the rule fires on value < threshold (n_rules,)
+        weights: Rule weight placed in its category column (n_rules x n_categories)
+        category_weights: Weight per category (n_categories,)
+        categories: Category names, e.g. 'structuring_risk'
+    """
+
+    def __init__(self, features, thresholds, less_than, weights, category_weights, categories):
+        self.features = list(features)
+        self.thresholds = np.asarray(thresholds, dtype=np.float64)
+        self.less_than = np.asarray(less_than, dtype=bool)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.category_weights = np.asarray(category_weights, dtype=np.float64)
+        self.categories = list(categories)
+
+    @classmethod
+    def compile(cls, rule_tables):
+        """
+        Compile rule tables.
+
+        Args:
+            rule_tables: List of (category_name, feature_config, category_weight),
+                where feature_config is a dict like STRUCTURING_FEATURES
+
+        Returns:
+            RuleEngine
+        """
+        features, thresholds, less_than, rule_weights, rule_category = [], [], [], [], []
+        categories, category_weights = [], []
+
+        for category_idx, (category, feature_config, category_weight) in enumerate(rule_tables):
+            categories.append(category)
+            category_weights.append(category_weight)
+            for feature_name, config in feature_config.items():
+                features.append(feature_name)
+                thresholds.append(config['threshold'])
+                less_than.append(config.get('comparison', 'greater_equal') == 'less_than')
+                rule_weights.append(config['weight'])
+                rule_category.append(category_idx)
+
+        weights = np.zeros((len(features), len(categories)), dtype=np.float64)
+        weights[np.arange(len(features)), rule_category] = rule_weights
+
+        return cls(features, thresholds, less_than, weights, category_weights, categories)
+
+    @property
+    def n_rules(self):
+        return len(self.features)
+
+    def feature_matrix(self, features_df):
+        """
+        Build the (n_customers x n_rules) value matrix for a frame.
+
+        NaN is treated as 0 (as the per-rule fillna(0) did). Returns the
+        matrix and a per-rule mask of which features exist in the frame;
+        rules on missing features never fire.
+        """
+        present = np.array([name in features_df.columns for name in self.features], dtype=bool)
+        # Column-major so each feature is one contiguous copy
+        values = np.zeros((len(features_df), self.n_rules), dtype=np.float64, order='F')
+        for j in np.flatnonzero(present):
+            values[:, j] = features_df[self.features[j]].to_numpy(dtype=np.float64, na_value=np.nan)
+        values[np.isnan(values)] = 0.0
+        return values, present
+
+    def evaluate(self, values, present=None):
+        """Boolean (n_customers x n_rules) matrix of triggered rules"""
+        triggered = values >= self.thresholds
+        if self.less_than.any():
+            triggered[:, self.less_than] = values[:, self.less_than] < self.thresholds[self.less_than]
+        if present is not None:
+            triggered &= present
+        return triggered
+
+    def score_matrix(self, values, present=None, weights=None, category_weights=None):
+        """
+        Score a prepared value matrix.
+
+        Args:
+            values, present: Output of feature_matrix()
+            weights: Optional (n_rules x n_categories) override, e.g. for weight sweeps
+            category_weights: Optional (n_categories,) override
+
+        Returns:
+            rule_based_score: (n_customers,) clipped to [0, 1]
+            category_scores: (n_customers x n_categories)
+        """
+        triggered = self.evaluate(values, present)
+        return self.score_triggered(triggered, weights, category_weights)
+
+    def score_triggered(self, triggered, weights=None, category_weights=None):
+        """Score a triggered-rule matrix (see score_matrix())"""
+        weights = self.weights if weights is None else weights
+        category_weights = self.category_weights if category_weights is None else category_weights
+
+        # Sums run in rule order (cumsum is sequential), as the per-rule loop
+        # did; a matmul's order depends on the BLAS kernel and the row count
+        category_scores = np.zeros((len(triggered), len(category_weights)), dtype=np.float64)
+        for category_idx in range(len(category_weights)):
+            rules = np.flatnonzero(weights[:, category_idx])
+            if len(rules):
+                contributions = triggered[:, rules] * weights[rules, category_idx]
+                category_scores[:, category_idx] = np.cumsum(contributions, axis=1)[:, -1]
+        category_scores *= category_weights
+        rule_based_score = np.clip(np.cumsum(category_scores, axis=1)[:, -1], 0.0, 1.0)
+        return rule_based_score, category_scores
+
+    def pack_rules(self, triggered):
+        """
+        Pack a triggered-rule matrix into a per-customer bitmask.
+
+        Returns:
+            uint8 (n_customers x ceil(n_rules / 8)); bit j % 8 of byte j // 8
+            is rule j (little bit order)
+        """
+        return np.packbits(triggered, axis=1, bitorder='little')
+
+    def unpack_rules(self, rule_bits):
+        """Boolean (n x n_rules) triggered matrix of a pack_rules() bitmask"""
+        return np.unpackbits(rule_bits, axis=1, count=self.n_rules, bitorder='little').astype(bool)
+
+    def score(self, features_df, rule_bits=False):
+        """
+        Score a frame; see score_matrix(). With rule_bits=True the
+        pack_rules() bitmask of the triggered rules is returned as a
+        third value.
+        """
+        values, present = self.feature_matrix(features_df)
+        triggered = self.evaluate(values, present)
+        rule_based_score, category_scores = self.score_triggered(triggered)
+        if rule_bits:
+            return rule_based_score, category_scores, self.pack_rules(triggered)
+        return rule_based_score, category_scores
@@ -0,0 +1,156 @@
+"""
+Score Matrix
+
+Holds every model's per-customer score in one aligned structure so fusing
+any combination of models needs no joins:
+
+    customer_ids   interned once (CustomerIndex); row i of the matrix is the
+                   customer with code i
+    scores         (n_customers x n_models) float32, one column per model,
+                   NaN where a model did not score a customer
+
+N-way fusion is a weighted combination of columns (weighted sum, weighted
+rank average or max), restricted to customers every fused model scored,
+which is the inner join fuse_risk_scores does with pd.merge.
+"""
+
+import numpy as np
+import pandas as pd
+
+from preprocessing.customer_index import CustomerIndex
+
+# Methods accepted by ScoreMatrix.fuse
+FUSION_METHODS = ('weighted', 'rank', 'max')
+
+
+class ScoreMatrix:
+    """
+    Aligned per-customer scores of several models.
+
+    Args:
+        customer_ids: Customer IDs defining the row order, or a CustomerIndex
+        decimals: Scores are rounded to this many decimals (the pipeline
+            writes 4). Values on that grid survive the float32 round trip
+            exactly, so fusion matches the float64 pipeline; None disables
+            the restore.
+    """
+
+    def __init__(self, customer_ids=(), decimals=4):
+        if isinstance(customer_ids, CustomerIndex):
+            self.index = customer_ids
+        else:
+            self.index = CustomerIndex.factorize(customer_ids)[0]
+        self.models = []
+        self.decimals = decimals
+        self.scores = np.empty((len(self.index), 0), dtype=np.float32, order='F')
+
+    @classmethod
+    def from_frames(cls, frames, decimals=4):
+        """
+        Build from score frames.
+
+        Args:
+            frames: Dict of model name -> (DataFrame, score column), e.g.
+                {'rule_based_score': (rule_scores_df, 'rule_based_score'),
+                 'isolation_forest': (anomaly_scores_df, 'score')}
+
+        Returns:
+            ScoreMatrix with rows in first-seen customer order
+        """
+        matrix = cls(decimals=decimals)
+        for name, (df, column) in frames.items():
+            matrix.add(name, df['customer_id'], df[column].to_numpy())
+        return matrix
+
+    @property
+    def customer_ids(self):
+        """Customer ID per row"""
+        return self.index.ids
+
+    @property
+    def n_customers(self):
+        return len(self.index)
+
+    def codes(self, customer_ids):
+        """Row index of each customer ID (-1 if unknown)"""
+        return self.index.encode(customer_ids)
+
+    def add(self, name, customer_ids, scores):
+        """
+        Add (or replace) a model's scores; customers not yet in the matrix
+        are appended as new rows.
+        """
+        n_before = self.n_customers
+        self.index, codes = self.index.extend(customer_ids)
+        if self.n_customers > n_before:
+            padding = np.full((self.n_customers - n_before, self.scores.shape[1]), np.nan, dtype=np.float32)
+            self.scores = np.asfortranarray(np.vstack([self.scores, padding]))
+
+        column = np.full(self.n_customers, np.nan, dtype=np.float32)
+        column[codes] = np.asarray(scores, dtype=np.float32)
+        if name in self.models:
+            self.scores[:, self.models.index(name)] = column
+        else:
+            self.models.append(name)
+            self.scores = np.asfortranarray(np.column_stack([self.scores, column]))
+        return self
+
+    def column(self, name):
+        """A model's scores as float64 (NaN where missing), restored to the score grid"""
+        values = self.scores[:, self.models.index(name)].astype(np.float64)
+        if self.decimals is not None:
+            values = np.round(values, self.decimals)
+        return values
+
+    def complete_rows(self, names):
+        """Row indices scored by every model in names (the inner join), in row order"""
+        columns = [self.models.index(name) for name in names]
+        return np.flatnonzero(~np.isnan(self.scores[:, columns]).any(axis=1))
+
+    def fuse(self, weights, method='weighted', rows=None):
+        """
+        Fuse model columns.
+
+        Args:
+            weights: Dict of model name -> weight
+            method: 'weighted' (clip(sum w * score, 0, 1)), 'rank' (weighted
+                mean of each model's percentile rank among the fused rows)
+                or 'max' (highest score among models with non-zero weight)
+            rows: Row indices to fuse (default: complete_rows(weights))
+
+        Returns:
+            rows: Row indices fused
+            fused: Fused score per row, rounded to 4 decimals
+        """
+        if method not in FUSION_METHODS:
+            raise ValueError(f"Unknown fusion method: {method}. Available: {list(FUSION_METHODS)}")
+        names = list(weights)
+        if rows is None:
+            rows = self.complete_rows(names)
+
+        fused = np.zeros(len(rows), dtype=np.float64)
+        if method == 'weighted':
+            # Column by column in model order: same operations as the pairwise
+            # rule_weight * rule + anomaly_weight * anomaly
+            for idx, name in enumerate(names):
+                term = weights[name] * self.column(name)[rows]
+                fused = term if idx == 0 else fused + term
+            fused = np.clip(fused, 0.0, 1.0)
+        elif method == 'rank':
+            total = sum(weights.values())
+            for name in names:
+                ranks = pd.Series(self.column(name)[rows]).rank(method='average', pct=True).to_numpy()
+                fused += weights[name] * ranks
+            fused /= total
+        else:
+            active = [name for name in names if weights[name] != 0]
+            fused = np.max(np.column_stack([self.column(name)[rows] for name in active]), axis=1)
+
+        return rows, np.round(fused, 4)
+
+    def to_frame(self, names=None):
+        """DataFrame with customer_id and one column per model"""
+        names = self.models if names is None else names
+        df = pd.DataFrame({name: self.column(name) for name in names})
+        df.insert(0, 'customer_id', self.index.categorical(np.arange(self.n_customers)))
+        return df
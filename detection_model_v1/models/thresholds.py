@@ -0,0 +1,115 @@
+"""
+Threshold Selection
+
+Picks the customers to flag as the top N% by risk score:
+
+1. In memory: exact top-k with np.partition (O(n), no full sort) over the
+   risk_score array.
+2. Streaming: risk scores are rounded to 4 decimals, so a 10,001-bin count
+   histogram (ScoreHistogram) is an exact, mergeable sketch of the score
+   distribution. Per-chunk or per-worker histograms are added together and
+   give the same cutoff as the in-memory path without holding the scores.
+
+Ties at the cutoff are broken by row order (earlier rows are flagged
+first), so exactly k customers are flagged in both modes.
+"""
+
+import numpy as np
+
+# Risk scores are rounded to this many decimals before thresholding
+SCORE_DECIMALS = 4
+SCORE_BINS = 10 ** SCORE_DECIMALS + 1
+
+
+def top_k_count(n, top_percentile):
+    """Number of customers in the top N% of n (nearest integer, halves round up)"""
+    return int(np.floor(n * top_percentile / 100.0 + 0.5))
+
+
+def top_k_cutoff(scores, k):
+    """
+    Cutoff for an exact top-k selection.
+
+    Returns:
+        cutoff: k-th largest score (inf when k == 0, so nothing is flagged)
+        tie_quota: How many scores equal to the cutoff are flagged
+    """
+    scores = np.asarray(scores)
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.inf, 0
+    cutoff = np.partition(scores, len(scores) - k)[len(scores) - k]
+    return cutoff, k - int(np.count_nonzero(scores > cutoff))
+
+
+def select_top_k(scores, k):
+    """Boolean mask flagging exactly k of the highest scores (ties by row order)"""
+    scores = np.asarray(scores)
+    cutoff, tie_quota = top_k_cutoff(scores, k)
+    selector = TopKSelector(cutoff, tie_quota)
+    return selector.select(scores)
+
+
+class TopKSelector:
+    """
+    Applies a top-k cutoff to scores arriving in row blocks.
+
+    Scores above the cutoff are flagged; scores equal to it are flagged
+    until tie_quota of them have been, in arrival order.
+    """
+
+    def __init__(self, cutoff, tie_quota):
+        self.cutoff = cutoff
+        self.ties_left = int(tie_quota)
+
+    def select(self, scores):
+        scores = np.asarray(scores)
+        flagged = scores > self.cutoff
+        if self.ties_left > 0:
+            tied = np.flatnonzero(scores == self.cutoff)[:self.ties_left]
+            flagged[tied] = True
+            self.ties_left -= len(tied)
+        return flagged
+
+
+class ScoreHistogram:
+    """
+    Exact, mergeable count sketch of risk scores on a 10**-decimals grid.
+
+    Args:
+        counts: Optional existing bin counts (length 10**decimals + 1)
+        decimals: Decimals the scores are rounded to
+    """
+
+    def __init__(self, counts=None, decimals=SCORE_DECIMALS):
+        self.decimals = decimals
+        self.scale = 10 ** decimals
+        self.counts = np.zeros(self.scale + 1, dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+
+    def add(self, scores):
+        """Count a block of scores in [0, 1] (already rounded to the grid)"""
+        bins = np.rint(np.asarray(scores, dtype=np.float64) * self.scale).astype(np.int64)
+        self.counts += np.bincount(bins, minlength=len(self.counts))
+        return self
+
+    def merge(self, other):
+        """Add another histogram's counts (e.g. from another chunk or worker)"""
+        if other.decimals != self.decimals:
+            raise ValueError(f"Cannot merge histograms with {self.decimals} and {other.decimals} decimals")
+        self.counts += other.counts
+        return self
+
+    @property
+    def n(self):
+        return int(self.counts.sum())
+
+    def top_k_cutoff(self, k):
+        """Same as top_k_cutoff() over the counted scores"""
+        k = min(k, self.n)
+        if k <= 0:
+            return np.inf, 0
+        # Count of scores at or above each bin, from the top
+        at_or_above = np.cumsum(self.counts[::-1])[::-1]
+        cutoff_bin = int(np.flatnonzero(at_or_above >= k)[-1])
+        above = int(at_or_above[cutoff_bin + 1]) if cutoff_bin + 1 < len(self.counts) else 0
+        return cutoff_bin / self.scale, k - above
@@ -0,0 +1,226 @@
+"""
+Training Set Builder
+
+Chooses the rows and columns an anomaly model is trained on:
+
+    rows      all, a uniform reservoir sample, or a stratified sample
+              (proportional per stratum, every stratum represented)
+    columns   the default anomaly feature selection, minus
+              - low-variance columns: robust spread std / IQR at or below
+                min_std (the partner LOF script's RobustScaler + std > 0.1
+                filter)
+              - columns with |Pearson r| above max_correlation against an
+                earlier kept column
+              - beyond a max_features budget, the narrowest columns
+
+Statistics are computed on the sampled rows. build() also returns a
+summary of every choice; the Isolation Forest stores it on its
+Preprocessor (and in the model bundle manifest), whose column list then
+limits scoring to the kept columns.
+
+ReservoirSampler keeps a fixed-size uniform sample of a stream of rows
+(Algorithm R), so a training sample can be drawn from data that arrives in
+chunks without holding all of it: row i of the stream (0-based) is kept
+with probability size / (i + 1), replacing a random slot.
+"""
+
+import numpy as np
+import pandas as pd
+
+from preprocessing.feature_plan import FeaturePlan
+
+# Rows kept for incremental Isolation Forest retraining
+RESERVOIR_SIZE = 16384
+
+SAMPLING_METHODS = ('reservoir', 'stratified')
+
+
+class ReservoirSampler:
+    """
+    Uniform fixed-size sample of a row stream.
+
+    Args:
+        size: Rows to keep
+        random_state: Seed
+    """
+
+    def __init__(self, size=RESERVOIR_SIZE, random_state=None):
+        if size < 1:
+            raise ValueError("Reservoir size must be at least 1")
+        self.size = int(size)
+        self.n_seen = 0
+        self._rng = np.random.default_rng(random_state)
+        self._rows = None
+
+    def add(self, rows):
+        """Offer a block of rows (2-D array) to the reservoir"""
+        rows = np.asarray(rows)
+        if self._rows is None:
+            self._rows = np.empty((self.size,) + rows.shape[1:], dtype=rows.dtype)
+
+        # Fill the free slots first
+        n_fill = max(0, min(self.size - self.n_seen, len(rows)))
+        self._rows[self.n_seen:self.n_seen + n_fill] = rows[:n_fill]
+
+        # Stream position i replaces slot j ~ U[0, i] when j < size. Fancy
+        # assignment applies the replacements in stream order, so a slot hit
+        # twice keeps the later row, as the sequential algorithm does.
+        positions = np.arange(self.n_seen + n_fill, self.n_seen + len(rows))
+        slots = (self._rng.random(len(positions)) * (positions + 1)).astype(np.int64)
+        accepted = slots < self.size
+        self._rows[slots[accepted]] = rows[n_fill:][accepted]
+
+        self.n_seen += len(rows)
+        return self
+
+    @property
+    def sample(self):
+        """The kept rows (fewer than size until that many have been seen)"""
+        if self._rows is None:
+            return np.empty((0, 0))
+        return self._rows[:min(self.n_seen, self.size)]
+
+
+def _robust_spread(values):
+    """
+    Per column std / IQR after median imputation of NaN/inf (RobustScaler
+    leaves zero-IQR columns unscaled, and so does this), plus the imputed
+    values.
+    """
+    values = np.where(np.isfinite(values), values, np.nan)
+    medians = np.nanmedian(values, axis=0) if len(values) else np.zeros(values.shape[1])
+    medians = np.where(np.isnan(medians), 0.0, medians)
+    values = np.where(np.isnan(values), medians, values)
+    q25, q75 = np.percentile(values, [25, 75], axis=0)
+    iqr = q75 - q25
+    scale = np.where(iqr == 0, 1.0, iqr)
+    return values.std(axis=0, ddof=1) / scale, values
+
+
+def _correlated_columns(values, max_correlation):
+    """
+    Positions dropped by a greedy pass in column order: a column goes if its
+    |Pearson r| with any kept column exceeds max_correlation.
+    """
+    std = values.std(axis=0)
+    z = np.divide(values - values.mean(axis=0), std, out=np.zeros_like(values), where=std > 0)
+    corr = np.abs(z.T @ z) / len(values)
+
+    kept, dropped = [], []
+    for col in range(values.shape[1]):
+        if kept and corr[col, kept].max() > max_correlation:
+            dropped.append(col)
+        else:
+            kept.append(col)
+    return dropped
+
+
+class TrainingSetBuilder:
+    """
+    Row sampling and feature pruning for anomaly model training.
+
+    Args:
+        n_samples: Training rows (None = every row)
+        sampling: 'reservoir' (uniform) or 'stratified'
+        strata: Low-cardinality column to stratify on (e.g. a flag);
+            required for sampling='stratified'
+        min_std: Drop columns whose robust spread is at or below this
+        max_correlation: Drop columns correlated above this with an
+            earlier kept column (absolute Pearson r)
+        max_features: Keep at most this many columns (widest spread first)
+        random_state: Sampling seed
+    """
+
+    def __init__(self, n_samples=None, sampling='reservoir', strata=None, min_std=None,
+                 max_correlation=None, max_features=None, random_state=42):
+        if sampling not in SAMPLING_METHODS:
+            raise ValueError(f"Unknown sampling method: {sampling}. Available: {list(SAMPLING_METHODS)}")
+        if sampling == 'stratified' and strata is None:
+            raise ValueError("sampling='stratified' needs a strata column")
+        self.n_samples = n_samples
+        self.sampling = sampling
+        self.strata = strata
+        self.min_std = min_std
+        self.max_correlation = max_correlation
+        self.max_features = max_features
+        self.random_state = random_state
+
+    def sample_rows(self, features_df):
+        """Sorted positions of the training rows in features_df"""
+        n_rows = len(features_df)
+        if self.n_samples is None or self.n_samples >= n_rows:
+            return np.arange(n_rows)
+
+        if self.sampling == 'reservoir':
+            sampler = ReservoirSampler(self.n_samples, random_state=self.random_state)
+            return np.sort(sampler.add(np.arange(n_rows)[:, np.newaxis]).sample[:, 0])
+
+        # Proportional allocation, at least one row per stratum
+        codes, _ = pd.factorize(features_df[self.strata], use_na_sentinel=False)
+        counts = np.bincount(codes)
+        allocation = np.minimum(counts, np.maximum(1, np.round(self.n_samples * counts / n_rows).astype(np.int64)))
+        rng = np.random.default_rng(self.random_state)
+        members = np.argsort(codes, kind='stable')
+        bounds = np.concatenate([[0], np.cumsum(counts)])
+        rows = [rng.choice(members[bounds[s]:bounds[s + 1]], allocation[s], replace=False)
+                for s in range(len(counts))]
+        return np.sort(np.concatenate(rows))
+
+    def select_columns(self, training_df):
+        """
+        Columns kept after pruning, in feature order.
+
+        Returns:
+            columns: Kept column names
+            dropped: Dict of pruning step -> dropped column names
+        """
+        plan = FeaturePlan.for_frame(training_df)
+        columns = list(plan.columns)
+        values = plan.values(training_df)
+        spread, values = _robust_spread(values)
+        keep = np.arange(len(columns))
+        dropped = {'low_variance': [], 'correlated': [], 'over_budget': []}
+
+        if self.min_std is not None:
+            low = spread[keep] <= self.min_std
+            dropped['low_variance'] = [columns[c] for c in keep[low]]
+            keep = keep[~low]
+
+        if self.max_correlation is not None and len(keep) > 1:
+            correlated = _correlated_columns(values[:, keep], self.max_correlation)
+            dropped['correlated'] = [columns[c] for c in keep[correlated]]
+            keep = np.delete(keep, correlated)
+
+        if self.max_features is not None and len(keep) > self.max_features:
+            widest = np.sort(np.argsort(-spread[keep], kind='stable')[:self.max_features])
+            dropped['over_budget'] = [columns[c] for c in np.delete(keep, widest)]
+            keep = keep[widest]
+
+        if not len(keep):
+            raise ValueError("Feature pruning left no columns; relax min_std or max_correlation")
+        return [columns[c] for c in keep], dropped
+
+    def build(self, features_df):
+        """
+        Choose training rows and columns.
+
+        Returns:
+            rows: Sorted row positions in features_df
+            columns: Kept feature columns
+            summary: JSON-serializable record of the choices
+        """
+        rows = self.sample_rows(features_df)
+        columns, dropped = self.select_columns(features_df.iloc[rows])
+        summary = {
+            'sampling': self.sampling if len(rows) < len(features_df) else 'none',
+            'strata': self.strata,
+            'n_input_rows': int(len(features_df)),
+            'n_rows': int(len(rows)),
+            'random_state': self.random_state,
+            'min_std': self.min_std,
+            'max_correlation': self.max_correlation,
+            'max_features': self.max_features,
+            'n_features': len(columns),
+            'dropped': dropped,
+        }
+        return rows, columns, summary
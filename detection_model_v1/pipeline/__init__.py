@@ -0,0 +1,27 @@
+"""Pipeline module for stage-graph execution"""
+
+from .stage_graph import (
+    Stage,
+    StageGraph
+)
+
+from .artifact_store import (
+    ArtifactStore,
+    read_table,
+    register_format
+)
+
+from .stages import (
+    build_pipeline,
+    DEFAULT_ARTIFACTS
+)
+
+__all__ = [
+    'Stage',
+    'StageGraph',
+    'ArtifactStore',
+    'read_table',
+    'register_format',
+    'build_pipeline',
+    'DEFAULT_ARTIFACTS'
+]
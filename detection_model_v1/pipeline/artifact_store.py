@@ -0,0 +1,268 @@
+"""
+Artifact Store
+
+Reads and writes pipeline artifacts (input copy, preprocessed features,
+scores, risk details, predictions) under detection_model_v1/data.
+
+Parquet (columnar, typed, zstd-compressed) is the default format; CSV is
+kept as an export for deliverables and for reading artifacts written by
+older runs. Formats are pluggable via register_format().
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+def _write_parquet(df, path):
+    df.to_parquet(path, index=False, compression='zstd')
+
+
+def _read_parquet(path, columns=None):
+    return pd.read_parquet(path, columns=columns)
+
+
+def _write_csv(df, path):
+    df.to_csv(path, index=False)
+
+
+def _read_csv(path, columns=None):
+    return pd.read_csv(path, usecols=columns)
+
+
+# Format name -> (suffix, writer(df, path), reader(path, columns))
+FORMATS = {
+    'parquet': ('.parquet', _write_parquet, _read_parquet),
+    'csv': ('.csv', _write_csv, _read_csv),
+}
+
+# Artifact name -> layout. float32 marks artifacts whose float columns can be
+# stored in single precision (feature matrices, not 4-decimal scores).
+# export_csv marks deliverables that always get a CSV copy.
+ARTIFACTS = {
+    'master_features': {'dir': 'input', 'float32': True, 'export_csv': False},
+    'preprocessed_features': {'dir': 'intermediate', 'float32': True, 'export_csv': False},
+    'rule_based_scores': {'dir': 'intermediate', 'float32': False, 'export_csv': False},
+    'scores_isolation_forest': {'dir': 'intermediate', 'float32': False, 'export_csv': False},
+    'scores_isolation_forest_raw': {'dir': 'intermediate', 'float32': False, 'export_csv': False},
+    'risk_details': {'dir': 'intermediate', 'float32': False, 'export_csv': False},
+    'model_output': {'dir': 'output', 'float32': False, 'export_csv': True},
+    'model_output_explanations': {'dir': 'output', 'float32': False, 'export_csv': True},
+}
+
+
+def register_format(name, suffix, writer, reader):
+    """Register an additional artifact format (writer(df, path), reader(path, columns))"""
+    FORMATS[name] = (suffix, writer, reader)
+
+
+def format_for_path(path):
+    """Return the registered format name for a file suffix"""
+    suffix = Path(path).suffix.lower()
+    for name, (fmt_suffix, _, _) in FORMATS.items():
+        if fmt_suffix == suffix:
+            return name
+    raise ValueError(f"No artifact format registered for '{suffix}' ({path})")
+
+
+def read_table(path, columns=None):
+    """
+    Read a table file in any registered format.
+
+    Args:
+        path: File path; the format is chosen from its suffix
+        columns: Optional column subset. Columns missing from the file are
+            skipped rather than raising, so callers can pass every column
+            they might use.
+
+    Returns:
+        DataFrame with the requested columns
+    """
+    path = Path(path)
+    _, _, reader = FORMATS[format_for_path(path)]
+    if columns is not None:
+        available = set(read_columns(path))
+        columns = [col for col in columns if col in available]
+    return reader(path, columns)
+
+
+def iter_table(path, columns=None, chunksize=100_000):
+    """Yield a table file in row blocks of at most chunksize rows"""
+    path = Path(path)
+    fmt = format_for_path(path)
+    if columns is not None:
+        available = set(read_columns(path))
+        columns = [col for col in columns if col in available]
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    elif fmt == 'csv':
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunksize)
+    else:
+        df = FORMATS[fmt][2](path, columns)
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+
+
+class TableAppender:
+    """
+    Writes a table incrementally, one DataFrame block at a time.
+
+    Parquet blocks become row groups of one file; CSV blocks are appended
+    after a single header. Use as a context manager or call close().
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.fmt = format_for_path(self.path)
+        if self.fmt not in ('parquet', 'csv'):
+            raise ValueError(f"Incremental writes not supported for format '{self.fmt}'")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._writer = None
+        self._started = False
+        self.rows = 0
+
+    def write(self, df):
+        if self.fmt == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema, compression='zstd')
+            self._writer.write_table(table)
+        else:
+            df.to_csv(self.path, mode='a' if self._started else 'w', header=not self._started, index=False)
+        self._started = True
+        self.rows += len(df)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_columns(path):
+    """Return the column names of a table file without loading its rows"""
+    path = Path(path)
+    fmt = format_for_path(path)
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.read_schema(path).names
+    if fmt == 'csv':
+        return pd.read_csv(path, nrows=0).columns.tolist()
+    return FORMATS[fmt][2](path, None).columns.tolist()
+
+
+def downcast_floats(df):
+    """Store float64 columns as float32"""
+    float_cols = df.select_dtypes(include=[np.float64]).columns
+    if len(float_cols) == 0:
+        return df
+    return df.astype({col: np.float32 for col in float_cols})
+
+
+class ArtifactStore:
+    """
+    Artifact store rooted at a data directory (input/, intermediate/, output/).
+
+    Args:
+        data_dir: detection_model_v1/data
+        fmt: Storage format for writes (default 'parquet')
+    """
+
+    def __init__(self, data_dir, fmt='parquet'):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format: {fmt}. Available: {list(FORMATS)}")
+        self.data_dir = Path(data_dir)
+        self.fmt = fmt
+
+    def path(self, name, fmt=None):
+        """Path of an artifact in the given format (default: store format)"""
+        fmt = fmt or self.fmt
+        layout = ARTIFACTS.get(name, {'dir': 'intermediate'})
+        return self.data_dir / layout['dir'] / f"{name}{FORMATS[fmt][0]}"
+
+    def find(self, name):
+        """
+        Path of an existing artifact, preferring the store format, then any
+        other registered format. Returns None if the artifact was never written.
+
+        Writes remove the artifact's files in other formats (except the CSV
+        export of deliverables), so the file found is the latest write.
+        """
+        for fmt in [self.fmt] + [f for f in FORMATS if f != self.fmt]:
+            path = self.path(name, fmt)
+            if path.exists():
+                return path
+        return None
+
+    def exists(self, name):
+        return self.find(name) is not None
+
+    def _remove_stale(self, name):
+        """Delete files of an artifact left in other formats by earlier runs"""
+        layout = ARTIFACTS.get(name, {'export_csv': False})
+        for fmt in FORMATS:
+            if fmt == self.fmt or (fmt == 'csv' and layout['export_csv']):
+                continue
+            self.path(name, fmt).unlink(missing_ok=True)
+
+    def write(self, name, df):
+        """Write an artifact; deliverables also get a CSV export"""
+        layout = ARTIFACTS.get(name, {'float32': False, 'export_csv': False})
+        if layout['float32'] and self.fmt != 'csv':
+            df = downcast_floats(df)
+
+        path = self.path(name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._remove_stale(name)
+        FORMATS[self.fmt][1](df, path)
+
+        if layout['export_csv'] and self.fmt != 'csv':
+            self.export_csv(name, df)
+        return path
+
+    def read(self, name, columns=None):
+        """Read an artifact, optionally projecting to a column subset"""
+        path = self.find(name)
+        if path is None:
+            raise FileNotFoundError(f"Artifact '{name}' not found under {self.data_dir}")
+        return read_table(path, columns)
+
+    def appender(self, name):
+        """
+        Incremental writer for an artifact (see TableAppender).
+
+        Returns a list of appenders: the store format, plus a CSV export for
+        deliverables. Call write(df) on each, then close().
+        """
+        layout = ARTIFACTS.get(name, {'export_csv': False})
+        self._remove_stale(name)
+        appenders = [TableAppender(self.path(name))]
+        if layout['export_csv'] and self.fmt != 'csv':
+            appenders.append(TableAppender(self.path(name, 'csv')))
+        return appenders
+
+    def iter_read(self, name, columns=None, chunksize=100_000):
+        """Yield an artifact in row blocks"""
+        path = self.find(name)
+        if path is None:
+            raise FileNotFoundError(f"Artifact '{name}' not found under {self.data_dir}")
+        return iter_table(path, columns, chunksize)
+
+    def export_csv(self, name, df=None):
+        """Write a CSV copy of an artifact (reads it back if df is not given)"""
+        if df is None:
+            df = self.read(name)
+        path = self.path(name, 'csv')
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _write_csv(df, path)
+        return path
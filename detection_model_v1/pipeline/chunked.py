@@ -0,0 +1,167 @@
+"""
+Chunked Scoring
+
+Scores master_features in fixed-size row blocks with an already fitted
+preprocessor and Isolation Forest, writing results incrementally so peak memory
+depends on the block size rather than the number of customers.
+
+The global steps of the in-memory pipeline get streaming versions:
+1. Anomaly scores: models saved with a score calibrator are scored block by
+   block with no global state. Older models are min/max-normalized: pass 1
+   tracks the raw score range while spilling raw scores; pass 2 normalizes
+   with the global range.
+2. Top-k threshold: block histograms of the 4-decimal risk scores
+   (models.thresholds.ScoreHistogram) give the same exact cutoff as the
+   in-memory selection; a final pass applies it.
+"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+from .artifact_store import ArtifactStore
+
+logger = logging.getLogger(__name__)
+
+
+def _close_all(appenders):
+    for appender in appenders:
+        appender.close()
+
+
+def _write_all(appenders, df):
+    for appender in appenders:
+        appender.write(df)
+
+
+def _fuse_block(customer_ids, rule, anomaly, rule_weight, anomaly_weight):
+    """risk_details rows for one block (same arithmetic as fuse_risk_scores)"""
+    risk = np.clip(rule_weight * rule + anomaly_weight * anomaly, 0.0, 1.0)
+    return pd.DataFrame({
+        'customer_id': customer_ids,
+        'rule_based_score': np.round(rule, 4),
+        'anomaly_score': anomaly,
+        'risk_score': np.round(risk, 4),
+    })
+
+
+def score_chunked(input_path, model_dir, data_dir, chunksize=100_000, rule_weight=0.7,
+                  anomaly_weight=0.3, top_percentile=5, fmt='parquet'):
+    """
+    Score a portfolio block by block with a fitted model.
+
+    Args:
+        input_path: master_features .csv or .parquet
+        model_dir: Directory written by save_model (bundle/ or pickles)
+        data_dir: Artifact root (input/, intermediate/, output/)
+        chunksize: Rows per block
+        rule_weight: Weight for rule-based score
+        anomaly_weight: Weight for anomaly score
+        top_percentile: Top N% to flag
+        fmt: Artifact storage format
+
+    Returns:
+        summary: Dict with customer count, threshold and flagged count
+    """
+    from models.anomaly_detector import load_model, load_anomaly_calibrator, normalize_anomaly_scores
+    from models.flat_forest import flatten_forest
+    from models.thresholds import ScoreHistogram, TopKSelector, top_k_count
+    from preprocessing.data_preprocessor import preprocess_features
+    from preprocessing.feature_loader import iter_master_features
+    from scripts.rule_based_scorer import score_features
+
+    if abs(rule_weight + anomaly_weight - 1.0) > 0.001:
+        raise ValueError(f"Weights must sum to 1.0, got {rule_weight} + {anomaly_weight} = {rule_weight + anomaly_weight}")
+
+    store = ArtifactStore(data_dir, fmt=fmt)
+    detector, preprocessor = load_model(model_dir)
+    # Legacy pickled models are scored through the flat arrays too
+    detector = flatten_forest(detector)
+    calibrator = load_anomaly_calibrator(model_dir)
+    if calibrator is None:
+        logger.info("  Model has no score calibrator: normalizing with the global min/max")
+
+    # Pass 1: rule scores + anomaly scores per block. Calibrated models fuse
+    # here; otherwise raw scores are spilled until the global range is known.
+    logger.info("[PASS 1] Rule-based and anomaly scores...")
+    raw_min, raw_max = np.inf, -np.inf
+    n_customers = 0
+    histogram = ScoreHistogram()
+    rule_out = store.appender('rule_based_scores')
+    if calibrator is not None:
+        anomaly_out = store.appender('scores_isolation_forest')
+        details_out = store.appender('risk_details')
+        block_out = rule_out + anomaly_out + details_out
+    else:
+        raw_out = store.appender('scores_isolation_forest_raw')
+        block_out = rule_out + raw_out
+    try:
+        for chunk in iter_master_features(input_path, chunksize=chunksize):
+            rule_scores_df = score_features(chunk)
+            _write_all(rule_out, rule_scores_df)
+
+            preprocessed_df, _ = preprocess_features(chunk, scaler=preprocessor, fit_scaler=False)
+            raw = detector.score_samples(preprocessed_df)
+            customer_ids = rule_scores_df['customer_id'].values
+
+            if calibrator is not None:
+                anomaly = calibrator.transform(raw)
+                _write_all(anomaly_out, pd.DataFrame({'customer_id': customer_ids, 'score': anomaly}))
+                details = _fuse_block(customer_ids, rule_scores_df['rule_based_score'].to_numpy(), anomaly,
+                                      rule_weight, anomaly_weight)
+                _write_all(details_out, details)
+                histogram.add(details['risk_score'])
+            else:
+                raw_min = min(raw_min, raw.min())
+                raw_max = max(raw_max, raw.max())
+                spill = rule_scores_df[['customer_id', 'rule_based_score']].copy()
+                spill['raw_score'] = raw
+                _write_all(raw_out, spill)
+
+            n_customers += len(chunk)
+            logger.info(f"  Scored {n_customers:,} customers")
+    finally:
+        _close_all(block_out)
+
+    # Pass 2 (uncalibrated models only): normalize with the global range, fuse, histogram
+    if calibrator is None:
+        logger.info("[PASS 2] Normalizing and fusing...")
+        anomaly_out = store.appender('scores_isolation_forest')
+        details_out = store.appender('risk_details')
+        try:
+            for spill in store.iter_read('scores_isolation_forest_raw', chunksize=chunksize):
+                customer_ids = spill['customer_id'].values
+                anomaly = normalize_anomaly_scores(spill['raw_score'].to_numpy(), (raw_min, raw_max))
+                _write_all(anomaly_out, pd.DataFrame({'customer_id': customer_ids, 'score': anomaly}))
+                details = _fuse_block(customer_ids, spill['rule_based_score'].to_numpy(), anomaly,
+                                      rule_weight, anomaly_weight)
+                _write_all(details_out, details)
+                histogram.add(details['risk_score'])
+        finally:
+            _close_all(anomaly_out + details_out)
+
+    # Exact top-k cutoff from the merged block histograms
+    k = top_k_count(n_customers, top_percentile)
+    threshold, tie_quota = histogram.top_k_cutoff(k)
+    selector = TopKSelector(threshold, tie_quota)
+    logger.info(f"  Threshold: {threshold:.4f} (top {k:,})")
+
+    # Final pass: apply the global threshold
+    logger.info("[PREDICT] Generating predictions...")
+    flagged_count = 0
+    output = store.appender('model_output')
+    try:
+        for details in store.iter_read('risk_details', columns=['customer_id', 'risk_score'], chunksize=chunksize):
+            predictions = pd.DataFrame({
+                'customer_id': details['customer_id'].values,
+                'predicted_label': selector.select(details['risk_score'].to_numpy()).astype(int),
+                'risk_score': details['risk_score'].values,
+            })
+            flagged_count += int(predictions['predicted_label'].sum())
+            _write_all(output, predictions)
+    finally:
+        _close_all(output)
+
+    logger.info(f"  Flagged: {flagged_count:,} customers ({100*flagged_count/max(n_customers, 1):.2f}%)")
+    return {'customers': n_customers, 'threshold': threshold, 'flagged': flagged_count}
@@ -0,0 +1,142 @@
+"""
+Stage Graph Runner
+
+Runs the detection pipeline as a graph of stages that share one in-memory
+context instead of handing CSV paths from step to step.
+
+Each stage declares the context keys it reads (inputs) and the keys it
+produces (outputs). The runner resolves which stages are needed for the
+requested targets, runs them in dependency order, and only writes the
+artifacts that were explicitly asked for.
+"""
+
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Stage:
+    """
+    A single pipeline step.
+
+    Args:
+        name: Stage name used in logs
+        func: Callable taking the input values as keyword arguments and
+            returning a dict with one entry per declared output
+        inputs: Context keys the stage reads
+        outputs: Context keys the stage produces
+    """
+
+    def __init__(self, name, func, inputs=(), outputs=()):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, inputs={list(self.inputs)}, outputs={list(self.outputs)})"
+
+
+class StageGraph:
+    """
+    Dependency-ordered collection of stages.
+
+    Args:
+        stages: Iterable of Stage objects. Every output key must be produced
+            by exactly one stage.
+        artifacts: Dict mapping artifact name -> context key. An artifact is
+            written only when it is requested in run().
+        store: ArtifactStore used to write materialized artifacts
+    """
+
+    def __init__(self, stages, artifacts=None, store=None):
+        self.stages = list(stages)
+        self.artifacts = dict(artifacts or {})
+        self.store = store
+
+        self._producers = {}
+        for stage in self.stages:
+            for key in stage.outputs:
+                if key in self._producers:
+                    raise ValueError(
+                        f"Output '{key}' produced by both '{self._producers[key].name}' and '{stage.name}'"
+                    )
+                self._producers[key] = stage
+
+        for name, key in self.artifacts.items():
+            if key not in self._producers:
+                raise ValueError(f"Artifact '{name}' refers to unknown output '{key}'")
+
+    def plan(self, targets, provided=()):
+        """
+        Return the stages needed to produce targets, in execution order.
+
+        Keys listed in provided are treated as already available.
+        """
+        provided = set(provided)
+        ordered = []
+        visiting = set()
+        done = set()
+
+        def visit(key):
+            if key in provided:
+                return
+            stage = self._producers.get(key)
+            if stage is None:
+                raise KeyError(f"No stage produces '{key}'")
+            if stage.name in done:
+                return
+            if stage.name in visiting:
+                raise ValueError(f"Cycle detected at stage '{stage.name}'")
+            visiting.add(stage.name)
+            for dep in stage.inputs:
+                visit(dep)
+            visiting.discard(stage.name)
+            done.add(stage.name)
+            ordered.append(stage)
+
+        for key in targets:
+            visit(key)
+        return ordered
+
+    def run(self, context=None, targets=None, materialize=()):
+        """
+        Run the stages needed for targets and the requested artifacts.
+
+        Args:
+            context: Dict of values already available (e.g. input paths)
+            targets: Context keys to compute (default: every stage output)
+            materialize: Artifact names to write to disk
+
+        Returns:
+            context: Dict with all computed values
+        """
+        context = dict(context or {})
+        materialize = list(materialize)
+
+        unknown = [name for name in materialize if name not in self.artifacts]
+        if unknown:
+            raise ValueError(f"Unknown artifacts: {unknown}. Available: {list(self.artifacts)}")
+
+        if targets is None:
+            targets = list(self._producers)
+        if materialize and self.store is None:
+            raise ValueError("Materializing artifacts requires a store")
+        targets = list(targets) + [self.artifacts[name] for name in materialize]
+
+        for stage in self.plan(targets, provided=context.keys()):
+            logger.info(f"\n[STAGE] {stage.name}")
+            start = time.perf_counter()
+            result = stage.func(**{key: context[key] for key in stage.inputs})
+            missing = [key for key in stage.outputs if key not in result]
+            if missing:
+                raise ValueError(f"Stage '{stage.name}' did not produce: {missing}")
+            context.update({key: result[key] for key in stage.outputs})
+            logger.info(f"  {stage.name} finished in {time.perf_counter() - start:.2f}s")
+
+        for name in materialize:
+            path = self.store.write(name, context[self.artifacts[name]])
+            logger.info(f"Saved {name}: {path}")
+
+        return context
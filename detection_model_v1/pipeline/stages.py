@@ -0,0 +1,226 @@
+"""
+Detection Pipeline Stages
+
+Defines the stages of the v1 detection pipeline (load, preprocess, rule
+score, anomaly score, fuse, predict, explain) and the artifacts each one can
+write.
+All stages share the master_features frame loaded once in the load stage.
+"""
+
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .artifact_store import ArtifactStore
+from .stage_graph import Stage, StageGraph
+
+logger = logging.getLogger(__name__)
+
+# Artifacts written by default: everything analyze_outputs.py,
+# verify_outputs.py and test_fusion_combinations.py read back.
+DEFAULT_ARTIFACTS = [
+    'rule_based_scores',
+    'scores_isolation_forest',
+    'risk_details',
+    'model_output',
+    'model_output_explanations',
+]
+
+
+def load_stage(input_path):
+    """Load master_features once for every downstream stage"""
+    from preprocessing.feature_loader import load_master_features
+    logger.info(f"Loading from: {input_path}")
+    features_df = load_master_features(input_path)
+    logger.info(f"Loaded {len(features_df):,} customers with {len(features_df.columns)} features")
+    logger.info(f"  - Customer IDs: {features_df['customer_id'].nunique():,}")
+    logger.info(f"  - Memory: {features_df.memory_usage(deep=True).sum() / 1e6:,.1f} MB")
+    return {'features': features_df}
+
+
+def make_preprocess_stage(model_dir, incremental=False, training_set=None):
+    """
+    Build the stage that selects, imputes and scales features for anomaly
+    detection, with the preprocessor the anomaly stage will train with:
+
+        - incremental=True with a model saved in model_dir: that model's
+          frozen preprocessor (the loaded model is passed on as warm_start)
+        - training_set (a TrainingSetBuilder): a preprocessor fit on the
+          rows and columns it chooses (passed on as train_rows)
+        - otherwise: a preprocessor fit on every row
+    """
+
+    def preprocess_stage(features):
+        from models.anomaly_detector import load_warm_start, prepare_training_set
+        from preprocessing.data_preprocessor import preprocess_features
+
+        warm_start = load_warm_start(model_dir) if incremental else None
+        train_rows = None
+        if warm_start is not None:
+            preprocessor = warm_start[1]
+            preprocessed_df, _ = preprocess_features(features, scaler=preprocessor, fit_scaler=False)
+            logger.info(f"Preprocessed {len(preprocessed_df.columns)} features with the saved model's preprocessor")
+        elif training_set is not None:
+            preprocessed_df, preprocessor, train_rows = prepare_training_set(features, training_set)
+            logger.info(f"Preprocessed {len(preprocessed_df.columns)} features fit on the training set")
+        else:
+            preprocessed_df, preprocessor = preprocess_features(features, fit_scaler=True)
+            logger.info(f"Preprocessed {len(preprocessed_df.columns)} features")
+        return {'preprocessed': preprocessed_df, 'preprocessor': preprocessor, 'warm_start': warm_start,
+                'train_rows': train_rows}
+
+    return preprocess_stage
+
+
+def rule_score_stage(features):
+    """Score the 5 red-flag categories, keeping the triggered rules as a bitmask"""
+    from scripts.rule_based_scorer import score_features
+    rule_scores_df, rule_bits = score_features(features, rule_bits=True)
+    logger.info(f"Rule-based scoring complete: {len(rule_scores_df):,} customers scored")
+    logger.info(f"  Score range: {rule_scores_df['rule_based_score'].min():.3f} .. {rule_scores_df['rule_based_score'].max():.3f}")
+    return {'rule_scores': rule_scores_df, 'rule_bits': rule_bits}
+
+
+def make_anomaly_stage(model_dir, contamination=0.05, tree_budget=None):
+    """
+    Build the Isolation Forest train + score stage.
+
+    With a warm_start from the preprocess stage (make_preprocess_stage with
+    incremental=True) the saved model is updated (oldest trees replaced, at
+    most tree_budget per run) instead of being retrained from scratch; the
+    first run still trains a full forest. With train_rows (a training set)
+    the forest is fit on those rows only. Either way the model trains on and
+    scores the preprocess stage's matrix.
+    """
+
+    def anomaly_stage(features, preprocessed, preprocessor, warm_start, train_rows):
+        from models.anomaly_detector import TREE_BUDGET, train_isolation_forest, save_model
+        from models.calibration import ScoreCalibrator
+        from models.flat_forest import flatten_forest
+
+        if warm_start is None:
+            detector, preprocessor, preprocessed = train_isolation_forest(
+                features, contamination=contamination, preprocessed_df=preprocessed, preprocessor=preprocessor,
+                train_rows=train_rows
+            )
+            logger.info("Isolation Forest trained")
+            if train_rows is not None:
+                summary = preprocessor.training_set
+                logger.info(f"  Training set: {summary['n_rows']:,} of {summary['n_input_rows']:,} rows "
+                            f"({summary['sampling']}), {summary['n_features']} features")
+        else:
+            # preprocessed already went through the saved model's frozen preprocessor
+            detector, preprocessor, preprocessed = train_isolation_forest(
+                features, contamination=contamination, preprocessed_df=preprocessed, preprocessor=preprocessor,
+                warm_start=warm_start, tree_budget=TREE_BUDGET if tree_budget is None else tree_budget
+            )
+            counts = np.bincount(detector.tree_generation)
+            logger.info(f"Isolation Forest warm-started: generation {detector.generation}, "
+                        f"{counts[-1]} of {detector.n_trees} trees from that generation")
+
+        # Calibrate on the training scores; the calibrator is saved with the model
+        raw_scores = flatten_forest(detector).score_samples(preprocessed)
+        calibrator = ScoreCalibrator.fit(raw_scores)
+        anomaly_scores_df = pd.DataFrame({
+            'customer_id': features['customer_id'].values,
+            'score': calibrator.transform(raw_scores),
+        })
+        logger.info(f"Anomaly detection complete: {len(anomaly_scores_df):,} customers scored")
+        logger.info(f"  Score range: {anomaly_scores_df['score'].min():.4f} .. {anomaly_scores_df['score'].max():.4f}")
+
+        save_model(detector, preprocessor, model_dir, calibrator=calibrator)
+        logger.info(f"Model saved to: {model_dir}")
+        return {'anomaly_scores': anomaly_scores_df, 'detector': detector}
+
+    return anomaly_stage
+
+
+def make_fuse_stage(rule_weight=0.7, anomaly_weight=0.3):
+    """Build the weighted risk fusion stage"""
+
+    def fuse_stage(rule_scores, anomaly_scores):
+        from models.risk_fusion import fuse_risk_scores
+        fused_df = fuse_risk_scores(rule_scores, anomaly_scores, rule_weight=rule_weight, anomaly_weight=anomaly_weight)
+        logger.info(f"Risk score fusion complete: {len(fused_df):,} customers")
+        logger.info(f"  Fused score range: {fused_df['risk_score'].min():.4f} .. {fused_df['risk_score'].max():.4f}")
+        return {'fused': fused_df}
+
+    return fuse_stage
+
+
+def make_predict_stage(threshold=None, top_percentile=5):
+    """Build the top-percentile prediction stage"""
+
+    def predict_stage(fused):
+        from models.risk_fusion import generate_predictions
+        predictions_df, used_threshold = generate_predictions(fused, threshold=threshold, top_percentile=top_percentile)
+        flagged_count = predictions_df['predicted_label'].sum()
+        logger.info(f"  Threshold: {used_threshold:.4f}")
+        logger.info(f"  Flagged: {flagged_count:,} customers ({100*flagged_count/len(predictions_df):.2f}%)")
+        return {'predictions': predictions_df, 'threshold': used_threshold}
+
+    return predict_stage
+
+
+def explain_stage(predictions, fused, rule_scores, rule_bits):
+    """Explain the flagged customers from their triggered rules and category scores"""
+    from explainability.explanation_generator import generate_explanations
+    explanations_df = generate_explanations(predictions, fused, rule_scores, rule_bits)
+    logger.info(f"Explanations generated: {len(explanations_df):,} flagged customers")
+    return {'explanations': explanations_df}
+
+
+def build_pipeline(base_dir, rule_weight=0.7, anomaly_weight=0.3, top_percentile=5, contamination=0.05,
+                   fmt='parquet', incremental=False, tree_budget=None, training_set=None):
+    """
+    Build the v1 detection stage graph.
+
+    Args:
+        base_dir: detection_model_v1 directory (artifacts go under data/)
+        rule_weight: Weight for rule-based score
+        anomaly_weight: Weight for anomaly score
+        top_percentile: Top N% to flag
+        contamination: Isolation Forest contamination
+        fmt: Artifact storage format ('parquet' or 'csv')
+        incremental: Warm-start the saved Isolation Forest instead of
+            retraining it (see make_preprocess_stage, make_anomaly_stage)
+        tree_budget: Trees replaced per incremental run (default:
+            anomaly_detector.TREE_BUDGET)
+        training_set: Optional TrainingSetBuilder for full training (row
+            sampling, feature pruning)
+
+    Returns:
+        StageGraph expecting 'input_path' in the run context
+    """
+    base_dir = Path(base_dir)
+    model_dir = base_dir / 'models' / 'saved'
+
+    stages = [
+        Stage('load', load_stage, inputs=['input_path'], outputs=['features']),
+        Stage('preprocess', make_preprocess_stage(model_dir, incremental, training_set),
+              inputs=['features'], outputs=['preprocessed', 'preprocessor', 'warm_start', 'train_rows']),
+        Stage('rule_score', rule_score_stage, inputs=['features'], outputs=['rule_scores', 'rule_bits']),
+        Stage('anomaly_score', make_anomaly_stage(model_dir, contamination, tree_budget),
+              inputs=['features', 'preprocessed', 'preprocessor', 'warm_start', 'train_rows'],
+              outputs=['anomaly_scores', 'detector']),
+        Stage('fuse', make_fuse_stage(rule_weight, anomaly_weight),
+              inputs=['rule_scores', 'anomaly_scores'], outputs=['fused']),
+        Stage('predict', make_predict_stage(top_percentile=top_percentile),
+              inputs=['fused'], outputs=['predictions', 'threshold']),
+        Stage('explain', explain_stage,
+              inputs=['predictions', 'fused', 'rule_scores', 'rule_bits'], outputs=['explanations']),
+    ]
+
+    artifacts = {
+        'master_features': 'features',
+        'preprocessed_features': 'preprocessed',
+        'rule_based_scores': 'rule_scores',
+        'scores_isolation_forest': 'anomaly_scores',
+        'risk_details': 'fused',
+        'model_output': 'predictions',
+        'model_output_explanations': 'explanations',
+    }
+
+    return StageGraph(stages, artifacts, store=ArtifactStore(base_dir / 'data', fmt=fmt))
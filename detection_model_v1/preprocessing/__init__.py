@@ -1,15 +1,31 @@
 """Preprocessing module for anomaly detection"""
 
 from .data_preprocessor import (
+    Preprocessor,
     preprocess_features,
     select_features_for_anomaly_detection,
     save_scaler,
     load_scaler
 )
 
+from .customer_index import CustomerIndex
+from .feature_plan import FeaturePlan
+
+from .feature_loader import (
+    load_master_features,
+    feature_dtype,
+    register_feature_dtype
+)
+
 __all__ = [
+    'Preprocessor',
     'preprocess_features',
     'select_features_for_anomaly_detection',
     'save_scaler',
-    'load_scaler'
+    'load_scaler',
+    'CustomerIndex',
+    'FeaturePlan',
+    'load_master_features',
+    'feature_dtype',
+    'register_feature_dtype'
 ]
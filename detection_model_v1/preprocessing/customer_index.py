@@ -0,0 +1,140 @@
+"""
+Customer ID Index
+
+Interns customer IDs once, at load time, into contiguous int32 codes so
+joins, sorts and filters inside the pipeline compare integers instead of
+hashing Python strings.
+
+Frames carry customer_id as a pandas Categorical over the shared index
+(codes = int32 positions, categories = the IDs). Every frame derived from
+the loaded features keeps the same categories, so aligning two of them is
+an integer lookup; CSV/Parquet writers decode the IDs at export.
+"""
+
+import numpy as np
+import pandas as pd
+
+CODE_DTYPE = np.int32
+
+
+class CustomerIndex:
+    """
+    Customer ID <-> int32 code dictionary.
+
+    Args:
+        customer_ids: Unique customer IDs; an ID's code is its position
+    """
+
+    def __init__(self, customer_ids=()):
+        self._index = customer_ids if isinstance(customer_ids, pd.Index) else pd.Index(customer_ids, dtype=object)
+        if not self._index.is_unique:
+            raise ValueError("Customer IDs in an index must be unique")
+
+    @classmethod
+    def factorize(cls, customer_ids):
+        """
+        Build an index from a column of IDs (first-seen order).
+
+        Returns:
+            index: CustomerIndex
+            codes: int32 code per input row
+        """
+        codes, uniques = pd.factorize(np.asarray(customer_ids, dtype=object))
+        return cls(pd.Index(uniques, dtype=object)), codes.astype(CODE_DTYPE)
+
+    @classmethod
+    def of(cls, customer_ids):
+        """Index of an interned (categorical) customer_id column, without rehashing"""
+        if isinstance(customer_ids.dtype, pd.CategoricalDtype):
+            return cls(customer_ids.cat.categories)
+        return cls.factorize(customer_ids)[0]
+
+    def __len__(self):
+        return len(self._index)
+
+    @property
+    def ids(self):
+        """Customer ID per code"""
+        return self._index.to_numpy()
+
+    def encode(self, customer_ids):
+        """
+        int32 code of each ID (-1 if unknown). Categoricals are mapped through
+        their categories, so only the distinct IDs are hashed.
+        """
+        if isinstance(getattr(customer_ids, 'dtype', None), pd.CategoricalDtype):
+            categorical = pd.Categorical(customer_ids)
+            codes = categorical.codes.astype(CODE_DTYPE)
+            if categorical.categories is self._index or categorical.categories.equals(self._index):
+                return codes
+            mapping = self._index.get_indexer(categorical.categories).astype(CODE_DTYPE)
+            return np.where(codes >= 0, mapping[codes], -1).astype(CODE_DTYPE)
+        return self._index.get_indexer(np.asarray(customer_ids, dtype=object)).astype(CODE_DTYPE)
+
+    def decode(self, codes):
+        """Customer IDs for codes"""
+        return self._index.to_numpy()[np.asarray(codes)]
+
+    def categorical(self, codes):
+        """customer_id column for codes, sharing this index's categories"""
+        return pd.Categorical.from_codes(np.asarray(codes), dtype=pd.CategoricalDtype(self._index))
+
+    def intern(self, customer_ids):
+        """Interned customer_id column for IDs (unknown IDs become NaN)"""
+        return self.categorical(self.encode(customer_ids))
+
+    def extend(self, customer_ids):
+        """
+        Index with the unseen IDs appended; existing codes are unchanged.
+
+        Returns:
+            index: CustomerIndex (self if nothing is new)
+            codes: int32 code of each ID in the returned index
+        """
+        codes = self.encode(customer_ids)
+        new = codes == -1
+        if not new.any():
+            return self, codes
+        new_ids = pd.unique(np.asarray(customer_ids, dtype=object)[new])
+        index = CustomerIndex(self._index.append(pd.Index(new_ids, dtype=object)))
+        return index, index.encode(customer_ids)
+
+
+def intern_customer_ids(df, column='customer_id'):
+    """Replace a frame's customer_id column with its interned form, in place"""
+    index, codes = CustomerIndex.factorize(df[column])
+    df[column] = index.categorical(codes)
+    return index
+
+
+def shared_codes(left_ids, right_ids):
+    """
+    Codes of two customer_id columns in one index: the left column's own
+    index when it is interned, else one factorize pass over both.
+
+    Returns:
+        index, left_codes, right_codes
+    """
+    if isinstance(getattr(left_ids, 'dtype', None), pd.CategoricalDtype):
+        index = CustomerIndex.of(left_ids)
+        return index, index.encode(left_ids), index.encode(right_ids)
+    left_ids = np.asarray(left_ids, dtype=object)
+    index, codes = CustomerIndex.factorize(np.concatenate([left_ids, np.asarray(right_ids, dtype=object)]))
+    return index, codes[:len(left_ids)], codes[len(left_ids):]
+
+
+def align_codes(left_codes, right_codes, n_codes):
+    """
+    Inner join of two code arrays, in left order (as pd.merge(how='inner')
+    for unique keys).
+
+    Returns:
+        left_rows, right_rows: Matching row positions
+    """
+    right_pos = np.full(n_codes + 1, -1, dtype=np.int64)
+    valid = right_codes >= 0
+    right_pos[right_codes[valid]] = np.flatnonzero(valid)
+    # Unknown left codes (-1) hit the sentinel slot at the end
+    matched = right_pos[np.where(left_codes >= 0, left_codes, n_codes)]
+    left_rows = np.flatnonzero(matched >= 0)
+    return left_rows, matched[left_rows]
@@ -5,87 +5,196 @@ Prepares features for Isolation Forest by:
 1. Selecting relevant features
 2. Handling missing values
 3. Scaling/normalizing features
+
+Steps 2-3 are fitted once on training data (Preprocessor) and replayed
+unchanged at scoring time.
 """
 
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import StandardScaler
 from pathlib import Path
 import pickle
 
+from .feature_plan import FeaturePlan
+
 
 def select_features_for_anomaly_detection(features_df):
     """
     Select features suitable for anomaly detection.
     Excludes customer_id and rule-based features that are already used in rule-based scoring.
     
-    Returns DataFrame with selected features.
+    Returns DataFrame with selected features. The selection is computed once
+    per input schema (see FeaturePlan.for_frame).
     """
-    # Start with all numeric features
-    numeric_cols = features_df.select_dtypes(include=[np.number]).columns.tolist()
-    
-    # Remove customer_id if it's numeric (shouldn't be, but just in case)
-    if 'customer_id' in numeric_cols:
-        numeric_cols.remove('customer_id')
-    
-    # Exclude rule-based derived features to avoid double-counting
-    # Keep raw/aggregated features that Isolation Forest can learn patterns from
-    exclude_patterns = [
-        'structuring_risk', 'channel_risk', 'geographic_risk', 
-        'behavioral_risk', 'profile_risk', 'rule_based_score'
-    ]
-    
-    selected_features = [col for col in numeric_cols 
-                       if not any(pattern in col.lower() for pattern in exclude_patterns)]
-    
-    return features_df[selected_features]
+    return features_df.iloc[:, FeaturePlan.for_frame(features_df).positions]
+
+
+class Preprocessor:
+    """
+    Fitted preprocessing state for anomaly detection.
+
+    Bundles the selected column list, the training-time fill values for
+    NaN and +/-inf, and the StandardScaler, so transform() is one
+    vectorized pass with no reductions and does not depend on the batch.
+
+    Attributes:
+        columns: Selected feature columns, in training order
+        plan: FeaturePlan for columns (positions of the training schema)
+        nan_fill: Value used for NaN, per column (training median)
+        inf_fill: Value used for +/-inf, per column (training median after
+            NaN fill with infs removed, as the original two-step fill did)
+        mean: StandardScaler mean_, per column
+        scale: StandardScaler scale_, per column
+        scaler: Fitted StandardScaler (None when rebuilt from a model bundle)
+        training_set: How the training rows and columns were chosen (dict
+            from models.training_set.TrainingSetBuilder, or None)
+    """
+
+    def __init__(self, columns=None, nan_fill=None, inf_fill=None, mean=None, scale=None, scaler=None,
+                 training_set=None, plan=None):
+        self.columns = list(columns) if columns is not None else None
+        self.plan = plan
+        self.nan_fill = nan_fill
+        self.inf_fill = inf_fill
+        self.mean = mean
+        self.scale = scale
+        self.scaler = scaler
+        self.training_set = training_set
+
+    def __setstate__(self, state):
+        # Preprocessors pickled before training_set / plan existed
+        state.setdefault('training_set', None)
+        state.setdefault('plan', None)
+        self.__dict__.update(state)
+
+    def fit(self, features_df, columns=None):
+        """Select columns and learn fill values and scaling from training data"""
+        self.fit_transform(features_df, columns)
+        return self
+
+    def fit_transform(self, features_df, columns=None):
+        """
+        Fit on features_df and return its preprocessed form.
+
+        Args:
+            features_df: Training features
+            columns: Columns to use (default: select_features_for_anomaly_detection)
+        """
+        self.plan = FeaturePlan.for_frame(features_df) if columns is None else FeaturePlan.build(features_df, columns)
+        self.columns = list(self.plan.columns)
+        feature_data = features_df.iloc[:, self.plan.positions]
+
+        # Handle missing values - fill with median for numeric features
+        nan_median = feature_data.median()
+        feature_data = feature_data.fillna(nan_median)
+
+        # Replace inf/-inf with NaN, then fill
+        feature_data = feature_data.replace([np.inf, -np.inf], np.nan)
+        inf_median = feature_data.median()
+
+        # A NaN filled with an infinite median was then treated as inf
+        self.nan_fill = np.where(np.isfinite(nan_median), nan_median, inf_median).astype(np.float64)
+        self.inf_fill = inf_median.to_numpy(dtype=np.float64)
+
+        # Imported here so a Preprocessor rebuilt from arrays never loads sklearn
+        from sklearn.preprocessing import StandardScaler
+        self.scaler = StandardScaler()
+        self.scaler.fit(self._fill(features_df))
+        self.mean = self.scaler.mean_
+        self.scale = self.scaler.scale_
+        return self.transform(features_df)
 
+    def feature_values(self, features_df):
+        """
+        Raw training columns of features_df as a float64 array (by plan
+        position) that the fill and scaling steps may modify in place
+        """
+        if self.plan is None:
+            # Rebuilt from an older bundle or pickle: resolve columns by name
+            self.plan = FeaturePlan(self.columns)
+        return self.plan.values(features_df)
 
-def preprocess_features(features_df, scaler=None, fit_scaler=True):
+    def _fill(self, features_df):
+        """Selected columns as a float64 array with NaN/inf replaced"""
+        return self._fill_values(self.feature_values(features_df))
+
+    def _fill_values(self, values):
+        """Replace NaN/inf in a float64 array (training column order) in place"""
+        bad_rows, bad_cols = np.nonzero(~np.isfinite(values))
+        if len(bad_rows):
+            bad = values[bad_rows, bad_cols]
+            values[bad_rows, bad_cols] = np.where(
+                np.isnan(bad), self.nan_fill[bad_cols], self.inf_fill[bad_cols]
+            )
+        return values
+
+    def transform_array(self, features_df):
+        """Preprocess features_df into a float64 array (training column order)"""
+        return self.transform_values(self.feature_values(features_df))
+
+    def transform_values(self, values):
+        """
+        Preprocess a raw float64 array already in training column order
+        (e.g. built from customer records), in place.
+        """
+        values = self._fill_values(values)
+        values -= self.mean
+        values /= self.scale
+        return values
+
+    def transform(self, features_df):
+        """Preprocess features_df into a DataFrame with the training columns"""
+        return pd.DataFrame(
+            self.transform_array(features_df),
+            columns=self.columns,
+            index=features_df.index
+        )
+
+
+def preprocess_features(features_df, scaler=None, fit_scaler=True, columns=None):
     """
     Preprocess features for anomaly detection.
     
     Args:
         features_df: DataFrame with features
-        scaler: Pre-fitted scaler (if None, will create new one)
-        fit_scaler: Whether to fit the scaler (True for training, False for prediction)
+        scaler: Fitted Preprocessor (or a legacy StandardScaler from an older
+            scaler.pkl, which falls back to imputing with batch medians)
+        fit_scaler: Whether to fit (True for training, False for prediction)
+        columns: Columns to fit on instead of the default selection
+            (fit_scaler=True only)
     
     Returns:
         preprocessed_df: Preprocessed features
-        scaler: Fitted scaler
+        scaler: Fitted Preprocessor (or the legacy scaler passed in)
     """
-    # Select features
+    if fit_scaler:
+        preprocessor = Preprocessor()
+        return preprocessor.fit_transform(features_df, columns), preprocessor
+
+    if isinstance(scaler, Preprocessor):
+        return scaler.transform(features_df), scaler
+
+    if scaler is None:
+        raise ValueError("A fitted Preprocessor is required when fit_scaler=False")
+
+    return _preprocess_with_batch_medians(features_df, scaler), scaler
+
+
+def _preprocess_with_batch_medians(features_df, scaler):
+    """Legacy path for a bare StandardScaler: medians come from the batch itself"""
     feature_data = select_features_for_anomaly_detection(features_df)
-    
-    # Handle missing values - fill with median for numeric features
     feature_data = feature_data.fillna(feature_data.median())
-    
-    # Replace inf/-inf with NaN, then fill
     feature_data = feature_data.replace([np.inf, -np.inf], np.nan)
     feature_data = feature_data.fillna(feature_data.median())
-    
-    # Initialize scaler if needed
-    if scaler is None:
-        scaler = StandardScaler()
-    
-    # Fit and transform
-    if fit_scaler:
-        scaled_data = scaler.fit_transform(feature_data)
-    else:
-        scaled_data = scaler.transform(feature_data)
-    
-    # Convert back to DataFrame
-    preprocessed_df = pd.DataFrame(
-        scaled_data,
+    return pd.DataFrame(
+        scaler.transform(feature_data),
         columns=feature_data.columns,
         index=feature_data.index
     )
-    
-    return preprocessed_df, scaler
 
 
 def save_scaler(scaler, path):
-    """Save scaler to disk for reuse"""
+    """Save scaler or Preprocessor to disk for reuse"""
     path = Path(path)
     path.parent.mkdir(parents=True, exist_ok=True)
     with open(path, 'wb') as f:
@@ -93,6 +202,6 @@ def save_scaler(scaler, path):
 
 
 def load_scaler(path):
-    """Load scaler from disk"""
+    """Load scaler or Preprocessor from disk"""
     with open(path, 'rb') as f:
         return pickle.load(f)
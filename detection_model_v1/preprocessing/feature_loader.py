@@ -0,0 +1,177 @@
+"""
+Master Features Loader
+
+Loads master_features with pinned dtypes and column projection so each
+consumer only materializes the columns it needs:
+1. Boolean indicators (*_flag, is_*, has_*, ...) as uint8
+2. Counts, amounts, ratios and other numeric features as float32
+3. customer_id interned to int32 codes (CustomerIndex) when loaded whole;
+   other text columns as category
+"""
+
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from .customer_index import intern_customer_ids
+
+# Explicit column -> dtype entries; these win over the name rules below
+FEATURE_SCHEMA = {
+    'customer_id': 'str',
+}
+
+# Boolean indicators whose names do not follow the flag prefixes/suffixes
+BINARY_FEATURES = {
+    'lifestyle_mismatch',
+    'severe_lifestyle_mismatch',
+    'sudden_inflow_outflow_pattern',
+    'volume_eft_sudden_increase',
+    'single_txn_exceeds_revenue',
+    'high_geographic_dispersion',
+    'high_profile_risk',
+    'high_debit_ratio',
+    'high_amount_variability',
+    'non_business_hours_heavy',
+}
+
+FLAG_PREFIXES = ('is_', 'has_', 'customer_country_')
+FLAG_SUFFIXES = ('_flag',)
+
+# Rows sampled to detect text columns before the pinned read
+SNIFF_ROWS = 1000
+
+
+def feature_dtype(column):
+    """Registry lookup: dtype used to store a master_features column"""
+    if column in FEATURE_SCHEMA:
+        return FEATURE_SCHEMA[column]
+    if column in BINARY_FEATURES or column.startswith(FLAG_PREFIXES) or column.endswith(FLAG_SUFFIXES):
+        return 'uint8'
+    return 'float32'
+
+
+def register_feature_dtype(column, dtype):
+    """Pin the dtype of a column (e.g. a new text or integer feature)"""
+    FEATURE_SCHEMA[column] = dtype
+
+
+def _text_columns(path, columns):
+    """Columns whose values are not numeric, from a small sample"""
+    sample = pd.read_csv(path, usecols=columns, nrows=SNIFF_ROWS)
+    numeric = set(sample.select_dtypes(include=[np.number, 'bool']).columns)
+    return {col for col in sample.columns if col not in numeric and col not in FEATURE_SCHEMA}
+
+
+def _read_dtypes(columns, text_columns):
+    """dtype map for the CSV parser; flags are parsed as float32 and narrowed after"""
+    dtypes = {}
+    for col in columns:
+        if col in text_columns:
+            dtypes[col] = 'category'
+            continue
+        dtype = feature_dtype(col)
+        dtypes[col] = 'float32' if dtype == 'uint8' else dtype
+    return dtypes
+
+
+def _fits_uint8(series):
+    """True if every value is an integer in 0..255 (no NaN)"""
+    values = series.to_numpy()
+    if values.dtype == np.uint8:
+        return True
+    if values.dtype.kind == 'f' and np.isnan(values).any():
+        return False
+    if len(values) == 0:
+        return True
+    return values.min() >= 0 and values.max() <= 255 and bool((values == np.rint(values)).all())
+
+
+def apply_schema(df, text_columns=()):
+    """
+    Cast a frame to the registry dtypes in place of inferred ones.
+
+    uint8 flags are only narrowed when lossless: columns with NaN or
+    values outside the integers 0..255 stay float32.
+    """
+    casts = {}
+    for col in df.columns:
+        if col in text_columns:
+            continue
+        dtype = feature_dtype(col)
+        if dtype == 'uint8' and not _fits_uint8(df[col]):
+            dtype = 'float32'
+        if df[col].dtype != dtype:
+            casts[col] = dtype
+    return df.astype(casts) if casts else df
+
+
+def master_feature_columns(path):
+    """Column names of a master_features file without loading its rows"""
+    from pipeline.artifact_store import read_columns
+    return read_columns(path)
+
+
+def _resolve_columns(path, columns):
+    """Requested columns in file order, plus customer_id; missing ones are skipped"""
+    available = master_feature_columns(path)
+    if columns is None:
+        return available
+    wanted = set(columns) | {'customer_id'}
+    return [col for col in available if col in wanted]
+
+
+def load_master_features(path, columns=None):
+    """
+    Load master_features with registry dtypes.
+
+    Args:
+        path: master_features .csv or .parquet
+        columns: Columns to load (default: all). customer_id is always
+            included; requested columns missing from the file are skipped.
+
+    Returns:
+        DataFrame with the requested columns; customer_id is a Categorical
+        over the frame's CustomerIndex (CustomerIndex.of(df['customer_id']))
+    """
+    path = Path(path)
+    columns = _resolve_columns(path, columns)
+
+    if path.suffix.lower() == '.csv':
+        text_columns = _text_columns(path, columns)
+        df = pd.read_csv(path, usecols=columns, dtype=_read_dtypes(columns, text_columns))
+    else:
+        from pipeline.artifact_store import read_table
+        df = read_table(path, columns)
+        text_columns = set(df.select_dtypes(exclude=[np.number, 'bool']).columns) - set(FEATURE_SCHEMA)
+    df = apply_schema(df, text_columns)
+    intern_customer_ids(df)
+    return df
+
+
+def iter_master_features(path, columns=None, chunksize=100_000):
+    """
+    Yield master_features in fixed-size row blocks with registry dtypes.
+
+    Args:
+        path: master_features .csv or .parquet
+        columns: Columns to load (default: all); customer_id is always included
+        chunksize: Rows per block
+
+    Yields:
+        DataFrame blocks of at most chunksize rows. customer_id stays a
+        string column: per-block dictionaries would not share codes.
+    """
+    path = Path(path)
+    columns = _resolve_columns(path, columns)
+
+    if path.suffix.lower() == '.csv':
+        text_columns = _text_columns(path, columns)
+        reader = pd.read_csv(path, usecols=columns, dtype=_read_dtypes(columns, text_columns),
+                             chunksize=chunksize)
+        for chunk in reader:
+            yield apply_schema(chunk, text_columns)
+    else:
+        from pipeline.artifact_store import iter_table
+        for chunk in iter_table(path, columns, chunksize):
+            text_columns = set(chunk.select_dtypes(exclude=[np.number, 'bool']).columns) - set(FEATURE_SCHEMA)
+            yield apply_schema(chunk, text_columns)
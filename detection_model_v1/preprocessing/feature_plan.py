@@ -0,0 +1,170 @@
+"""
+Feature Plan
+
+The anomaly feature selection (numeric columns minus customer_id and the
+rule-derived risk columns) computed once per input schema and frozen:
+
+    columns     selected column names, in frame order
+    dtypes      their dtypes at selection time
+    positions   their positions in the frame the plan was built on
+    schema_hash digest of that frame's (column, dtype) list
+
+A frame with the same schema hash is sliced by position into one float64
+array (a single pandas block take, no name matching); any other frame is resolved by name once
+per schema (e.g. CSV chunks whose integer columns were inferred
+differently). Plans are memoized by schema hash, stored on the fitted
+Preprocessor and persisted in the model bundle manifest.
+"""
+
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+# Rule-derived columns kept out of the anomaly features to avoid
+# double-counting (substring match, case-insensitive)
+EXCLUDE_PATTERNS = (
+    'structuring_risk', 'channel_risk', 'geographic_risk',
+    'behavioral_risk', 'profile_risk', 'rule_based_score'
+)
+
+# Schemas remembered by FeaturePlan.for_frame
+_PLAN_CACHE_SIZE = 16
+_plan_cache = {}
+
+
+def schema_hash(features_df):
+    """Digest of a frame's column names and dtypes, in order"""
+    # A frame has a handful of distinct dtype objects; name each once
+    names = {}
+    dtype_names = []
+    for dtype in features_df.dtypes.to_numpy():
+        name = names.get(id(dtype))
+        if name is None:
+            name = names[id(dtype)] = dtype.name
+        dtype_names.append(name)
+    digest = hashlib.sha1('\x1f'.join(map(str, features_df.columns.to_numpy())).encode())
+    digest.update('\x1f'.join(dtype_names).encode())
+    return digest.hexdigest()
+
+
+def _is_numeric(dtype):
+    # As select_dtypes(include=[np.number]): booleans are not numbers
+    return pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+
+
+def _is_selected(name):
+    lowered = str(name).lower()
+    return name != 'customer_id' and not any(pattern in lowered for pattern in EXCLUDE_PATTERNS)
+
+
+class FeaturePlan:
+    """
+    Frozen column selection for the anomaly models.
+
+    Args:
+        columns: Selected column names, in order
+        dtypes: Dtype name per column (None if unknown)
+        positions: Position of each column in the source frame (None if unknown)
+        schema_hash: schema_hash() of the source frame (None if unknown)
+    """
+
+    def __init__(self, columns, dtypes=None, positions=None, schema_hash=None):
+        self.columns = tuple(columns)
+        self.dtypes = tuple(dtypes) if dtypes is not None else None
+        self.positions = np.asarray(positions, dtype=np.intp) if positions is not None else None
+        self.schema_hash = schema_hash
+        # Last other schema seen by positions_in(), and its positions
+        self._resolved = (None, None)
+
+    @classmethod
+    def build(cls, features_df, columns=None):
+        """
+        Plan for a frame.
+
+        Args:
+            features_df: Frame to select from
+            columns: Columns to use instead of the default selection
+                (numeric columns without customer_id or rule-derived risk
+                columns)
+        """
+        if columns is None:
+            numeric = features_df.dtypes.map(_is_numeric).to_numpy(dtype=bool)
+            positions = [i for i in np.flatnonzero(numeric) if _is_selected(features_df.columns[i])]
+        else:
+            positions = features_df.columns.get_indexer(list(columns))
+            if (positions < 0).any():
+                missing = [col for col, pos in zip(columns, positions) if pos < 0]
+                raise KeyError(f"Columns not in frame: {missing}")
+        positions = np.asarray(positions, dtype=np.intp)
+        return cls(
+            columns=features_df.columns[positions].tolist(),
+            dtypes=[str(dtype) for dtype in features_df.dtypes.iloc[positions]],
+            positions=positions,
+            schema_hash=schema_hash(features_df),
+        )
+
+    @classmethod
+    def for_frame(cls, features_df):
+        """Default-selection plan for a frame's schema, built once per schema"""
+        key = schema_hash(features_df)
+        plan = _plan_cache.get(key)
+        if plan is None:
+            if len(_plan_cache) >= _PLAN_CACHE_SIZE:
+                _plan_cache.pop(next(iter(_plan_cache)))
+            plan = _plan_cache[key] = cls.build(features_df)
+        return plan
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_resolved'] = (None, None)
+        return state
+
+    def __len__(self):
+        return len(self.columns)
+
+    def positions_in(self, features_df):
+        """
+        Positions of the plan's columns in features_df: the stored ones if
+        the schema matches, else looked up by name (remembered for the
+        last such schema).
+        """
+        key = schema_hash(features_df)
+        if key == self.schema_hash and self.positions is not None:
+            return self.positions
+        if key == self._resolved[0]:
+            return self._resolved[1]
+
+        positions = features_df.columns.get_indexer(list(self.columns))
+        if (positions < 0).any():
+            missing = [col for col, pos in zip(self.columns, positions) if pos < 0]
+            raise KeyError(f"Frame is missing {len(missing)} model feature(s): {missing[:10]}")
+        positions = positions.astype(np.intp)
+        self._resolved = (key, positions)
+        return positions
+
+    def values(self, features_df, dtype=np.float64):
+        """
+        Plan columns of features_df as one contiguous array (NA -> NaN).
+        Column-major when the frame's blocks are: pandas stores columns
+        contiguously, and reordering to rows would cost a second copy.
+
+        The array is always a writable copy, never a view of the frame
+        (pandas returns a read-only view for a single-dtype selection
+        unless asked to copy; mixed dtypes are copied only once either way).
+        """
+        positions = self.positions_in(features_df)
+        return features_df.iloc[:, positions].to_numpy(dtype=dtype, na_value=np.nan, copy=True)
+
+    def to_dict(self):
+        """JSON-serializable form (see from_dict)"""
+        return {
+            'columns': list(self.columns),
+            'dtypes': list(self.dtypes) if self.dtypes is not None else None,
+            'positions': self.positions.tolist() if self.positions is not None else None,
+            'schema_hash': self.schema_hash,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['columns'], data.get('dtypes'), data.get('positions'), data.get('schema_hash'))
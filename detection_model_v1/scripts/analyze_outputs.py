@@ -1,22 +1,32 @@
 """Analyze pipeline outputs and provide insights"""
 
-import pandas as pd
 import numpy as np
 from pathlib import Path
+import sys
 
 BASE_DIR = Path(__file__).parent.parent
-OUTPUT_DIR = BASE_DIR / 'data' / 'output'
-INTERMEDIATE_DIR = BASE_DIR / 'data' / 'intermediate'
+sys.path.append(str(BASE_DIR))
+from pipeline.artifact_store import ArtifactStore
+from preprocessing.customer_index import CustomerIndex, align_codes
+
+store = ArtifactStore(BASE_DIR / 'data')
 
 print("="*70)
 print("PIPELINE OUTPUT ANALYSIS")
 print("="*70)
 
 # Load outputs
-model_output = pd.read_csv(OUTPUT_DIR / 'model_output.csv')
-risk_details = pd.read_csv(INTERMEDIATE_DIR / 'risk_details.csv')
-rule_scores = pd.read_csv(INTERMEDIATE_DIR / 'rule_based_scores.csv')
-anomaly_scores = pd.read_csv(INTERMEDIATE_DIR / 'scores_isolation_forest.csv')
+model_output = store.read('model_output')
+risk_details = store.read('risk_details')
+rule_scores = store.read('rule_based_scores')
+anomaly_scores = store.read('scores_isolation_forest')
+
+# Intern customer IDs once; the other outputs are aligned to model_output by code
+customer_index, output_codes = CustomerIndex.factorize(model_output['customer_id'])
+details_codes = customer_index.encode(risk_details['customer_id'])
+rule_codes = customer_index.encode(rule_scores['customer_id'])
+flagged_rows = np.flatnonzero(model_output['predicted_label'].to_numpy() == 1)
+flagged_codes = output_codes[flagged_rows]
 
 print("\n1. FINAL PREDICTIONS (model_output.csv)")
 print("-" * 70)
@@ -77,11 +87,8 @@ correlation = risk_details['rule_based_score'].corr(risk_details['anomaly_score'
 print(f"\nCorrelation between rule-based and anomaly scores: {correlation:.4f}")
 
 # Flagged customers breakdown
-flagged_details = risk_details.merge(
-    model_output[['customer_id', 'predicted_label']], 
-    on='customer_id'
-)
-flagged_details = flagged_details[flagged_details['predicted_label'] == 1]
+_, flagged_detail_rows = align_codes(flagged_codes, details_codes, len(customer_index))
+flagged_details = risk_details.iloc[flagged_detail_rows]
 
 print(f"\nFlagged customers - Component scores:")
 print(f"  Rule-based (mean): {flagged_details['rule_based_score'].mean():.4f}")
@@ -90,11 +97,8 @@ print(f"  Fused (mean): {flagged_details['risk_score'].mean():.4f}")
 
 print("\n\n3. RULE-BASED CATEGORY BREAKDOWN")
 print("-" * 70)
-flagged_rule = rule_scores.merge(
-    model_output[['customer_id', 'predicted_label']],
-    on='customer_id'
-)
-flagged_rule = flagged_rule[flagged_rule['predicted_label'] == 1]
+_, flagged_rule_rows = align_codes(flagged_codes, rule_codes, len(customer_index))
+flagged_rule = rule_scores.iloc[flagged_rule_rows]
 
 print("Average category scores for FLAGGED customers:")
 print(f"  Structuring Risk: {flagged_rule['structuring_risk'].mean():.4f}")
@@ -112,14 +116,17 @@ print(f"  Profile Risk: {rule_scores['profile_risk'].mean():.4f}")
 
 print("\n\n4. SAMPLE FLAGGED CUSTOMERS")
 print("-" * 70)
-sample_flagged = model_output[model_output['predicted_label'] == 1].head(10)
-for idx, row in sample_flagged.iterrows():
-    customer_id = row['customer_id']
-    risk_score = row['risk_score']
+sample_codes = flagged_codes[:10]
+# Row of each sampled customer in risk_details / rule_based_scores
+_, sample_detail_rows = align_codes(sample_codes, details_codes, len(customer_index))
+_, sample_rule_rows = align_codes(sample_codes, rule_codes, len(customer_index))
+for row, detail_row, rule_row in zip(flagged_rows[:10], sample_detail_rows, sample_rule_rows):
+    customer_id = model_output['customer_id'].iat[row]
+    risk_score = model_output['risk_score'].iat[row]
     
     # Get details
-    details = risk_details[risk_details['customer_id'] == customer_id].iloc[0]
-    rule_breakdown = rule_scores[rule_scores['customer_id'] == customer_id].iloc[0]
+    details = risk_details.iloc[detail_row]
+    rule_breakdown = rule_scores.iloc[rule_row]
     
     print(f"\n{customer_id}:")
     print(f"  Risk Score: {risk_score:.4f} (Rule: {details['rule_based_score']:.4f}, Anomaly: {details['anomaly_score']:.4f})")
@@ -4,15 +4,20 @@ Rule-Based Risk Scorer for AML Detection
 Reads master_features.csv, applies 5-category red-flag rules (DETECTION_MODEL_PLAN),
 outputs rule_based_scores.csv with customer_id, rule_based_score (0-1), and category breakdown.
 
-Input:  clean_data/features/final/master_features.csv (or path via env/arg)
+Input:  clean_data/features/final/master_features.csv (or path via env/arg; .csv or .parquet)
 Output: detection_model_v1/data/intermediate/rule_based_scores.csv
 
 Contract (EXECUTION_PLAN): rule_based_scores.csv has at least customer_id, rule_based_score.
 """
 
 import pandas as pd
-import numpy as np
 from pathlib import Path
+import sys
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from preprocessing.feature_loader import load_master_features
+from models.rule_engine import RuleEngine
 
 # Paths
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -89,61 +94,67 @@ PROFILE_FEATURES = {
 }
 
 
-def calculate_category_score(features_df, feature_config, category_weight):
-    """
-    For each feature: if value meets threshold, add weight.
-    Sum triggered weights, then multiply by category_weight.
-    """
-    category_score = pd.Series(0.0, index=features_df.index, dtype=float)
+RULE_CATEGORIES = [
+    ('structuring_risk', STRUCTURING_FEATURES, 0.25),
+    ('channel_risk', CHANNEL_FEATURES, 0.25),
+    ('geographic_risk', GEOGRAPHIC_FEATURES, 0.20),
+    ('behavioral_risk', BEHAVIORAL_FEATURES, 0.20),
+    ('profile_risk', PROFILE_FEATURES, 0.10),
+]
 
-    for feature_name, config in feature_config.items():
-        if feature_name not in features_df.columns:
-            continue
-        vals = features_df[feature_name].fillna(0)
-        thresh = config['threshold']
-        w = config['weight']
-        cmp = config.get('comparison', 'greater_equal')
-        if cmp == 'less_than':
-            triggered = (vals < thresh).astype(float)
-        else:
-            triggered = (vals >= thresh).astype(float)
-        category_score += triggered * w
+# Only these master_features columns are read by the scorer
+RULE_FEATURE_COLUMNS = [name for _, feature_config, _ in RULE_CATEGORIES for name in feature_config]
 
-    return category_score * category_weight
+# Rule tables compiled once into threshold/direction/weight arrays
+RULE_ENGINE = RuleEngine.compile(RULE_CATEGORIES)
 
 
-def calculate_rule_based_risk(features_df):
+def calculate_rule_based_risk(features_df, engine=None, rule_bits=False):
     """
     Returns (risk_scores, risk_details).
     risk_scores: Series 0-1.
     risk_details: DataFrame with structuring_risk, channel_risk, geographic_risk, behavioral_risk, profile_risk.
+    With rule_bits=True, also returns the engine's packed per-customer bitmask
+    of triggered rules (RuleEngine.pack_rules) as a third value.
+
+    For each rule: if value meets threshold, add its weight to the category;
+    each category sum is multiplied by the category weight. All rules are
+    evaluated at once by the compiled engine (default RULE_ENGINE).
     """
+    engine = engine or RULE_ENGINE
+    scored = engine.score(features_df, rule_bits=rule_bits)
+    rule_based_score, category_scores = scored[:2]
+
     idx = features_df.index
-    risk_scores = pd.Series(0.0, index=idx, dtype=float)
-    risk_details = pd.DataFrame(index=idx)
+    risk_scores = pd.Series(rule_based_score, index=idx, dtype=float)
+    risk_details = pd.DataFrame(category_scores, index=idx, columns=engine.categories)
+    if rule_bits:
+        return risk_scores, risk_details, scored[2]
+    return risk_scores, risk_details
 
-    s = calculate_category_score(features_df, STRUCTURING_FEATURES, 0.25)
-    risk_scores += s
-    risk_details['structuring_risk'] = s.values
 
-    s = calculate_category_score(features_df, CHANNEL_FEATURES, 0.25)
-    risk_scores += s
-    risk_details['channel_risk'] = s.values
+RISK_COLUMNS = ['structuring_risk', 'channel_risk', 'geographic_risk', 'behavioral_risk', 'profile_risk']
 
-    s = calculate_category_score(features_df, GEOGRAPHIC_FEATURES, 0.20)
-    risk_scores += s
-    risk_details['geographic_risk'] = s.values
 
-    s = calculate_category_score(features_df, BEHAVIORAL_FEATURES, 0.20)
-    risk_scores += s
-    risk_details['behavioral_risk'] = s.values
+def score_features(df, rule_bits=False):
+    """
+    Score an in-memory master_features frame.
+    Returns DataFrame with customer_id, rule_based_score and the five category columns;
+    with rule_bits=True, (frame, packed triggered-rule bitmask aligned to its rows).
+    """
+    scored = calculate_rule_based_risk(df, rule_bits=rule_bits)
+    risk_scores, risk_details = scored[:2]
 
-    s = calculate_category_score(features_df, PROFILE_FEATURES, 0.10)
-    risk_scores += s
-    risk_details['profile_risk'] = s.values
+    out = df[['customer_id']].copy()
+    out['rule_based_score'] = risk_scores.values
+    out[RISK_COLUMNS] = risk_details
 
-    risk_scores = risk_scores.clip(0.0, 1.0)
-    return risk_scores, risk_details
+    # Round all float columns to 2 decimal places to avoid floating-point issues downstream
+    float_cols = ['rule_based_score'] + RISK_COLUMNS
+    out[float_cols] = out[float_cols].round(2)
+    if rule_bits:
+        return out, scored[2]
+    return out
 
 
 def main(input_path=None, output_path=None):
@@ -154,19 +165,11 @@ def main(input_path=None, output_path=None):
         raise FileNotFoundError(f"master_features not found: {input_path}")
 
     print("Loading master_features...")
-    df = pd.read_csv(input_path)
+    df = load_master_features(input_path, columns=RULE_FEATURE_COLUMNS)
     print(f"  Rows: {len(df):,}, Columns: {len(df.columns)}")
 
     print("Computing rule-based risk...")
-    risk_scores, risk_details = calculate_rule_based_risk(df)
-
-    out = df[['customer_id']].copy()
-    out['rule_based_score'] = risk_scores.values
-    out[['structuring_risk', 'channel_risk', 'geographic_risk', 'behavioral_risk', 'profile_risk']] = risk_details
-
-    # Round all float columns to 2 decimal places to avoid floating-point issues downstream
-    float_cols = ['rule_based_score', 'structuring_risk', 'channel_risk', 'geographic_risk', 'behavioral_risk', 'profile_risk']
-    out[float_cols] = out[float_cols].round(2)
+    out = score_features(df)
 
     output_path.parent.mkdir(parents=True, exist_ok=True)
     out.to_csv(output_path, index=False)
@@ -10,11 +10,12 @@ This script runs the complete detection model pipeline:
 6. Generate explanations
 7. Validate outputs
 
+Steps 1-6 run as a stage graph (see pipeline/) over one in-memory frame.
+Intermediate artifacts are only written when requested via --materialize.
+
 All inputs and outputs are logged for documentation.
 """
 
-import pandas as pd
-import numpy as np
 from pathlib import Path
 from datetime import datetime
 import sys
@@ -23,6 +24,9 @@ import logging
 # Add parent directory to path for imports
 sys.path.append(str(Path(__file__).parent.parent))
 
+from pipeline import build_pipeline, DEFAULT_ARTIFACTS
+from models.training_set import TrainingSetBuilder
+
 # Setup logging
 LOG_DIR = Path(__file__).parent.parent / 'logs'
 LOG_DIR.mkdir(exist_ok=True)
@@ -41,109 +45,88 @@ logger = logging.getLogger(__name__)
 
 def main():
     """Main pipeline execution"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run the v1 detection pipeline')
+    parser.add_argument('--input', default=None,
+                        help='Path to master_features.csv (default: clean_data/features/final/master_features.csv)')
+    parser.add_argument('--materialize', nargs='+', default=None,
+                        help=f'Artifacts to write (default: {" ".join(DEFAULT_ARTIFACTS)})')
+    parser.add_argument('--format', choices=['parquet', 'csv'], default='parquet',
+                        help='Storage format for artifacts (default: parquet; model_output is always exported as CSV)')
+    parser.add_argument('--all-artifacts', action='store_true',
+                        help='Write every artifact, including the input copy and preprocessed features')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Update the saved Isolation Forest (replace its oldest trees) instead of retraining it')
+    parser.add_argument('--tree-budget', type=int, default=None,
+                        help='Trees replaced per incremental run (default: 25)')
+    parser.add_argument('--train-rows', type=int, default=None,
+                        help='Sample this many customers to train the Isolation Forest on (default: all)')
+    parser.add_argument('--sampling', choices=['reservoir', 'stratified'], default='reservoir',
+                        help='Row sampling for --train-rows (default: reservoir)')
+    parser.add_argument('--strata', default=None,
+                        help='Column to stratify on with --sampling stratified')
+    parser.add_argument('--min-std', type=float, default=None,
+                        help='Drop features with robust spread (std / IQR) at or below this, e.g. 0.1')
+    parser.add_argument('--max-correlation', type=float, default=None,
+                        help='Drop features correlated above this with an earlier kept feature, e.g. 0.95')
+    parser.add_argument('--max-features', type=int, default=None,
+                        help='Keep at most this many features (widest spread first)')
+    args = parser.parse_args()
+
     logger.info("="*70)
     logger.info("AML Detection Model Pipeline - Version 1")
     logger.info("="*70)
     
     # Define paths
     BASE_DIR = Path(__file__).parent.parent
-    INPUT_DIR = BASE_DIR / 'data' / 'input'
-    INTERMEDIATE_DIR = BASE_DIR / 'data' / 'intermediate'
     OUTPUT_DIR = BASE_DIR / 'data' / 'output'
     
-    # Create directories
-    for dir_path in [INPUT_DIR, INTERMEDIATE_DIR, OUTPUT_DIR]:
-        dir_path.mkdir(parents=True, exist_ok=True)
-    
     try:
-        # Step 1: Load input data
+        # Step 1: Locate input data
         logger.info("\n[STEP 1] Loading input data...")
-        input_file = BASE_DIR.parent / 'clean_data' / 'features' / 'final' / 'master_features.csv'
+        input_file = Path(args.input) if args.input else (
+            BASE_DIR.parent / 'clean_data' / 'features' / 'final' / 'master_features.csv'
+        )
         
         if not input_file.exists():
             logger.error(f"Input file not found: {input_file}")
             return
         
-        logger.info(f"Loading from: {input_file}")
-        features_df = pd.read_csv(input_file)
-        logger.info(f"Loaded {len(features_df):,} customers with {len(features_df.columns)} features")
-        
-        # Log input summary
-        logger.info(f"Input summary:")
-        logger.info(f"  - Customer IDs: {features_df['customer_id'].nunique():,}")
         logger.info(f"  - Date loaded: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         
-        # Save copy of input for documentation
-        input_copy = INPUT_DIR / 'master_features.csv'
-        features_df.to_csv(input_copy, index=False)
-        logger.info(f"Input saved to: {input_copy}")
-        
-        # Step 2: Preprocess features (for anomaly detection)
-        logger.info("\n[STEP 2] Preprocessing features for anomaly detection...")
-        from preprocessing.data_preprocessor import preprocess_features
-        preprocessed_df, scaler = preprocess_features(features_df, fit_scaler=True)
-        preprocessed_df.to_csv(INTERMEDIATE_DIR / 'preprocessed_features.csv', index=False)
-        logger.info(f"Preprocessed {len(preprocessed_df.columns)} features")
-        logger.info("Preprocessing complete")
-        
-        # Step 3: Rule-based scoring
-        logger.info("\n[STEP 3] Calculating rule-based risk scores...")
-        from scripts.rule_based_scorer import main as run_rule_based_scorer
-        rule_scores_path = INTERMEDIATE_DIR / 'rule_based_scores.csv'
-        rule_scores_df = run_rule_based_scorer(
-            input_path=input_file,
-            output_path=rule_scores_path
-        )
-        logger.info(f"Rule-based scoring complete: {len(rule_scores_df):,} customers scored")
-        logger.info(f"  Score range: {rule_scores_df['rule_based_score'].min():.3f} .. {rule_scores_df['rule_based_score'].max():.3f}")
-        
-        # Step 4: Anomaly detection
-        logger.info("\n[STEP 4] Training Isolation Forest...")
-        from models.anomaly_detector import train_isolation_forest, predict_anomaly_scores, save_model
-        MODEL_DIR = BASE_DIR / 'models' / 'saved'
-        MODEL_DIR.mkdir(parents=True, exist_ok=True)
-        
-        detector, scaler, _ = train_isolation_forest(features_df, contamination=0.05)
-        logger.info("Isolation Forest trained")
-        
-        anomaly_scores_df = predict_anomaly_scores(detector, scaler, features_df)
-        anomaly_scores_path = INTERMEDIATE_DIR / 'scores_isolation_forest.csv'
-        anomaly_scores_df.to_csv(anomaly_scores_path, index=False)
-        logger.info(f"Anomaly detection complete: {len(anomaly_scores_df):,} customers scored")
-        logger.info(f"  Score range: {anomaly_scores_df['score'].min():.4f} .. {anomaly_scores_df['score'].max():.4f}")
-        
-        # Save model for future use
-        save_model(detector, scaler, MODEL_DIR)
-        logger.info(f"Model saved to: {MODEL_DIR}")
-        
-        # Step 5: Risk score fusion
-        logger.info("\n[STEP 5] Fusing risk scores...")
-        from models.risk_fusion import fuse_risk_scores, generate_predictions
-        fused_df = fuse_risk_scores(rule_scores_df, anomaly_scores_df, rule_weight=0.7, anomaly_weight=0.3)
-        fused_df.to_csv(INTERMEDIATE_DIR / 'risk_details.csv', index=False)
-        logger.info(f"Risk score fusion complete: {len(fused_df):,} customers")
-        logger.info(f"  Fused score range: {fused_df['risk_score'].min():.4f} .. {fused_df['risk_score'].max():.4f}")
-        
-        # Step 6: Generate predictions
-        logger.info("\n[STEP 6] Generating predictions...")
-        predictions_df, threshold = generate_predictions(fused_df, threshold=None, top_percentile=5)
-        predictions_df.to_csv(OUTPUT_DIR / 'model_output.csv', index=False)
-        flagged_count = predictions_df['predicted_label'].sum()
-        logger.info(f"Prediction generation complete")
-        logger.info(f"  Threshold: {threshold:.4f}")
-        logger.info(f"  Flagged: {flagged_count:,} customers ({100*flagged_count/len(predictions_df):.2f}%)")
+        # Steps 2-6: load, preprocess, rule score, anomaly score, fuse, predict.
+        # Stages share one in-memory frame; only requested artifacts hit disk.
+        training_set = None
+        if any(value is not None for value in (args.train_rows, args.min_std, args.max_correlation, args.max_features)):
+            training_set = TrainingSetBuilder(
+                n_samples=args.train_rows, sampling=args.sampling, strata=args.strata, min_std=args.min_std,
+                max_correlation=args.max_correlation, max_features=args.max_features
+            )
+        graph = build_pipeline(BASE_DIR, rule_weight=0.7, anomaly_weight=0.3, top_percentile=5, fmt=args.format,
+                               incremental=args.incremental, tree_budget=args.tree_budget,
+                               training_set=training_set)
+        if args.all_artifacts:
+            materialize = list(graph.artifacts)
+        else:
+            materialize = args.materialize if args.materialize is not None else DEFAULT_ARTIFACTS
+        logger.info(f"Artifacts to write: {', '.join(materialize) if materialize else '(none)'}")
+
+        context = graph.run({'input_path': input_file}, targets=['predictions', 'explanations'],
+                            materialize=materialize)
+        predictions_df = context['predictions']
+        logger.info(f"Prediction generation complete: {len(predictions_df):,} customers")
         
-        # Step 7: Generate explanations
+        # Step 7: Explanations (explain stage): flagged customers only, from
+        # the triggered-rule bitmask, category scores and red-flag text
         logger.info("\n[STEP 7] Generating explanations...")
-        # TODO: Implement explanation generation
-        # explanations = generate_explanations(features_df, final_scores, predictions)
-        # explanations.to_csv(OUTPUT_DIR / 'model_output_explanations.csv', index=False)
-        logger.info("Explanation generation complete (placeholder)")
+        explanations_df = context['explanations']
+        logger.info(f"Explanation generation complete: {len(explanations_df):,} flagged customers")
         
         # Step 8: Validate outputs
         logger.info("\n[STEP 8] Validating outputs...")
         # TODO: Implement validation
-        # validate_outputs(predictions, explanations, features_df)
+        # validate_outputs(predictions_df, explanations_df, features_df)
         logger.info("Validation complete (placeholder)")
         
         # Summary
@@ -0,0 +1,62 @@
+"""
+Chunked Portfolio Scoring
+
+Scores master_features block by block with the model saved by run_pipeline.py
+(models/saved), for portfolios that do not fit in memory. Writes
+rule_based_scores, scores_isolation_forest, risk_details and model_output
+incrementally under data/.
+"""
+
+from pathlib import Path
+import sys
+import logging
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from pipeline.chunked import score_chunked
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def main():
+    import argparse
+
+    BASE_DIR = Path(__file__).parent.parent
+
+    parser = argparse.ArgumentParser(description='Score master_features in fixed-size row blocks')
+    parser.add_argument('--input', default=None,
+                        help='Path to master_features (default: clean_data/features/final/master_features.csv)')
+    parser.add_argument('--model-dir', default=None,
+                        help='Directory with the fitted model (default: models/saved)')
+    parser.add_argument('--chunksize', type=int, default=100_000,
+                        help='Rows per block (default: 100000)')
+    parser.add_argument('--rule-weight', type=float, default=0.7,
+                        help='Weight for rule-based score (default: 0.7)')
+    parser.add_argument('--anomaly-weight', type=float, default=0.3,
+                        help='Weight for anomaly score (default: 0.3)')
+    parser.add_argument('--top-percentile', type=float, default=5,
+                        help='Top N%% to flag (default: 5)')
+    parser.add_argument('--format', choices=['parquet', 'csv'], default='parquet',
+                        help='Storage format for artifacts (default: parquet)')
+    args = parser.parse_args()
+
+    input_path = Path(args.input) if args.input else (
+        BASE_DIR.parent / 'clean_data' / 'features' / 'final' / 'master_features.csv'
+    )
+    model_dir = Path(args.model_dir) if args.model_dir else (BASE_DIR / 'models' / 'saved')
+
+    if not input_path.exists():
+        raise FileNotFoundError(f"Input file not found: {input_path}")
+
+    return score_chunked(
+        input_path, model_dir, BASE_DIR / 'data',
+        chunksize=args.chunksize,
+        rule_weight=args.rule_weight,
+        anomaly_weight=args.anomaly_weight,
+        top_percentile=args.top_percentile,
+        fmt=args.format,
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,9 @@ Test Fusion with Different Unsupervised Models
 
 This script allows you to easily test your rule-based algorithm with different
 unsupervised models (Isolation Forest, LOF, CBLOF, ABOD) and compare results.
+
+--sweep evaluates a whole grid of weights and percentiles for one model,
+loading and aligning the scores once.
 """
 
 import pandas as pd
@@ -11,12 +14,17 @@ from pathlib import Path
 import sys
 
 sys.path.append(str(Path(__file__).parent.parent))
-from models.risk_fusion import fuse_risk_scores, generate_predictions
+from models.risk_fusion import fuse_score_matrix, generate_predictions, sweep_fusion
+from models.score_matrix import ScoreMatrix
+from pipeline.artifact_store import ArtifactStore
 
 BASE_DIR = Path(__file__).parent.parent
 INTERMEDIATE_DIR = BASE_DIR / 'data' / 'intermediate'
 OUTPUT_DIR = BASE_DIR / 'data' / 'output'
 
+# Score files may be Parquet (pipeline runs) or CSV (partner models)
+store = ArtifactStore(BASE_DIR / 'data')
+
 # Available unsupervised models
 AVAILABLE_MODELS = {
     'isolation_forest': 'scores_isolation_forest.csv',
@@ -26,7 +34,26 @@ AVAILABLE_MODELS = {
 }
 
 
-def test_fusion(model_name, rule_weight=0.7, anomaly_weight=0.3, top_percentile=5, output_suffix=None):
+def load_score_matrix(model_names=None):
+    """
+    Load rule-based scores and every available model's scores once, aligned
+    by customer in a ScoreMatrix (column 'rule_based_score' plus one per model).
+    """
+    model_names = list(AVAILABLE_MODELS) if model_names is None else model_names
+    matrix = ScoreMatrix()
+    rule_scores_df = store.read('rule_based_scores', columns=['customer_id', 'rule_based_score'])
+    matrix.add('rule_based_score', rule_scores_df['customer_id'], rule_scores_df['rule_based_score'].to_numpy())
+    
+    for model_name in model_names:
+        score_name = Path(AVAILABLE_MODELS[model_name]).stem
+        if store.find(score_name) is None:
+            continue
+        scores_df = store.read(score_name, columns=['customer_id', 'score'])
+        matrix.add(model_name, scores_df['customer_id'], scores_df['score'].to_numpy())
+    return matrix
+
+
+def test_fusion(model_name, rule_weight=0.7, anomaly_weight=0.3, top_percentile=5, output_suffix=None, matrix=None):
     """
     Test fusion with a specific unsupervised model.
     
@@ -36,6 +63,7 @@ def test_fusion(model_name, rule_weight=0.7, anomaly_weight=0.3, top_percentile=
         anomaly_weight: Weight for anomaly score (default 0.3)
         top_percentile: Top N% to flag (default 5)
         output_suffix: Suffix for output filename (if None, uses model_name)
+        matrix: ScoreMatrix from load_score_matrix() (loaded if None)
     
     Returns:
         predictions_df: DataFrame with predictions
@@ -45,9 +73,11 @@ def test_fusion(model_name, rule_weight=0.7, anomaly_weight=0.3, top_percentile=
         raise ValueError(f"Unknown model: {model_name}. Available: {list(AVAILABLE_MODELS.keys())}")
     
     score_file = AVAILABLE_MODELS[model_name]
-    score_path = INTERMEDIATE_DIR / score_file
+    if matrix is None:
+        print("Loading scores...")
+        matrix = load_score_matrix([model_name])
     
-    if not score_path.exists():
+    if model_name not in matrix.models:
         print(f"⚠️  Warning: {score_file} not found. Skipping {model_name}.")
         return None, None
     
@@ -55,17 +85,12 @@ def test_fusion(model_name, rule_weight=0.7, anomaly_weight=0.3, top_percentile=
     print(f"Testing Fusion: Rule-Based + {model_name.upper().replace('_', ' ')}")
     print(f"{'='*70}")
     
-    # Load scores
-    print("Loading scores...")
-    rule_scores_df = pd.read_csv(INTERMEDIATE_DIR / 'rule_based_scores.csv')
-    anomaly_scores_df = pd.read_csv(score_path)
-    
-    print(f"  Rule-based: {len(rule_scores_df):,} customers")
-    print(f"  {model_name}: {len(anomaly_scores_df):,} customers")
+    print(f"  Rule-based: {len(matrix.complete_rows(['rule_based_score'])):,} customers")
+    print(f"  {model_name}: {len(matrix.complete_rows([model_name])):,} customers")
     
     # Fuse scores
     print(f"\nFusing scores (Rule: {rule_weight:.1%}, {model_name}: {anomaly_weight:.1%})...")
-    fused_df = fuse_risk_scores(rule_scores_df, anomaly_scores_df, rule_weight, anomaly_weight)
+    fused_df = fuse_score_matrix(matrix, model_name, rule_weight, anomaly_weight)
     
     print(f"  Fused: {len(fused_df):,} customers")
     print(f"  Risk score range: {fused_df['risk_score'].min():.4f} .. {fused_df['risk_score'].max():.4f}")
@@ -90,7 +115,8 @@ def test_fusion(model_name, rule_weight=0.7, anomaly_weight=0.3, top_percentile=
         'mean_risk_score': fused_df['risk_score'].mean(),
         'mean_rule_score': fused_df['rule_based_score'].mean(),
         'mean_anomaly_score': fused_df['anomaly_score'].mean(),
-        'correlation': rule_scores_df['rule_based_score'].corr(anomaly_scores_df['score'])
+        # Over customers both models scored
+        'correlation': fused_df['rule_based_score'].corr(fused_df['anomaly_score'])
     }
     
     # Save output
@@ -112,10 +138,14 @@ def compare_all_models(rule_weight=0.7, anomaly_weight=0.3, top_percentile=5):
     print("COMPARING ALL MODEL COMBINATIONS")
     print("="*70)
     
+    # Every score file is read and aligned once, then fused from the matrix
+    print("Loading scores...")
+    matrix = load_score_matrix()
+    
     results = []
     
     for model_name in AVAILABLE_MODELS.keys():
-        predictions, stats = test_fusion(model_name, rule_weight, anomaly_weight, top_percentile)
+        predictions, stats = test_fusion(model_name, rule_weight, anomaly_weight, top_percentile, matrix=matrix)
         if stats:
             results.append(stats)
     
@@ -140,6 +170,50 @@ def compare_all_models(rule_weight=0.7, anomaly_weight=0.3, top_percentile=5):
     return comparison_df
 
 
+def sweep_model(model_name, rule_weights=None, top_percentiles=(1, 2, 5, 10), baseline=(0.7, 5)):
+    """
+    Sweep fusion weights and flag percentiles for one model.
+    
+    Args:
+        model_name: Name of the model ('isolation_forest', 'lof', 'cblof', 'abod')
+        rule_weights: Rule weights to try (default 0.00, 0.05, ..., 1.00);
+            anomaly weight = 1 - rule weight
+        top_percentiles: Top N% values to try
+        baseline: (rule_weight, top_percentile) to measure overlaps against
+    
+    Returns:
+        sweep_df: One row per grid point (see models.risk_fusion.sweep_fusion)
+    """
+    if model_name not in AVAILABLE_MODELS:
+        raise ValueError(f"Unknown model: {model_name}. Available: {list(AVAILABLE_MODELS.keys())}")
+    if rule_weights is None:
+        rule_weights = np.round(np.arange(0, 21) * 0.05, 2)
+    
+    # Load and align once for the whole grid
+    print("Loading scores...")
+    matrix = load_score_matrix([model_name])
+    if model_name not in matrix.models:
+        print(f"⚠️  Warning: {AVAILABLE_MODELS[model_name]} not found. Skipping {model_name}.")
+        return None
+    rows = matrix.complete_rows(['rule_based_score', model_name])
+    print(f"  Aligned: {len(rows):,} customers")
+    
+    n_points = len(rule_weights) * len(top_percentiles)
+    print(f"\nSweeping {len(rule_weights)} weights x {len(top_percentiles)} percentiles ({n_points} points)...")
+    sweep_df = sweep_fusion(matrix.column('rule_based_score')[rows], matrix.column(model_name)[rows],
+                            rule_weights, top_percentiles, baseline)
+    sweep_df.insert(0, 'model', model_name)
+    
+    print("\n" + sweep_df.to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+    
+    output_path = OUTPUT_DIR / f'fusion_sweep_{model_name}.csv'
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    sweep_df.to_csv(output_path, index=False)
+    print(f"\n✅ Sweep saved: {output_path}")
+    
+    return sweep_df
+
+
 def main():
     """Main function - test all available models"""
     import argparse
@@ -153,10 +227,19 @@ def main():
                        help='Weight for anomaly score (default: 0.3)')
     parser.add_argument('--top-percentile', type=int, default=5,
                        help='Top N%% to flag (default: 5)')
+    parser.add_argument('--sweep', action='store_true',
+                       help='Sweep a grid of weights and percentiles (default model: isolation_forest)')
+    parser.add_argument('--sweep-weights', type=float, nargs='+',
+                       help='Rule weights to sweep (default: 0.00 to 1.00 in steps of 0.05)')
+    parser.add_argument('--sweep-percentiles', type=float, nargs='+', default=[1, 2, 5, 10],
+                       help='Top N%% values to sweep (default: 1 2 5 10)')
     
     args = parser.parse_args()
     
-    if args.model:
+    if args.sweep:
+        sweep_model(args.model or 'isolation_forest', args.sweep_weights, args.sweep_percentiles,
+                    baseline=(args.rule_weight, args.top_percentile))
+    elif args.model:
         # Test single model
         test_fusion(args.model, args.rule_weight, args.anomaly_weight, args.top_percentile)
     else:
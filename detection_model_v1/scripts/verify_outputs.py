@@ -2,10 +2,14 @@
 
 import pandas as pd
 from pathlib import Path
+import sys
 
 BASE_DIR = Path(__file__).parent.parent
 OUTPUT_DIR = BASE_DIR / 'data' / 'output'
-INTERMEDIATE_DIR = BASE_DIR / 'data' / 'intermediate'
+sys.path.append(str(BASE_DIR))
+from pipeline.artifact_store import ArtifactStore, read_table
+
+store = ArtifactStore(BASE_DIR / 'data')
 
 print("="*70)
 print("Pipeline Output Verification")
@@ -39,15 +43,16 @@ print("\n\n2. Intermediate Files:")
 print("-" * 70)
 
 files_to_check = [
-    ('rule_based_scores.csv', ['customer_id', 'rule_based_score']),
-    ('scores_isolation_forest.csv', ['customer_id', 'score']),
-    ('risk_details.csv', ['customer_id', 'risk_score']),
+    ('rule_based_scores', ['customer_id', 'rule_based_score']),
+    ('scores_isolation_forest', ['customer_id', 'score']),
+    ('risk_details', ['customer_id', 'risk_score']),
 ]
 
-for filename, expected_cols in files_to_check:
-    filepath = INTERMEDIATE_DIR / filename
-    if filepath.exists():
-        df = pd.read_csv(filepath)
+for name, expected_cols in files_to_check:
+    filepath = store.find(name)
+    filename = filepath.name if filepath else name
+    if filepath is not None:
+        df = read_table(filepath)
         print(f"   [OK] {filename}: {len(df):,} rows")
         missing_cols = [col for col in expected_cols if col not in df.columns]
         if missing_cols:
@@ -0,0 +1,13 @@
+"""Shared utilities"""
+
+from .versioned_dir import (
+    CURRENT_FILE,
+    current_version,
+    publish_version
+)
+
+__all__ = [
+    'CURRENT_FILE',
+    'current_version',
+    'publish_version'
+]
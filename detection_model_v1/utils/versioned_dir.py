@@ -0,0 +1,107 @@
+"""
+Versioned Directories
+
+Atomic replacement of a directory of files that readers may hold open or
+memory-mapped (model bundles, aggregate stores):
+
+    root/
+        CURRENT                name of the live version ('v000003')
+        v000002/               previous version (kept for readers that
+                               resolved it just before the swap)
+        v000003/               live version
+
+A new version is written under a temporary name, renamed to its version
+name once complete and then published by replacing CURRENT (os.replace,
+atomic on POSIX). Published version directories are never written again,
+so a reader sees either the old or the new version in full; files of a
+pruned version stay readable by processes that already opened or mapped
+them.
+
+A root without CURRENT is read as a single flat version (the layout of
+stores and bundles written before versioning).
+"""
+
+from contextlib import contextmanager
+import os
+from pathlib import Path
+import re
+import shutil
+
+CURRENT_FILE = 'CURRENT'
+
+# Published versions kept per root (the live one included)
+KEEP_VERSIONS = 2
+
+_VERSION_NAME = re.compile(r'^v(\d{6})$')
+
+
+def _version_numbers(root):
+    """Numbers of the published version directories under root, ascending"""
+    if not root.is_dir():
+        return []
+    numbers = []
+    for entry in root.iterdir():
+        match = _VERSION_NAME.match(entry.name)
+        if match and entry.is_dir():
+            numbers.append(int(match.group(1)))
+    return sorted(numbers)
+
+
+def current_version(root):
+    """
+    Directory of the live version of root.
+
+    Returns:
+        root/<CURRENT> when root is versioned, otherwise root itself
+    """
+    root = Path(root)
+    pointer = root / CURRENT_FILE
+    if not pointer.exists():
+        return root
+    name = pointer.read_text().strip()
+    if not _VERSION_NAME.match(name):
+        raise ValueError(f"Invalid version pointer {name!r}: {pointer}")
+    return root / name
+
+
+@contextmanager
+def publish_version(root, keep=KEEP_VERSIONS):
+    """
+    Write a new version of root.
+
+    Yields an empty temporary directory; when the block exits without an
+    exception the directory becomes the next version and CURRENT is
+    switched to it, then all but the newest keep versions are removed.
+    On an exception the temporary directory is deleted and CURRENT is
+    left unchanged.
+
+    Args:
+        root: Versioned directory (created if missing)
+        keep: Published versions to keep (at least 1)
+
+    Example:
+        with publish_version(bundle_root) as version_dir:
+            np.save(version_dir / 'weights.npy', weights)
+    """
+    if keep < 1:
+        raise ValueError(f"keep must be at least 1, got {keep}")
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    numbers = _version_numbers(root)
+    name = f"v{(numbers[-1] + 1 if numbers else 1):06d}"
+    staging = root / f"{name}.tmp-{os.getpid()}"
+    staging.mkdir()
+    try:
+        yield staging
+        # Fails rather than merging if another writer published this number first
+        os.rename(staging, root / name)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    pointer_tmp = root / f"{CURRENT_FILE}.tmp-{os.getpid()}"
+    pointer_tmp.write_text(name + '\n')
+    os.replace(pointer_tmp, root / CURRENT_FILE)
+
+    for number in _version_numbers(root)[:-keep]:
+        shutil.rmtree(root / f"v{number:06d}", ignore_errors=True)